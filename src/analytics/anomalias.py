@@ -0,0 +1,370 @@
+"""
+Detección temprana de incidencias en tiempo real.
+
+Para cada (línea, parada, hora de la semana) se mantiene una media y una
+desviación absoluta media exponenciales (EWMA) del retraso. Cada nueva
+observación se puntúa con un z-score robusto antes de actualizar el estado:
+
+    z = (retraso - media) / (1.2533 * desviacion_abs)
+
+(1.2533 = sqrt(pi/2) convierte la desviación absoluta media en una
+desviación típica para datos normales). Si |z| supera el umbral y la clave
+tiene historia suficiente, la parada se marca como anómala; si en un mismo
+ciclo lo están suficientes paradas de una línea, se emite también una
+alerta de línea.
+
+Cada observación actualiza su clave en O(1). Un lote se procesa por
+rondas: en cada ronda entra como mucho una observación de cada clave, de
+modo que las actualizaciones de la ronda son operaciones vectorizadas sin
+conflictos y se respeta el orden de llegada dentro de cada clave.
+
+El estado se guarda en un .npz para arrancar en caliente. Sin estado
+guardado, las líneas base se siembran con los DIAS_SEMILLA días anteriores
+de gtfs_clean_scheduled, para no arrancar con todas las claves en frío.
+
+Uso (benchmark de reproducción sobre datos históricos, sembrado con las
+cuatro semanas anteriores a --start):
+    uv run python -m src.analytics.anomalias --start 2025-12-01 --end 2025-12-07 --dias_semilla 28
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from src.common.ficheros import escribir_atomico
+from src.common.minio_client import download_df_parquet
+from src.gtfs_historico.transform import build_cleaned_scheduled_object, iterate_dates
+
+
+ALPHA = 0.05
+UMBRAL_Z = 4.0
+MIN_OBSERVACIONES = 20
+
+# Escala inicial (segundos) de una clave sin historia: pesa como una
+# observación más, así que la primera observación no la fija por sí sola
+ESCALA_INICIAL = 60.0
+
+# Escala mínima (segundos): con retrasos constantes la desviación tiende a 0
+# y cualquier diferencia daría un z-score infinito
+ESCALA_MINIMA = 10.0
+
+# Una observación atípica sólo mueve la media como si estuviera a este número
+# de desviaciones, para que una incidencia no contamine la línea base
+LIMITE_ACTUALIZACION = 3.0
+
+# Fracción mínima de paradas anómalas de una línea en un ciclo para alertar la línea
+FRACCION_ALERTA_LINEA = 0.2
+MIN_PARADAS_ALERTA_LINEA = 3
+
+FACTOR_ESCALA = np.sqrt(np.pi / 2)
+
+# Días de histórico con los que se siembra un detector sin estado guardado
+DIAS_SEMILLA = 28
+
+COLUMNAS_HISTORICO = ["route_id", "stop_id", "dow", "hour", "delay_seconds"]
+
+
+def claves_detector(linea_id, parada_id, hora_semana) -> np.ndarray:
+    """Hash de 64 bits de (línea, parada, hora de la semana)"""
+    return pd.util.hash_pandas_object(
+        pd.DataFrame({
+            "linea_id": np.asarray(linea_id, dtype=object),
+            "parada_id": np.asarray(parada_id, dtype=object),
+            "hora_semana": np.asarray(hora_semana, dtype=np.int64),
+        }),
+        index=False,
+    ).to_numpy()
+
+
+class DetectorAnomalias:
+    """
+    Estado del detector: un pd.Index de claves y arrays alineados con la
+    media, la desviación absoluta media y el número de observaciones de cada
+    clave.
+    """
+
+    def __init__(self, alpha: float = ALPHA, umbral: float = UMBRAL_Z, min_observaciones: int = MIN_OBSERVACIONES):
+        self.alpha = alpha
+        self.umbral = umbral
+        self.min_observaciones = min_observaciones
+        self.claves = pd.Index(np.empty(0, dtype=np.uint64))
+        self.media = np.empty(0)
+        self.desviacion = np.empty(0)
+        self.n = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.claves)
+
+    # Estado
+
+    def _posiciones(self, claves: np.ndarray) -> np.ndarray:
+        """Posición de cada clave en el estado, dando de alta las nuevas"""
+        posiciones = self.claves.get_indexer(claves)
+        nuevas = pd.unique(claves[posiciones < 0])
+        if len(nuevas):
+            self.claves = self.claves.append(pd.Index(nuevas))
+            self.media = np.concatenate([self.media, np.zeros(len(nuevas))])
+            self.desviacion = np.concatenate([self.desviacion, np.full(len(nuevas), ESCALA_INICIAL)])
+            self.n = np.concatenate([self.n, np.zeros(len(nuevas), dtype=np.int64)])
+            posiciones = self.claves.get_indexer(claves)
+        return posiciones
+
+    def sembrar(self, claves: np.ndarray, media: np.ndarray, desviacion: np.ndarray, n: np.ndarray) -> None:
+        """Fija las líneas base de las claves dadas (p. ej. desde el histórico)"""
+        posiciones = self._posiciones(np.asarray(claves, dtype=np.uint64))
+        self.media[posiciones] = media
+        self.desviacion[posiciones] = np.maximum(desviacion, ESCALA_MINIMA)
+        self.n[posiciones] = n
+
+    def guardar(self, ruta) -> None:
+        """Guarda el estado en un .npz (escritura atómica)"""
+        escribir_atomico(ruta, lambda tmp: np.savez_compressed(
+            tmp,
+            claves=self.claves.to_numpy(dtype=np.uint64),
+            media=self.media,
+            desviacion=self.desviacion,
+            n=self.n,
+            parametros=np.array([self.alpha, self.umbral, self.min_observaciones]),
+        ), sufijo=".npz")
+
+    @classmethod
+    def cargar(cls, ruta) -> "DetectorAnomalias":
+        with np.load(ruta) as datos:
+            alpha, umbral, min_observaciones = datos["parametros"]
+            detector = cls(float(alpha), float(umbral), int(min_observaciones))
+            detector.claves = pd.Index(datos["claves"])
+            detector.media = datos["media"]
+            detector.desviacion = datos["desviacion"]
+            detector.n = datos["n"]
+        return detector
+
+    # Actualización
+
+    def actualizar(self, linea_id, parada_id, hora_semana, retraso) -> pd.DataFrame:
+        """
+        Puntúa y aprende un lote de observaciones (arrays alineados, en orden
+        de llegada). Devuelve un DataFrame con el z-score de cada observación
+        y si es anómala.
+        """
+        retraso = np.asarray(retraso, dtype="float64")
+        claves = claves_detector(linea_id, parada_id, hora_semana)
+        posiciones = self._posiciones(claves)
+
+        z = np.zeros(len(retraso))
+        anomala = np.zeros(len(retraso), dtype=bool)
+
+        # Ronda de cada observación = cuántas de su misma clave la preceden en el lote
+        ronda = pd.Series(claves).groupby(claves, sort=False).cumcount().to_numpy()
+        for r in range(int(ronda.max()) + 1 if len(ronda) else 0):
+            filas = np.flatnonzero(ronda == r)
+            p = posiciones[filas]
+            x = retraso[filas]
+
+            escala = FACTOR_ESCALA * np.maximum(self.desviacion[p], ESCALA_MINIMA)
+            diferencia = x - self.media[p]
+            z[filas] = diferencia / escala
+            anomala[filas] = (self.n[p] >= self.min_observaciones) & (np.abs(z[filas]) > self.umbral)
+
+            # Las primeras observaciones de una clave nueva fijan la media
+            # directamente; la desviación parte de ESCALA_INICIAL como si fuera
+            # una observación previa
+            tasa = np.maximum(self.alpha, 1.0 / (self.n[p] + 1))
+            tasa_desviacion = np.maximum(self.alpha, 1.0 / (self.n[p] + 2))
+            acotada = np.clip(diferencia, -LIMITE_ACTUALIZACION * escala, LIMITE_ACTUALIZACION * escala)
+            self.media[p] += tasa * acotada
+            self.desviacion[p] += tasa_desviacion * (np.abs(acotada) - self.desviacion[p])
+            self.n[p] += 1
+
+        return pd.DataFrame({
+            "linea_id": np.asarray(linea_id, dtype=object),
+            "parada_id": np.asarray(parada_id, dtype=object),
+            "hora_semana": np.asarray(hora_semana, dtype=np.int64),
+            "delay": retraso,
+            "z_score": z,
+            "anomalia": anomala,
+        })
+
+
+def alertas_ciclo(puntuaciones: pd.DataFrame) -> pd.DataFrame:
+    """
+    Alertas de un ciclo: una por parada anómala y una por línea con al menos
+    FRACCION_ALERTA_LINEA de sus paradas observadas en anomalía.
+    """
+    paradas = (
+        puntuaciones[puntuaciones["anomalia"]]
+        .groupby(["linea_id", "parada_id"], as_index=False)
+        .agg(z_score=("z_score", "max"), delay=("delay", "max"))
+        .assign(tipo="parada")
+    )
+
+    por_linea = puntuaciones.groupby("linea_id").agg(
+        paradas=("parada_id", "nunique"),
+        z_score=("z_score", "mean"),
+        delay=("delay", "mean"),
+    )
+    por_linea["paradas_anomalas"] = paradas.groupby("linea_id").size().reindex(por_linea.index, fill_value=0)
+    lineas = por_linea[
+        (por_linea["paradas_anomalas"] >= MIN_PARADAS_ALERTA_LINEA)
+        & (por_linea["paradas_anomalas"] >= FRACCION_ALERTA_LINEA * por_linea["paradas"])
+    ].reset_index()[["linea_id", "z_score", "delay"]].assign(parada_id=None, tipo="linea")
+
+    return pd.concat([lineas, paradas], ignore_index=True)[["tipo", "linea_id", "parada_id", "z_score", "delay"]]
+
+
+# Líneas base desde el histórico
+
+def baselines_historicos(start: str, end: str, access_key: str, secret_key: str) -> pd.DataFrame:
+    """
+    Agrega gtfs_clean_scheduled día a día (sólo n, suma y suma de cuadrados
+    por clave, así que la memoria no crece con el rango) y devuelve la media
+    y la desviación absoluta media equivalente de cada
+    (route_id, stop_id, hora de la semana).
+    """
+    start_date = datetime.strptime(start, "%Y-%m-%d").date()
+    end_date = datetime.strptime(end, "%Y-%m-%d").date()
+
+    acumulado = None
+    for d in iterate_dates(start_date, end_date):
+        day = d.strftime("%Y-%m-%d")
+        try:
+            df = download_df_parquet(access_key, secret_key, build_cleaned_scheduled_object(day), columns=COLUMNAS_HISTORICO)
+        except Exception as e:
+            print(f"[analytics.anomalias] Sin datos para {day}: {e!r}")
+            continue
+
+        df = df.dropna(subset=["delay_seconds"])
+        df["hora_semana"] = df["dow"].astype("int64") * 24 + df["hour"].astype("int64")
+        df["delay_cuadrado"] = df["delay_seconds"] ** 2
+        dia = df.groupby(["route_id", "stop_id", "hora_semana"], observed=True).agg(
+            n=("delay_seconds", "size"), suma=("delay_seconds", "sum"), suma_cuadrados=("delay_cuadrado", "sum"),
+        )
+        acumulado = dia if acumulado is None else acumulado.add(dia, fill_value=0)
+
+    if acumulado is None:
+        return pd.DataFrame(columns=["route_id", "stop_id", "hora_semana", "n", "media", "desviacion"])
+
+    acumulado["media"] = acumulado["suma"] / acumulado["n"]
+    varianza = (acumulado["suma_cuadrados"] / acumulado["n"] - acumulado["media"] ** 2).clip(lower=0)
+    acumulado["desviacion"] = np.sqrt(varianza) / FACTOR_ESCALA
+    return acumulado.reset_index()[["route_id", "stop_id", "hora_semana", "n", "media", "desviacion"]]
+
+
+def sembrar_desde_historico(detector: DetectorAnomalias, baselines: pd.DataFrame) -> None:
+    claves = claves_detector(baselines["route_id"], baselines["stop_id"], baselines["hora_semana"])
+    detector.sembrar(claves, baselines["media"].to_numpy(), baselines["desviacion"].to_numpy(), baselines["n"].to_numpy())
+
+
+def detector_sembrado(hasta, access_key: str, secret_key: str, dias: int = DIAS_SEMILLA) -> DetectorAnomalias:
+    """
+    Detector nuevo con las líneas base de los `dias` días anteriores a
+    `hasta` (date, excluido). Con dias=0 o sin histórico arranca en frío.
+    """
+    detector = DetectorAnomalias()
+    if dias <= 0:
+        return detector
+    start = (hasta - timedelta(days=dias)).strftime("%Y-%m-%d")
+    end = (hasta - timedelta(days=1)).strftime("%Y-%m-%d")
+    baselines = baselines_historicos(start, end, access_key, secret_key)
+    sembrar_desde_historico(detector, baselines)
+    print(f"[analytics.anomalias] Sembradas {len(baselines)} claves con {start}..{end}")
+    return detector
+
+
+def cargar_o_sembrar(ruta, access_key: str, secret_key: str, dias: int = DIAS_SEMILLA) -> DetectorAnomalias:
+    """Estado guardado en `ruta` si existe; si no, detector sembrado hasta hoy (NY)"""
+    if Path(ruta).exists():
+        return DetectorAnomalias.cargar(ruta)
+    hoy = pd.Timestamp.now(tz="America/New_York").date()
+    return detector_sembrado(hoy, access_key, secret_key, dias)
+
+
+# Benchmark de reproducción
+
+def benchmark_replay(observaciones: pd.DataFrame, tam_lote: int = 5000, detector: DetectorAnomalias = None) -> dict:
+    """
+    Reproduce observaciones (route_id, stop_id, hora_semana, delay_seconds)
+    en lotes del tamaño de un ciclo y mide el rendimiento del detector.
+    """
+    detector = DetectorAnomalias() if detector is None else detector
+    linea = observaciones["route_id"].to_numpy(dtype=object)
+    parada = observaciones["stop_id"].to_numpy(dtype=object)
+    hora_semana = observaciones["hora_semana"].to_numpy(dtype=np.int64)
+    retraso = observaciones["delay_seconds"].to_numpy(dtype="float64")
+
+    anomalas = 0
+    inicio = time.perf_counter()
+    for i in range(0, len(retraso), tam_lote):
+        lote = slice(i, i + tam_lote)
+        anomalas += int(detector.actualizar(linea[lote], parada[lote], hora_semana[lote], retraso[lote])["anomalia"].sum())
+    segundos = time.perf_counter() - inicio
+
+    return {
+        "observaciones": len(retraso),
+        "segundos": segundos,
+        "observaciones_por_segundo": len(retraso) / segundos if segundos else float("inf"),
+        "anomalias": anomalas,
+        "claves": len(detector),
+    }
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark de reproducción del detector de anomalías sobre gtfs_clean_scheduled."
+    )
+    parser.add_argument("--start", required=True, help="Fecha inicio (YYYY-MM-DD), inclusive.")
+    parser.add_argument("--end", required=True, help="Fecha fin (YYYY-MM-DD), inclusive.")
+    parser.add_argument("--tam_lote", type=int, default=5000, help="Observaciones por ciclo simulado.")
+    parser.add_argument("--dias_semilla", type=int, default=DIAS_SEMILLA,
+                        help="Días anteriores a --start con los que sembrar las líneas base (0 = en frío).")
+    parser.add_argument("--estado", default=None, help="Ruta .npz donde guardar el estado sembrado y reproducido.")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+
+    access_key = os.getenv("MINIO_ACCESS_KEY")
+    if access_key is None:
+        raise AssertionError("MINIO_ACCESS_KEY no definida")
+
+    secret_key = os.getenv("MINIO_SECRET_KEY")
+    if secret_key is None:
+        raise AssertionError("MINIO_SECRET_KEY no definida")
+
+    start_date = datetime.strptime(args.start, "%Y-%m-%d").date()
+    end_date = datetime.strptime(args.end, "%Y-%m-%d").date()
+
+    detector = detector_sembrado(start_date, access_key, secret_key, args.dias_semilla)
+    for d in iterate_dates(start_date, end_date):
+        day = d.strftime("%Y-%m-%d")
+        try:
+            df = download_df_parquet(access_key, secret_key, build_cleaned_scheduled_object(day),
+                                     columns=COLUMNAS_HISTORICO + ["scheduled_seconds"])
+        except Exception as e:
+            print(f"[analytics.anomalias] Sin datos para {day}: {e!r}")
+            continue
+
+        df = df.dropna(subset=["delay_seconds"]).sort_values("scheduled_seconds")
+        df["hora_semana"] = df["dow"].astype("int64") * 24 + df["hour"].astype("int64")
+
+        resultado = benchmark_replay(df, args.tam_lote, detector)
+        print(
+            f"[analytics.anomalias] {day} obs={resultado['observaciones']} "
+            f"obs/s={resultado['observaciones_por_segundo']:.0f} anomalias={resultado['anomalias']} "
+            f"claves={resultado['claves']}"
+        )
+
+    if args.estado:
+        detector.guardar(args.estado)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
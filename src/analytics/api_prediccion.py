@@ -0,0 +1,62 @@
+"""
+API HTTP del servicio de predicción de retrasos (FastAPI).
+
+Al arrancar carga las líneas base y el grafo de paradas, y lanza en segundo
+plano el ciclo de tiempo real que mantiene el estado en memoria.
+
+Uso:
+    uv run uvicorn src.analytics.api_prediccion:app --port 8000
+
+    GET /prediccion?linea=A&parada=A27N&minutos=30
+    GET /salud
+"""
+
+import os
+import threading
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query
+
+from src.analytics.prediccion import (
+    DIR_BASELINES,
+    HORIZONTE_MAXIMO,
+    cargar_baselines,
+    crear_servicio,
+)
+
+
+servicio = None
+parar = threading.Event()
+
+
+@asynccontextmanager
+async def ciclo_vida(_app: FastAPI):
+    global servicio
+    servicio = crear_servicio(cargar_baselines(os.getenv("BASELINES_PREDICCION", DIR_BASELINES)))
+    servicio.iniciar_tiempo_real(parar=parar)
+    yield
+    parar.set()
+
+
+app = FastAPI(title="Express-Bound · predicción de retrasos", lifespan=ciclo_vida)
+
+
+@app.get("/prediccion")
+def prediccion(
+    linea: str,
+    parada: str,
+    minutos: int = Query(30, ge=0, le=HORIZONTE_MAXIMO),
+):
+    resultado = servicio.predecir(linea, parada, minutos)
+    if resultado["fuente"] == "sin_datos":
+        raise HTTPException(status_code=404, detail=f"Sin datos para la parada {parada} de la línea {linea}")
+    return resultado
+
+
+@app.get("/salud")
+def salud():
+    return {
+        "ultima_actualizacion": servicio.ultima_actualizacion,
+        "paradas_con_proyeccion": len(servicio.proyecciones),
+        "paradas_con_retraso_reciente": len(servicio.recientes),
+    }
@@ -0,0 +1,301 @@
+"""
+Análisis de headways (tiempo entre trenes consecutivos)
+
+Para cada (route_id, stop_id, dirección) se calcula el tiempo entre llegadas
+consecutivas, tanto real como previsto, y su desviación:
+    desviacion = headway_real - headway_previsto
+
+Los dos headways de una llegada se miden contra el mismo tren: el anterior
+en orden de llegada real. Si un tren adelanta a otro, su headway previsto
+respecto al adelantado sale negativo.
+
+Los cálculos se hacen con núcleos vectorizados de ordenar-y-restar
+(np.lexsort + np.diff) sobre arrays de enteros, sin bucles de Python.
+
+Modo batch (un día cada vez, para acotar la memoria):
+
+  Lee de (MinIO):
+    grupo5/cleaned/gtfs_clean_scheduled/date=YYYY-MM-DD/gtfs_scheduled_YYYY-MM-DD.parquet
+
+  Escribe a (MinIO):
+    grupo5/analytics/headway_analysis/date=YYYY-MM-DD/headways_YYYY-MM-DD.parquet
+    grupo5/analytics/headway_analysis/date=YYYY-MM-DD/resumen_headways_YYYY-MM-DD.parquet
+
+Modo incremental (tiempo real): HeadwaysTiempoReal recibe lotes de llegadas
+ya realizadas y calcula su headway contra el tren anterior de cada grupo,
+que guarda como estado entre ciclos. Lo usa snapshots_realtime con
+--headways, que escribe a (MinIO):
+    grupo5/analytics/headways_realtime/date=YYYY-MM-DD/headways_YYYY-MM-DD_HHMMSS_HHMMSS.parquet
+"""
+
+import os
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from src.common.idempotencia import huella, huella_objeto, metadatos, salidas_actualizadas, version_codigo
+from src.common.minio_client import download_df_parquet, upload_df_parquet
+from src.gtfs_historico.transform import build_cleaned_scheduled_object, iterate_dates
+
+
+# Headways por encima de este valor son huecos de servicio, no intervalos entre trenes
+MAX_HEADWAY = 2 * 3600
+
+COLUMNAS_ENTRADA = ["match_key", "route_id", "stop_id", "scheduled_seconds", "delay_seconds"]
+
+# Los días ya calculados con la misma entrada y el mismo código se saltan
+VERSION_CODIGO = version_codigo(__file__)
+
+
+def build_headways_object(day: str) -> str:
+    return f"grupo5/analytics/headway_analysis/date={day}/headways_{day}.parquet"
+
+
+def build_resumen_headways_object(day: str) -> str:
+    return f"grupo5/analytics/headway_analysis/date={day}/resumen_headways_{day}.parquet"
+
+
+def build_headways_realtime_object(dia: str, desde: str, hasta: str) -> str:
+    return f"grupo5/analytics/headways_realtime/date={dia}/headways_{dia}_{desde}_{hasta}.parquet"
+
+
+# Núcleos vectorizados
+
+def codigos_grupo(*columnas) -> np.ndarray:
+    """
+    Combina varias columnas en un único código entero por grupo
+    (equivalente a un groupby, pero devolviendo sólo el código de cada fila).
+    Las columnas categóricas se factorizan sobre sus códigos.
+    """
+    codigo = np.zeros(len(columnas[0]), dtype=np.int64)
+    for columna in columnas:
+        codigos, unicos = pd.factorize(columna, use_na_sentinel=False)
+        codigo = codigo * len(unicos) + codigos
+    return codigo
+
+
+def headways_por_grupo(grupo: np.ndarray, tiempos: np.ndarray, max_headway: float = MAX_HEADWAY,
+                       orden_por: np.ndarray = None) -> np.ndarray:
+    """
+    Headway de cada fila respecto a la anterior de su grupo en orden de
+    `orden_por` (por defecto, los propios `tiempos`). Devuelve un array
+    alineado con la entrada; la primera llegada de cada grupo, los tiempos
+    nulos y los huecos mayores que `max_headway` quedan como NaN.
+    """
+    tiempos = np.asarray(tiempos, dtype="float64")
+    orden_por = tiempos if orden_por is None else np.asarray(orden_por, dtype="float64")
+    orden = np.lexsort((orden_por, grupo))
+
+    g = grupo[orden]
+    t = tiempos[orden]
+
+    h = np.full(len(t), np.nan)
+    h[1:] = np.diff(t)
+    h[1:][g[1:] != g[:-1]] = np.nan
+    h[h > max_headway] = np.nan
+
+    resultado = np.empty_like(h)
+    resultado[orden] = h
+    return resultado
+
+
+def direccion_desde_parada(stop_id: pd.Series) -> np.ndarray:
+    """Dirección según el sufijo de la parada: N=1, S=0, desconocida=-1"""
+    sufijo = stop_id.str[-1]
+    return sufijo.map({"N": 1, "S": 0}).fillna(-1).astype("int8").to_numpy()
+
+
+# Modo batch
+
+def calcular_headways_dia(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Calcula los headways real y previsto de cada llegada de un día de
+    gtfs_clean_scheduled.
+
+    El instante real se reconstruye como scheduled_seconds + delay_seconds:
+    delay_seconds ya viene corregido para trenes que cruzan la medianoche,
+    así que la hora real queda en la misma escala que la prevista.
+    """
+    df = df.dropna(subset=["route_id", "stop_id", "scheduled_seconds", "delay_seconds"])
+
+    previsto = df["scheduled_seconds"].to_numpy(dtype="float64")
+    real = previsto + df["delay_seconds"].to_numpy(dtype="float64")
+    direccion = direccion_desde_parada(df["stop_id"])
+    grupo = codigos_grupo(df["route_id"], df["stop_id"], direccion)
+
+    # Los dos headways, sobre el mismo par de trenes (orden real)
+    headway_real = headways_por_grupo(grupo, real)
+    headway_previsto = headways_por_grupo(grupo, previsto, orden_por=real)
+
+    return pd.DataFrame({
+        "match_key": df["match_key"].to_numpy(),
+        "route_id": df["route_id"].to_numpy(),
+        "stop_id": df["stop_id"].to_numpy(),
+        "direccion": direccion,
+        "scheduled_seconds": previsto,
+        "actual_seconds": real,
+        "headway_real": headway_real,
+        "headway_previsto": headway_previsto,
+        "desviacion": headway_real - headway_previsto,
+    })
+
+
+def resumir_headways(headways: pd.DataFrame) -> pd.DataFrame:
+    """
+    Estadísticas por (route_id, stop_id, direccion, hora prevista)
+    """
+    validos = headways.dropna(subset=["desviacion"]).assign(
+        hour=lambda d: (d["scheduled_seconds"] // 3600 % 24).astype("int8"),
+        desviacion_abs=lambda d: d["desviacion"].abs(),
+    )
+    grupos = validos.groupby(["route_id", "stop_id", "direccion", "hour"], observed=True, sort=False)
+
+    resumen = grupos.agg(
+        n=("desviacion", "size"),
+        headway_real_medio=("headway_real", "mean"),
+        headway_previsto_medio=("headway_previsto", "mean"),
+        desviacion_media=("desviacion", "mean"),
+    )
+    resumen["desviacion_abs_p90"] = grupos["desviacion_abs"].quantile(0.9)
+    return resumen.reset_index()
+
+
+def headways_range(start: date, end: date, access_key: str, secret_key: str) -> None:
+    for d in iterate_dates(start, end):
+        day = d.strftime("%Y-%m-%d")
+
+        salidas = [build_headways_object(day), build_resumen_headways_object(day)]
+
+        try:
+            entrada = huella_objeto(access_key, secret_key, build_cleaned_scheduled_object(day))
+            huella_dia = huella(entrada=entrada, codigo=VERSION_CODIGO)
+            if entrada is not None and salidas_actualizadas(access_key, secret_key, salidas, huella_dia):
+                print(f"[analytics.headways] SKIP {day} (salidas al día)")
+                continue
+
+            df = download_df_parquet(access_key, secret_key, build_cleaned_scheduled_object(day), columns=COLUMNAS_ENTRADA)
+        except Exception as e:
+            print(f"[analytics.headways] FAIL {day}: no se pudo leer gtfs_clean_scheduled ({e!r})")
+            continue
+
+        headways = calcular_headways_dia(df)
+        del df
+        resumen = resumir_headways(headways)
+
+        upload_df_parquet(access_key, secret_key, build_headways_object(day), headways, metadata=metadatos(huella_dia))
+        upload_df_parquet(access_key, secret_key, build_resumen_headways_object(day), resumen, metadata=metadatos(huella_dia))
+
+        print(f"[analytics.headways] OK {day} llegadas={len(headways)} grupos={len(resumen)}")
+
+
+def run_headways(start: str, end: str) -> None:
+    """Función usada por runner externo para calcular headways por día."""
+    access_key = os.getenv("MINIO_ACCESS_KEY")
+    if access_key is None:
+        raise AssertionError("MINIO_ACCESS_KEY no definida")
+
+    secret_key = os.getenv("MINIO_SECRET_KEY")
+    if secret_key is None:
+        raise AssertionError("MINIO_SECRET_KEY no definida")
+
+    start_date = datetime.strptime(start, "%Y-%m-%d").date()
+    end_date = datetime.strptime(end, "%Y-%m-%d").date()
+
+    headways_range(start_date, end_date, access_key, secret_key)
+
+
+# Modo incremental
+
+class HeadwaysTiempoReal:
+    """
+    Headways sobre el flujo en tiempo real.
+
+    Guarda, para cada grupo (línea, parada, dirección), la última llegada
+    real vista y la prevista de ese mismo tren, en arrays alineados con un pd.Index de hashes de
+    64 bits del grupo. Cada lote nuevo se ordena junto a ese estado, de
+    forma que la primera llegada del lote en cada grupo se compara con la
+    última del lote anterior.
+
+    El feed vuelve a emitir durante un rato las llegadas ya realizadas: sólo
+    cuentan las llegadas posteriores a la última guardada de su grupo (y una
+    vez cada una dentro del lote), así que una llegada repetida no da un
+    headway de 0 s.
+    """
+
+    def __init__(self, max_headway: float = MAX_HEADWAY):
+        self.max_headway = max_headway
+        self.claves = pd.Index(np.empty(0, dtype=np.uint64))
+        self.ultima_real = np.empty(0)
+        self.ultima_prevista = np.empty(0)
+
+    def actualizar(self, linea_id, parada_id, direccion, llegada_epoch, prevista_epoch) -> pd.DataFrame:
+        """
+        Recibe las llegadas realizadas del ciclo (arrays alineados, epochs en
+        segundos) y devuelve las que son nuevas con sus headways real,
+        previsto y la desviación.
+        """
+        lote = pd.DataFrame({
+            "linea_id": np.asarray(linea_id, dtype=object),
+            "parada_id": np.asarray(parada_id, dtype=object),
+            "direccion": np.asarray(direccion, dtype="int64"),
+            "llegada_epoch": np.asarray(llegada_epoch, dtype="float64"),
+            "prevista_epoch": np.asarray(prevista_epoch, dtype="float64"),
+        })
+        if lote.empty:
+            return lote.assign(headway_real=[], headway_previsto=[], desviacion=[])
+
+        grupo = pd.util.hash_pandas_object(lote[["linea_id", "parada_id", "direccion"]], index=False).to_numpy()
+
+        # Fuera las llegadas ya vistas: repetidas en el lote o no posteriores a la última del grupo
+        posicion = self.claves.get_indexer(grupo)
+        ultima = np.append(self.ultima_real, -np.inf)[posicion]
+        nuevas = (lote["llegada_epoch"].to_numpy() > ultima) & ~pd.DataFrame(
+            {"grupo": grupo, "llegada": lote["llegada_epoch"]}).duplicated().to_numpy()
+        lote = lote[nuevas].reset_index(drop=True)
+        grupo = grupo[nuevas]
+        if lote.empty:
+            return lote.assign(headway_real=[], headway_previsto=[], desviacion=[])
+
+        # Las últimas llegadas de cada grupo conocido entran como filas auxiliares
+        unicos = pd.unique(grupo)
+        posiciones = self.claves.get_indexer(unicos)
+        previos = posiciones[posiciones >= 0]
+        n_previos = len(previos)
+
+        grupo_ext = np.concatenate([self.claves.to_numpy()[previos], grupo])
+        real = np.concatenate([self.ultima_real[previos], lote["llegada_epoch"].to_numpy()])
+        prevista = np.concatenate([self.ultima_prevista[previos], lote["prevista_epoch"].to_numpy()])
+
+        lote["headway_real"] = headways_por_grupo(grupo_ext, real, self.max_headway)[n_previos:]
+        lote["headway_previsto"] = headways_por_grupo(grupo_ext, prevista, self.max_headway, orden_por=real)[n_previos:]
+        lote["desviacion"] = lote["headway_real"] - lote["headway_previsto"]
+
+        self._actualizar_estado(grupo_ext, real, prevista)
+        return lote
+
+    def actualizar_ciclo(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        actualizar() sobre la salida de procesar_ciclo: la llegada prevista es
+        la real menos el retraso (ya corregido en los cruces de medianoche)
+        """
+        llegada = df["llegada_epoch"].to_numpy(dtype="float64")
+        return self.actualizar(df["linea_id"], df["parada_id"], df["direccion"],
+                               llegada, llegada - df["delay"].to_numpy(dtype="float64"))
+
+    def _actualizar_estado(self, grupo, real, prevista):
+        # La prevista guardada es la del mismo tren que la última llegada real
+        orden = np.lexsort((real, grupo))
+        g = grupo[orden]
+        ultima = orden[np.r_[g[1:] != g[:-1], True]]
+        ultimas = pd.DataFrame({"real": real[ultima], "prevista": prevista[ultima]}, index=grupo[ultima])
+        posiciones = self.claves.get_indexer(ultimas.index)
+        conocidas = posiciones >= 0
+
+        self.ultima_real[posiciones[conocidas]] = ultimas["real"].to_numpy()[conocidas]
+        self.ultima_prevista[posiciones[conocidas]] = ultimas["prevista"].to_numpy()[conocidas]
+
+        if not conocidas.all():
+            self.claves = self.claves.append(pd.Index(ultimas.index[~conocidas].to_numpy(dtype=np.uint64)))
+            self.ultima_real = np.concatenate([self.ultima_real, ultimas["real"].to_numpy()[~conocidas]])
+            self.ultima_prevista = np.concatenate([self.ultima_prevista, ultimas["prevista"].to_numpy()[~conocidas]])
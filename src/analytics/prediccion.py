@@ -0,0 +1,345 @@
+"""
+Servicio de predicción de retraso a corto plazo (15–60 minutos).
+
+Responde a "retraso esperado en la parada X de la línea Y dentro de N
+minutos" combinando, todo en memoria:
+  - líneas base históricas por (línea, parada, hora de la semana), sacadas
+    de gtfs_clean_scheduled (ver anomalias.baselines_historicos);
+  - el estado en tiempo real: retraso medio de las llegadas de los últimos
+    15 minutos en cada (línea, parada), sacado de un buffer circular, y la
+    proyección de retrasos de los trenes que se acercan
+    (propagacion.PropagacionRetrasos), actualizados en cada ciclo. El ciclo
+    pasa por un DetectorCambios, así que cada llegada entra una sola vez y
+    no cada vez que el feed la vuelve a emitir.
+
+Las búsquedas son consultas a diccionarios por clave, y cada respuesta se
+guarda en una caché con TTL igual al intervalo de consulta a la MTA: hasta
+el siguiente ciclo los datos de entrada no cambian. Al pasar de MAX_CACHE
+respuestas se purgan las caducadas.
+
+Como snapshots_realtime, el hilo de tiempo real vuelve a comprobar el
+horario previsto cada COMPROBAR_CADA segundos; si ha cambiado de versión se
+reconstruyen el índice del horario y el grafo de paradas.
+
+La API HTTP está en src.analytics.api_prediccion.
+
+Uso (prueba de carga en proceso o contra la API HTTP):
+    uv run python -m src.analytics.prediccion --baselines data/cache/baselines_prediccion.parquet
+    uv run python -m src.analytics.prediccion --start 2025-12-01 --end 2025-12-28 --url http://127.0.0.1:8000
+"""
+
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pandas as pd
+import requests
+
+from src.analytics.anomalias import baselines_historicos
+from src.analytics.propagacion import GrafoParadas, PropagacionRetrasos
+from src.tiempo_real_metro.buffer_circular import VENTANA, BufferCircular
+from src.tiempo_real_metro.deteccion_cambios import DetectorCambios
+from src.tiempo_real_metro.horario_previsto import COMPROBAR_CADA, cargar_horario_previsto, indice_horario
+from src.tiempo_real_metro.realtime_data import crear_sesion, descargar_feeds
+from src.tiempo_real_metro.snapshots_realtime import INTERVALO, procesar_ciclo
+
+
+DIR_BASELINES = Path("data/cache/baselines_prediccion.parquet")
+
+# El último retraso observado pierde peso frente a la línea base con esta constante (segundos)
+TAU_RECIENTE = 30 * 60
+
+# Una proyección sirve si el tren llega a menos de esto del instante pedido
+VENTANA_PROYECCION = 5 * 60
+
+HORIZONTE_MAXIMO = 60
+
+# Respuestas en caché a partir de las cuales se purgan las caducadas
+MAX_CACHE = 100_000
+
+
+def _desfase_ny(epoch: float) -> int:
+    """Desfase UTC (segundos) de Nueva York en un instante"""
+    return int(pd.Timestamp(epoch, unit="s", tz="UTC").tz_convert("America/New_York").utcoffset().total_seconds())
+
+
+def _hora_semana(epoch: float, desfase: int) -> int:
+    """Hora de la semana (lunes 00h = 0) en hora local; el 1/1/1970 fue jueves"""
+    local = int(epoch) + desfase
+    return ((local // 86400 + 3) % 7) * 24 + (local // 3600) % 24
+
+
+class ServicioPrediccion:
+    """
+    Predicciones en proceso. `predecir` es seguro entre hilos: cada ciclo
+    construye diccionarios nuevos y los sustituye de una vez.
+    """
+
+    def __init__(self, baselines: pd.DataFrame, grafo: GrafoParadas = None, ttl: float = INTERVALO):
+        self.ttl = ttl
+        claves = zip(baselines["route_id"], baselines["stop_id"], baselines["hora_semana"].astype(int))
+        self.baselines = dict(zip(claves, baselines["media"].astype(float)))
+
+        # Si falta la hora concreta, media ponderada de la parada en toda la semana
+        ponderado = baselines.assign(suma=baselines["media"] * baselines["n"]).groupby(["route_id", "stop_id"])
+        medias = ponderado["suma"].sum() / ponderado["n"].sum()
+        self.baselines_parada = dict(zip(medias.index, medias.astype(float)))
+
+        self.propagacion = PropagacionRetrasos(grafo) if grafo is not None else None
+        self.buffer = BufferCircular()
+        self.cambios = DetectorCambios()
+        self.recientes = {}
+        self.proyecciones = {}
+        self.cache = {}
+        self.desfase = _desfase_ny(time.time())
+        self.ultima_actualizacion = None
+
+    # Estado en tiempo real
+
+    def actualizar_ciclo(self, df: pd.DataFrame, ahora: int) -> None:
+        """
+        Incorpora la salida de procesar_ciclo (llegadas realizadas con su
+        retraso) y recalcula las proyecciones. `df` debe traer sólo llegadas
+        nuevas (procesar_ciclo con el DetectorCambios del servicio): cada
+        fila entra en el buffer con el epoch de su llegada.
+        """
+        nuevas = df.sort_values("llegada_epoch", kind="stable")
+        self.buffer.añadir(nuevas["linea_id"], nuevas["parada_id"], nuevas["direccion"],
+                           nuevas["llegada_epoch"].to_numpy(dtype="int64"), nuevas["delay"])
+        ventana = self.buffer.agregados(ahora, VENTANA)
+        recientes = dict(zip(
+            zip(ventana["linea_id"], ventana["parada_id"]),
+            zip(ventana["media"].astype(float), ventana["ultimo_epoch"]),
+        ))
+
+        proyecciones = {}
+        if self.propagacion is not None:
+            self.propagacion.actualizar(df, ahora)
+            proyeccion = self.propagacion.proyectar(ahora, HORIZONTE_MAXIMO * 60 + VENTANA_PROYECCION)
+            proyeccion = proyeccion.sort_values("segundos_hasta")
+            for clave, grupo in proyeccion.groupby(["linea_id", "parada_id"], sort=False):
+                proyecciones[clave] = (
+                    ahora + grupo["segundos_hasta"].to_numpy(),
+                    grupo["retraso_proyectado"].to_numpy(),
+                )
+
+        self.recientes = recientes
+        self.proyecciones = proyecciones
+        self.desfase = _desfase_ny(ahora)
+        self.ultima_actualizacion = ahora
+        self.cache = {}
+
+    def actualizar_horario(self, horario: pd.DataFrame) -> None:
+        """Reconstruye el grafo de paradas si el horario es de otra versión"""
+        if self.propagacion is None or horario.attrs.get("version") == self.propagacion.grafo.version:
+            return
+        print(f"[analytics.prediccion] Horario nuevo (versión {horario.attrs.get('version')}): reconstruyendo el grafo")
+        self.propagacion.cambiar_grafo(GrafoParadas(horario))
+
+    # Consultas
+
+    def predecir(self, linea_id: str, parada_id: str, minutos: int, ahora: float = None) -> dict:
+        ahora = time.time() if ahora is None else ahora
+        clave = (linea_id, parada_id, int(minutos))
+
+        guardada = self.cache.get(clave)
+        if guardada is not None and guardada[0] > ahora:
+            return guardada[1]
+
+        resultado = self._calcular(linea_id, parada_id, int(minutos), ahora)
+        if len(self.cache) >= MAX_CACHE:
+            self._purgar_cache(ahora)
+        self.cache[clave] = (ahora + self.ttl, resultado)
+        return resultado
+
+    def _purgar_cache(self, ahora):
+        """
+        Quita las respuestas caducadas; si aun así la caché está llena (más
+        de MAX_CACHE consultas distintas dentro del TTL) se vacía entera.
+        Como en actualizar_ciclo, se sustituye el diccionario de una vez.
+        """
+        vigentes = {clave: guardada for clave, guardada in list(self.cache.items()) if guardada[0] > ahora}
+        self.cache = vigentes if len(vigentes) < MAX_CACHE else {}
+
+    def _calcular(self, linea_id, parada_id, minutos, ahora):
+        objetivo = ahora + minutos * 60
+        baseline = self.baselines.get((linea_id, parada_id, _hora_semana(objetivo, self.desfase)))
+        if baseline is None:
+            baseline = self.baselines_parada.get((linea_id, parada_id))
+
+        retraso, fuente = baseline, "historico"
+
+        # 1) Un tren que llegue a la parada cerca del instante pedido
+        proyeccion = self.proyecciones.get((linea_id, parada_id))
+        if proyeccion is not None:
+            llegadas, retrasos = proyeccion
+            i = int(np.searchsorted(llegadas, objetivo))
+            candidatos = [j for j in (i - 1, i) if 0 <= j < len(llegadas)]
+            j = min(candidatos, key=lambda k: abs(llegadas[k] - objetivo))
+            if abs(llegadas[j] - objetivo) <= VENTANA_PROYECCION:
+                retraso, fuente = float(retrasos[j]), "proyeccion"
+
+        # 2) El retraso medio reciente, que tiende a la línea base con el tiempo
+        if fuente == "historico":
+            reciente = self.recientes.get((linea_id, parada_id))
+            if reciente is not None:
+                peso = math.exp(-(objetivo - reciente[1]) / TAU_RECIENTE)
+                retraso = peso * reciente[0] + (1 - peso) * (baseline if baseline is not None else reciente[0])
+                fuente = "reciente"
+
+        return {
+            "linea_id": linea_id,
+            "parada_id": parada_id,
+            "minutos": minutos,
+            "retraso_esperado": retraso,
+            "baseline": baseline,
+            "fuente": fuente if retraso is not None else "sin_datos",
+        }
+
+    # Bucle en tiempo real
+
+    def iniciar_tiempo_real(self, intervalo: float = INTERVALO, parar: threading.Event = None) -> threading.Thread:
+        """Lanza en un hilo el ciclo descarga → retrasos → actualizar_ciclo"""
+        parar = threading.Event() if parar is None else parar
+
+        def bucle():
+            # La primera carga del horario se hace dentro del bucle, con sus
+            # reintentos: un fallo de red al arrancar no debe matar el hilo
+            sesion = crear_sesion()
+            ultima_carga_horario = -math.inf
+            while not parar.is_set():
+                inicio = time.monotonic()
+                try:
+                    if inicio - ultima_carga_horario >= COMPROBAR_CADA:
+                        horario = cargar_horario_previsto(sesion=sesion)
+                        indice = indice_horario(horario)
+                        self.actualizar_horario(horario)
+                        ultima_carga_horario = inicio
+
+                    ahora = int(time.time())
+                    df = procesar_ciclo(descargar_feeds(sesion=sesion), indice, detector=self.cambios)
+                    self.actualizar_ciclo(df, ahora)
+                except Exception as e:
+                    print(f"[analytics.prediccion] FAIL ciclo error={e!r}", file=sys.stderr)
+                parar.wait(max(0.0, intervalo - (time.monotonic() - inicio)))
+
+        hilo = threading.Thread(target=bucle, name="prediccion_tiempo_real", daemon=True)
+        hilo.start()
+        return hilo
+
+
+def crear_servicio(baselines: pd.DataFrame, con_propagacion: bool = True) -> ServicioPrediccion:
+    grafo = GrafoParadas(cargar_horario_previsto()) if con_propagacion else None
+    return ServicioPrediccion(baselines, grafo)
+
+
+def cargar_baselines(ruta=DIR_BASELINES, start: str = None, end: str = None) -> pd.DataFrame:
+    """
+    Lee las líneas base de `ruta`; si se indica un rango de fechas, las
+    calcula desde MinIO y las guarda en `ruta`.
+    """
+    ruta = Path(ruta)
+    if start is None:
+        return pd.read_parquet(ruta)
+
+    access_key = os.getenv("MINIO_ACCESS_KEY")
+    if access_key is None:
+        raise AssertionError("MINIO_ACCESS_KEY no definida")
+
+    secret_key = os.getenv("MINIO_SECRET_KEY")
+    if secret_key is None:
+        raise AssertionError("MINIO_SECRET_KEY no definida")
+
+    baselines = baselines_historicos(start, end or start, access_key, secret_key)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    baselines.to_parquet(ruta, index=False)
+    return baselines
+
+
+# Prueba de carga
+
+def _resumen_latencias(latencias, segundos) -> dict:
+    latencias = np.asarray(latencias)
+    return {
+        "peticiones": len(latencias),
+        "p50_ms": float(np.percentile(latencias, 50) * 1000),
+        "p99_ms": float(np.percentile(latencias, 99) * 1000),
+        "peticiones_por_segundo": len(latencias) / segundos,
+    }
+
+
+def prueba_carga(servicio: ServicioPrediccion, peticiones: int = 100_000, claves_distintas: int = 2000, semilla: int = 0) -> dict:
+    """Prueba en proceso con consultas aleatorias sobre paradas con línea base"""
+    rng = np.random.default_rng(semilla)
+    paradas = list(servicio.baselines_parada)
+    elegidas = [paradas[i] for i in rng.integers(0, len(paradas), claves_distintas)]
+    minutos = rng.choice([15, 30, 45, 60], claves_distintas)
+    consultas = rng.integers(0, claves_distintas, peticiones)
+
+    latencias = np.empty(peticiones)
+    inicio = time.perf_counter()
+    for n, i in enumerate(consultas):
+        t = time.perf_counter()
+        servicio.predecir(elegidas[i][0], elegidas[i][1], minutos[i])
+        latencias[n] = time.perf_counter() - t
+    return _resumen_latencias(latencias, time.perf_counter() - inicio)
+
+
+def prueba_carga_http(url: str, paradas, peticiones: int = 5000, hilos: int = 8, semilla: int = 0) -> dict:
+    """Prueba contra la API HTTP con `hilos` clientes concurrentes"""
+    rng = np.random.default_rng(semilla)
+    consultas = [(paradas[i], int(m)) for i, m in zip(rng.integers(0, len(paradas), peticiones),
+                                                      rng.choice([15, 30, 45, 60], peticiones))]
+    local = threading.local()
+
+    def consultar(consulta):
+        if not hasattr(local, "sesion"):
+            local.sesion = requests.Session()
+        (linea, parada), minutos = consulta
+        t = time.perf_counter()
+        local.sesion.get(f"{url}/prediccion", params={"linea": linea, "parada": parada, "minutos": minutos}, timeout=5).raise_for_status()
+        return time.perf_counter() - t
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        latencias = list(executor.map(consultar, consultas))
+    return _resumen_latencias(latencias, time.perf_counter() - inicio)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Prueba de carga del servicio de predicción de retrasos.")
+    parser.add_argument("--baselines", default=str(DIR_BASELINES), help="Parquet de líneas base.")
+    parser.add_argument("--start", default=None, help="Si se indica, recalcula las líneas base desde esta fecha (YYYY-MM-DD).")
+    parser.add_argument("--end", default=None, help="Fecha fin (YYYY-MM-DD) del recálculo de líneas base.")
+    parser.add_argument("--peticiones", type=int, default=100_000, help="Número de consultas.")
+    parser.add_argument("--url", default=None, help="URL base de la API HTTP; sin ella la prueba es en proceso.")
+    parser.add_argument("--hilos", type=int, default=8, help="Clientes concurrentes en la prueba HTTP.")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    baselines = cargar_baselines(args.baselines, args.start, args.end)
+
+    if args.url:
+        paradas = list(baselines[["route_id", "stop_id"]].drop_duplicates().itertuples(index=False, name=None))
+        resumen = prueba_carga_http(args.url, paradas, args.peticiones, args.hilos)
+    else:
+        resumen = prueba_carga(ServicioPrediccion(baselines), args.peticiones)
+
+    print(
+        f"[analytics.prediccion] peticiones={resumen['peticiones']} p50={resumen['p50_ms']:.3f}ms "
+        f"p99={resumen['p99_ms']:.3f}ms rps={resumen['peticiones_por_segundo']:.0f}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,326 @@
+"""
+Propagación de retrasos a lo largo de la secuencia de paradas de una línea.
+
+GrafoParadas se construye una vez por versión del horario previsto
+(stop_times) y contiene:
+  - los viajes en formato CSR: para cada (trip_id, day) un rango contiguo de
+    posiciones ordenadas por stop_sequence, con su parada, su hora prevista
+    y la arista por la que se llega a ella;
+  - las aristas del grafo ordenado de paradas de cada línea y dirección
+    (parada → parada siguiente), con su tiempo de recorrido previsto.
+
+PropagacionRetrasos guarda entre ciclos el retraso de cada viaje activo en
+su última parada realizada y, para cada arista, cuánto cambia de media el
+retraso al recorrerla (EWMA de retraso_destino - retraso_origen). En cada
+ciclo sólo se procesan las llegadas nuevas; la proyección de las paradas
+siguientes es una suma acumulada de esos incrementos sobre el rango CSR de
+cada viaje, para toda la red en una única pasada vectorizada.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.common.dimensiones import indexar
+from src.common.tiempos import SEGUNDOS_DIA
+from src.tiempo_real_metro.realtime_data import dia_segun_fecha_y_formato
+
+
+ALPHA = 0.1
+
+# Pasado este tiempo sin nuevas llegadas, un viaje deja de estar activo
+TTL_VIAJE = 2 * 3600
+
+HORIZONTE = 60 * 60
+
+
+def _linea_y_direccion(viajes: pd.Index) -> pd.DataFrame:
+    """
+    Línea y dirección de cada trip_id (formato 000600_A..N01R → A, N)
+    """
+    partes = viajes.to_series().str.extract(r"^[^_]*_([^.]+)\.+([NS])")
+    partes.columns = ["linea_id", "direccion"]
+    return partes.reset_index(drop=True)
+
+
+class GrafoParadas:
+    """
+    Grafo ordenado de paradas por línea y dirección y viajes en formato CSR,
+    construido a partir del DataFrame de horario previsto
+    (trip_id, stop_id, day, stop_sequence, segundos_previstos).
+    """
+
+    def __init__(self, horario: pd.DataFrame):
+        self.version = horario.attrs.get("version")
+        horario = horario.dropna(subset=["segundos_previstos"])
+
+        viajes = pd.Categorical(horario["trip_id"])
+        paradas = pd.Categorical(horario["stop_id"])
+        dias = pd.Categorical(horario["day"])
+        self.viajes = pd.Index(viajes.categories)
+        self.paradas = pd.Index(paradas.categories)
+        self.dias = pd.Index(dias.categories)
+
+        n_paradas = len(self.paradas)
+        clave_viaje = viajes.codes.astype(np.int64) * len(self.dias) + dias.codes
+        secuencia = horario["stop_sequence"].to_numpy()
+        orden = np.lexsort((secuencia, clave_viaje))
+
+        clave_viaje = clave_viaje[orden]
+        self.parada = paradas.codes[orden].astype(np.int32)
+        self.stop_sequence = secuencia[orden]
+        previsto = horario["segundos_previstos"].to_numpy(dtype="float64")[orden]
+
+        # CSR: el viaje v ocupa las posiciones [inicio[v], inicio[v + 1])
+        arranques = np.flatnonzero(np.r_[True, clave_viaje[1:] != clave_viaje[:-1]])
+        self.inicio = np.append(arranques, len(clave_viaje))
+        self.claves_viaje = pd.Index(clave_viaje[arranques])
+        viaje_de_fila = np.repeat(np.arange(len(arranques)), np.diff(self.inicio))
+        mismo_viaje = np.r_[False, viaje_de_fila[1:] == viaje_de_fila[:-1]]
+
+        # Los horarios vienen módulo 24h: se deshace el salto en los viajes que cruzan la medianoche
+        saltos = np.zeros(len(previsto))
+        saltos[1:] = mismo_viaje[1:] & (np.diff(previsto) < -SEGUNDOS_DIA / 2)
+        saltos = np.cumsum(saltos)
+        self.previsto = previsto + SEGUNDOS_DIA * (saltos - saltos[arranques][viaje_de_fila])
+
+        # Aristas: (línea+dirección, parada anterior, parada) entre posiciones consecutivas de un viaje
+        self.lineas = _linea_y_direccion(self.viajes)
+        ruta, self.rutas = pd.factorize(self.lineas["linea_id"].fillna("") + self.lineas["direccion"].fillna(""))
+        ruta_de_fila = ruta[clave_viaje // len(self.dias)].astype(np.int64)
+
+        entrada = np.flatnonzero(mismo_viaje)
+        clave_arista = (ruta_de_fila[entrada] * n_paradas + self.parada[entrada - 1]) * n_paradas + self.parada[entrada]
+        codigos, _ = pd.factorize(clave_arista)
+        self.arista = np.full(len(clave_viaje), -1, dtype=np.int64)
+        self.arista[entrada] = codigos
+
+        self.aristas = (
+            pd.DataFrame({
+                "arista": codigos,
+                "ruta": ruta_de_fila[entrada],
+                "desde": self.parada[entrada - 1],
+                "hasta": self.parada[entrada],
+                "tiempo": self.previsto[entrada] - self.previsto[entrada - 1],
+            })
+            .groupby("arista", sort=True)
+            .agg(ruta=("ruta", "first"), desde=("desde", "first"), hasta=("hasta", "first"),
+                 tiempo_previsto=("tiempo", "median"), n_viajes=("tiempo", "size"))
+        )
+
+        # Posición CSR de cada (viaje, parada); si un viaje repite parada vale la primera
+        claves_posicion = clave_viaje * n_paradas + self.parada
+        unicas = ~pd.Index(claves_posicion).duplicated()
+        self.claves_posicion = pd.Index(claves_posicion[unicas])
+        self.posicion = np.flatnonzero(unicas)
+
+    def __len__(self):
+        return len(self.claves_viaje)
+
+    def grafo(self) -> pd.DataFrame:
+        """Aristas con identificadores legibles: linea_id, direccion, desde, hasta"""
+        ruta = self.rutas[self.aristas["ruta"].to_numpy()]
+        return pd.DataFrame({
+            "linea_id": ruta.str[:-1],
+            "direccion": ruta.str[-1],
+            "desde": self.paradas[self.aristas["desde"].to_numpy()],
+            "hasta": self.paradas[self.aristas["hasta"].to_numpy()],
+            "tiempo_previsto": self.aristas["tiempo_previsto"].to_numpy(),
+            "n_viajes": self.aristas["n_viajes"].to_numpy(),
+        })
+
+    def buscar(self, viaje_id, parada_id, dia):
+        """
+        Devuelve, para cada observación, el índice del viaje y la posición
+        CSR de la parada (-1 si no están en el horario).
+        """
+        viaje = indexar(self.viajes, viaje_id).astype(np.int64)
+        parada = indexar(self.paradas, parada_id).astype(np.int64)
+        d = indexar(self.dias, dia).astype(np.int64)
+
+        clave_viaje = viaje * len(self.dias) + d
+        validas = (viaje >= 0) & (parada >= 0) & (d >= 0)
+
+        indice_viaje = np.where(validas, self.claves_viaje.get_indexer(clave_viaje), -1)
+        posicion = self.claves_posicion.get_indexer(clave_viaje * len(self.paradas) + parada)
+        posicion = np.where(validas & (posicion >= 0), self.posicion[np.maximum(posicion, 0)], -1)
+        return indice_viaje, posicion
+
+
+def rangos_csr(inicios: np.ndarray, fines: np.ndarray):
+    """
+    Expande rangos [inicio, fin) en un único array de posiciones, junto con
+    el número de rango de cada posición
+    """
+    longitudes = np.maximum(fines - inicios, 0)
+    rango = np.repeat(np.arange(len(inicios)), longitudes)
+    desplazamiento = np.arange(len(rango)) - np.repeat(np.cumsum(longitudes) - longitudes, longitudes)
+    return inicios[rango] + desplazamiento, rango
+
+
+class PropagacionRetrasos:
+    """
+    Estado incremental del modelo de propagación.
+
+    Viajes activos: arrays alineados con un pd.Index de índices de viaje del
+    grafo (posición CSR de la última parada realizada, su retraso y el epoch
+    de la llegada a ella). Aristas: incremento medio de retraso y número de
+    observaciones.
+    """
+
+    def __init__(self, grafo: GrafoParadas, alpha: float = ALPHA, ttl: int = TTL_VIAJE):
+        self.grafo = grafo
+        self.alpha = alpha
+        self.ttl = ttl
+        self.incremento = np.zeros(len(grafo.aristas))
+        self.n_arista = np.zeros(len(grafo.aristas), dtype=np.int64)
+
+        self.viajes = pd.Index(np.empty(0, dtype=np.int64))
+        self.posicion = np.empty(0, dtype=np.int64)
+        self.retraso = np.empty(0)
+        self.visto = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.viajes)
+
+    def cambiar_grafo(self, grafo: GrafoParadas) -> None:
+        """
+        Pasa a un grafo nuevo (nueva versión del horario). Los incrementos
+        aprendidos se conservan en las aristas que siguen existiendo (misma
+        línea, dirección y par de paradas); los viajes activos se descartan,
+        porque sus posiciones CSR son las del grafo anterior, y se recuperan
+        con las siguientes llegadas.
+        """
+        def claves(g):
+            return pd.MultiIndex.from_frame(g.grafo()[["linea_id", "direccion", "desde", "hasta"]])
+
+        anteriores = claves(self.grafo).get_indexer(claves(grafo))
+        conservadas = anteriores >= 0
+
+        incremento = np.zeros(len(grafo.aristas))
+        n_arista = np.zeros(len(grafo.aristas), dtype=np.int64)
+        incremento[conservadas] = self.incremento[anteriores[conservadas]]
+        n_arista[conservadas] = self.n_arista[anteriores[conservadas]]
+
+        self.grafo = grafo
+        self.incremento = incremento
+        self.n_arista = n_arista
+        self.viajes = pd.Index(np.empty(0, dtype=np.int64))
+        self.posicion = np.empty(0, dtype=np.int64)
+        self.retraso = np.empty(0)
+        self.visto = np.empty(0, dtype=np.int64)
+
+    def actualizar(self, df: pd.DataFrame, ahora: int) -> int:
+        """
+        Incorpora las llegadas realizadas de un ciclo (salida de
+        union_dataframes: viaje_id, parada_id, llegada_epoch, dow, delay).
+        Aprende el incremento de retraso de las aristas recorridas entre dos
+        llegadas consecutivas de un mismo viaje y avanza el estado de cada
+        viaje. Devuelve el número de llegadas incorporadas.
+        """
+        dia = dia_segun_fecha_y_formato(pd.DataFrame({"dow": df["dow"].to_numpy()}))["dia"].to_numpy()
+        viaje, posicion = self.grafo.buscar(df["viaje_id"], df["parada_id"], dia)
+        validas = posicion >= 0
+        viaje, posicion = viaje[validas], posicion[validas]
+        retraso = df["delay"].to_numpy(dtype="float64")[validas]
+        llegada = df["llegada_epoch"].to_numpy(dtype="int64")[validas]
+        if not len(viaje):
+            self._caducar(ahora)
+            return 0
+
+        # El estado previo de cada viaje entra como fila auxiliar delante de las nuevas
+        previos = self.viajes.get_indexer(pd.unique(viaje))
+        previos = previos[previos >= 0]
+        viaje_ext = np.concatenate([self.viajes.to_numpy()[previos], viaje])
+        posicion_ext = np.concatenate([self.posicion[previos], posicion])
+        retraso_ext = np.concatenate([self.retraso[previos], retraso])
+        llegada_ext = np.concatenate([self.visto[previos], llegada])
+        es_nueva = np.r_[np.zeros(len(previos), dtype=bool), np.ones(len(viaje), dtype=bool)]
+
+        # En cada (viaje, posición) gana la observación más reciente (y, a
+        # igual llegada, la del ciclo frente al estado guardado)
+        orden = np.lexsort((es_nueva, llegada_ext, posicion_ext, viaje_ext))
+        v, p, r, e = viaje_ext[orden], posicion_ext[orden], retraso_ext[orden], llegada_ext[orden]
+        ultima_de_posicion = np.r_[(v[1:] != v[:-1]) | (p[1:] != p[:-1]), True]
+        v, p, r, e = v[ultima_de_posicion], p[ultima_de_posicion], r[ultima_de_posicion], e[ultima_de_posicion]
+
+        # Pares de paradas consecutivas del mismo viaje → observación de la arista de entrada
+        consecutivas = np.flatnonzero((v[1:] == v[:-1]) & (p[1:] == p[:-1] + 1)) + 1
+        if len(consecutivas):
+            observado = pd.Series(r[consecutivas] - r[consecutivas - 1]).groupby(self.grafo.arista[p[consecutivas]]).mean()
+            aristas = observado.index.to_numpy()
+            tasa = np.maximum(self.alpha, 1.0 / (self.n_arista[aristas] + 1))
+            self.incremento[aristas] += tasa * (observado.to_numpy() - self.incremento[aristas])
+            self.n_arista[aristas] += 1
+
+        # Última parada realizada de cada viaje
+        ultima = np.r_[v[1:] != v[:-1], True]
+        self._guardar_viajes(v[ultima], p[ultima], r[ultima], e[ultima])
+        self._caducar(ahora)
+        return int(validas.sum())
+
+    def _guardar_viajes(self, viaje, posicion, retraso, llegada):
+        """`llegada` es el epoch de la llegada a la última parada realizada"""
+        indices = self.viajes.get_indexer(viaje)
+        conocidos = indices >= 0
+        i = indices[conocidos]
+        self.posicion[i] = posicion[conocidos]
+        self.retraso[i] = retraso[conocidos]
+        self.visto[i] = llegada[conocidos]
+
+        if not conocidos.all():
+            self.viajes = self.viajes.append(pd.Index(viaje[~conocidos]))
+            self.posicion = np.concatenate([self.posicion, posicion[~conocidos]])
+            self.retraso = np.concatenate([self.retraso, retraso[~conocidos]])
+            self.visto = np.concatenate([self.visto, llegada[~conocidos]])
+
+    def _caducar(self, ahora):
+        # Viajes sin llegadas recientes o ya en su última parada
+        fin = self.grafo.inicio[self.viajes.to_numpy() + 1] - 1 if len(self.viajes) else self.posicion
+        vigentes = (self.visto >= ahora - self.ttl) & (self.posicion < fin)
+        if not vigentes.all():
+            self.viajes = self.viajes[vigentes]
+            self.posicion = self.posicion[vigentes]
+            self.retraso = self.retraso[vigentes]
+            self.visto = self.visto[vigentes]
+
+    def proyectar(self, ahora: int, horizonte: float = HORIZONTE) -> pd.DataFrame:
+        """
+        Retraso proyectado en las paradas siguientes de cada viaje activo a
+        las que se llegará en los próximos `horizonte` segundos.
+
+        retraso_proyectado(k) = retraso actual + suma de los incrementos de
+        las aristas entre la última parada realizada y k. La llegada estimada
+        a k se mide desde el epoch de la llegada a la última parada realizada.
+        """
+        grafo = self.grafo
+        posiciones, fila = rangos_csr(self.posicion + 1, grafo.inicio[self.viajes.to_numpy() + 1])
+
+        # Suma acumulada de incrementos que vuelve a empezar en cada viaje
+        incremento = self.incremento[grafo.arista[posiciones]]
+        acumulado = np.cumsum(incremento)
+        arranque = np.ones(len(fila), dtype=bool)
+        arranque[1:] = fila[1:] != fila[:-1]
+        primera = np.maximum.accumulate(np.where(arranque, np.arange(len(fila)), 0))
+        acumulado -= acumulado[primera] - incremento[primera]
+
+        retraso_proyectado = self.retraso[fila] + acumulado
+        segundos_hasta = (
+            grafo.previsto[posiciones] - grafo.previsto[self.posicion[fila]]
+            + acumulado - (ahora - self.visto[fila])
+        )
+        dentro = (segundos_hasta >= 0) & (segundos_hasta <= horizonte)
+
+        posiciones, fila = posiciones[dentro], fila[dentro]
+        indice_viaje = self.viajes.to_numpy()[fila]
+        codigo_viaje = grafo.claves_viaje.to_numpy()[indice_viaje] // len(grafo.dias)
+
+        return pd.DataFrame({
+            "viaje_id": grafo.viajes[codigo_viaje],
+            "linea_id": grafo.lineas["linea_id"].to_numpy()[codigo_viaje],
+            "direccion": grafo.lineas["direccion"].map({"N": 1, "S": 0}).to_numpy()[codigo_viaje],
+            "parada_id": grafo.paradas[grafo.parada[posiciones]],
+            "stop_sequence": grafo.stop_sequence[posiciones],
+            "segundos_hasta": segundos_hasta[dentro],
+            "retraso_actual": self.retraso[fila],
+            "retraso_proyectado": retraso_proyectado[dentro],
+        })
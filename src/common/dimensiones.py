@@ -0,0 +1,146 @@
+"""
+Dimensiones de identificadores: paradas (stop_id / parada_id) y líneas
+(route_id / linea_id).
+
+Los identificadores se repiten millones de veces al día, así que en memoria
+y en Parquet se guardan como categóricos (diccionario + códigos enteros).
+Dentro de un proceso, todos los DataFrames codifican paradas y líneas sobre
+el mismo vocabulario, que sólo crece por el final, de modo que concat, merge
+y groupby trabajan directamente sobre los códigos.
+
+El vocabulario vive sólo en memoria: los códigos son locales a cada proceso
+(shards del tiempo real, trabajadores del backfill) y a cada fichero. Entre
+ficheros los identificadores se comparan por su valor: el Parquet guarda el
+diccionario con los textos y, al leerlos, basta con volver a codificarlos
+(codificar_paradas / codificar_lineas) o con alinear_categorias/concatenar.
+
+Identificadores de alta cardinalidad que cambian cada día (match_key,
+trip_uid, viaje_id) no usan dimensión: basta con un categórico por
+DataFrame, y alinear_categorias cuando dos tablas se cruzan por ellos.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+class Dimension:
+    """
+    Vocabulario de un identificador en el proceso. codificar() convierte
+    cualquier columna en un categórico con todas las categorías de la
+    dimensión, dando de alta los valores nuevos.
+    """
+
+    def __init__(self, nombre: str, columna: str):
+        self.nombre = nombre
+        self.columna = columna
+        self._lock = threading.Lock()
+        self._fijar(pd.Index([], dtype=object))
+
+    def _fijar(self, valores: pd.Index) -> None:
+        self.valores = valores
+        self.tipo = pd.CategoricalDtype(valores)
+
+    def __len__(self):
+        return len(self.valores)
+
+    def codificar(self, valores) -> pd.Series:
+        """Devuelve `valores` como categórico sobre el vocabulario del proceso"""
+        serie = valores if isinstance(valores, pd.Series) else pd.Series(valores)
+        unicos = serie.cat.categories if isinstance(serie.dtype, pd.CategoricalDtype) else pd.Index(serie.dropna().unique())
+
+        nuevos = unicos[self.valores.get_indexer(unicos) < 0]
+        if len(nuevos):
+            self.ampliar(nuevos)
+
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            # Sólo se recodifican los códigos, sin tocar los textos de cada fila
+            return serie.cat.set_categories(self.valores)
+        return serie.astype(self.tipo)
+
+    def ampliar(self, nuevos) -> None:
+        with self._lock:
+            nuevos = pd.Index(nuevos, dtype=object)
+            nuevos = nuevos[self.valores.get_indexer(nuevos) < 0].unique()
+            if not len(nuevos):
+                return
+            self._fijar(self.valores.append(nuevos))
+
+    def tabla(self) -> pd.DataFrame:
+        """Vocabulario actual (codigo, valor); los códigos sólo valen en este proceso"""
+        return pd.DataFrame({"codigo": np.arange(len(self.valores), dtype=np.int32), self.columna: self.valores})
+
+
+_DIMENSIONES = {}
+
+
+def dimension(nombre: str, columna: str) -> Dimension:
+    if nombre not in _DIMENSIONES:
+        _DIMENSIONES[nombre] = Dimension(nombre, columna)
+    return _DIMENSIONES[nombre]
+
+
+def codificar_paradas(valores) -> pd.Series:
+    return dimension("paradas", "stop_id").codificar(valores)
+
+
+def codificar_lineas(valores) -> pd.Series:
+    return dimension("lineas", "route_id").codificar(valores)
+
+
+def tabla_paradas() -> pd.DataFrame:
+    """
+    Dimensión de paradas con atributos derivados del stop_id: la parada
+    física (sin sufijo N/S) y la dirección (N=1, S=0)
+    """
+    tabla = dimension("paradas", "stop_id").tabla()
+    ids = tabla["stop_id"].astype("string")
+    sufijo = ids.str[-1]
+    tabla["parada_padre"] = ids.where(~sufijo.isin(["N", "S"]), ids.str[:-1])
+    tabla["direccion"] = sufijo.map({"N": 1, "S": 0}).astype("Int8")
+    return tabla
+
+
+def tabla_lineas() -> pd.DataFrame:
+    return dimension("lineas", "route_id").tabla()
+
+
+def alinear_categorias(*series: pd.Series):
+    """
+    Convierte varias columnas en categóricos con las mismas categorías, para
+    que un merge entre ellas compare códigos enteros y no textos
+    """
+    categoricas = [s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype("category") for s in series]
+    categorias = union_categoricals([s.array for s in categoricas], ignore_order=True).categories
+    return tuple(s.cat.set_categories(categorias) for s in categoricas)
+
+
+def concatenar(frames) -> pd.DataFrame:
+    """
+    pd.concat que mantiene como categóricas las columnas categóricas aunque
+    cada DataFrame tenga categorías distintas (pd.concat las pasaría a texto)
+    """
+    frames = list(frames)
+    if not frames:
+        return pd.DataFrame()
+    frames = [df.copy(deep=False) for df in frames]
+    for columna, tipo in frames[0].dtypes.items():
+        if isinstance(tipo, pd.CategoricalDtype):
+            for df, alineada in zip(frames, alinear_categorias(*(df[columna] for df in frames))):
+                df[columna] = alineada
+    return pd.concat(frames, ignore_index=True)
+
+
+def indexar(indice: pd.Index, valores) -> np.ndarray:
+    """
+    indice.get_indexer(valores), buscando sólo las categorías cuando
+    `valores` es categórico (cientos de búsquedas en lugar de una por fila)
+    """
+    if isinstance(getattr(valores, "dtype", None), pd.CategoricalDtype):
+        valores = pd.Categorical(valores)
+        # El código -1 (nulo) cae en el -1 añadido al final
+        posiciones = np.append(indice.get_indexer(valores.categories), -1)
+        return posiciones[valores.codes]
+    return indice.get_indexer(valores)
@@ -0,0 +1,35 @@
+"""
+Escritura atómica de ficheros locales (cachés, estado, métricas).
+
+Se escribe en un temporal del mismo directorio y al final se renombra con
+os.replace, así que quien lee el fichero ve siempre la versión anterior
+completa o la nueva completa, nunca una a medias, aunque varios procesos lo
+escriban a la vez.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+
+def escribir_atomico(ruta, escribir, sufijo: str = "") -> None:
+    """
+    Llama a escribir(tmp) con la ruta de un temporal junto a `ruta` y lo
+    renombra a `ruta`. Si escribir falla, el temporal se borra y `ruta` no
+    cambia. `sufijo` es la extensión del temporal, para los escritores que
+    la añaden si falta (np.savez con .npz).
+    """
+    ruta = Path(ruta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=ruta.parent, prefix=f".{ruta.name}.", suffix=sufijo)
+    os.close(fd)
+    try:
+        escribir(tmp)
+        os.replace(tmp, ruta)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def escribir_texto_atomico(ruta, texto: str) -> None:
+    escribir_atomico(ruta, lambda tmp: Path(tmp).write_text(texto, encoding="utf-8"))
@@ -0,0 +1,67 @@
+"""
+Reprocesado idempotente de etapas por día.
+
+Cada día que escribe una etapa guarda en los metadatos de sus objetos de
+salida (x-amz-meta-huella) una huella de lo que lo produjo:
+    - las entradas: etag y tamaño de los objetos leídos de MinIO, o
+      ETag/tamaño/fecha de la fuente externa, o la versión del estático...
+    - la versión del código de la etapa: hash de los ficheros fuente de
+      todos los módulos que determinan su salida (la etapa y los módulos
+      comunes que usa, p. ej. dimensiones o tiempos).
+
+Al volver a lanzar un rango, un día se salta si todas sus salidas existen y
+llevan la huella que se calcularía ahora. Si cambia una entrada o el código,
+o falta alguna salida (un fallo a medias), el día se recalcula.
+
+Con FORZAR_REPROCESO=1 no se salta ningún día.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Optional
+
+from src.common.minio_client import stat_object
+
+
+CLAVE_HUELLA = "huella"
+FORZAR = os.getenv("FORZAR_REPROCESO", "0").lower() in ("1", "true", "si", "sí")
+
+
+def version_codigo(*rutas: str) -> str:
+    """Hash de los ficheros fuente de una etapa (cambia con cualquier edición)"""
+    h = hashlib.sha256()
+    for ruta in rutas:
+        with open(ruta, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def huella(**entradas) -> str:
+    """Huella de un día a partir de sus entradas (valores serializables a JSON)"""
+    texto = json.dumps(entradas, sort_keys=True, default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:32]
+
+
+def huella_objeto(access_key: str, secret_key: str, object_name: str) -> Optional[Dict[str, object]]:
+    """Identidad de un objeto de entrada en MinIO (etag y tamaño), o None si no existe"""
+    info = stat_object(access_key, secret_key, object_name)
+    if info is None:
+        return None
+    return {"etag": info["etag"], "size": info["size"]}
+
+
+def salidas_actualizadas(access_key: str, secret_key: str, salidas: Iterable[str], huella_actual: str) -> bool:
+    """True si todas las salidas existen y se escribieron con huella_actual"""
+    if FORZAR:
+        return False
+    for object_name in salidas:
+        info = stat_object(access_key, secret_key, object_name)
+        if info is None or info["metadata"].get(CLAVE_HUELLA) != huella_actual:
+            return False
+    return True
+
+
+def metadatos(huella_actual: str) -> Dict[str, str]:
+    """Metadatos de usuario para las subidas de un día"""
+    return {CLAVE_HUELLA: huella_actual}
@@ -29,9 +29,9 @@ Casos de uso:
    upload_df_parquet(access_key, secret_key, object_name, df, 
                         endpoint, bucket)
 
-3) Descargar Parquet como DataFrame:
+3) Descargar Parquet como DataFrame (columns opcional para leer sólo algunas):
    df = download_df_parquet(access_key, secret_key, object_name, 
-                                endpoint, bucket)
+                                endpoint, bucket, columns)
 
 4) Subir / descargar JSON:
    upload_json(access_key, secret_key, object_name, data, 
@@ -40,15 +40,20 @@ Casos de uso:
    data = download_json(access_key, secret_key, object_name, 
                         endpoint, bucket)
 
+5) Metadatos de usuario: las subidas admiten metadata={clave: valor} y
+   stat_object devuelve etag, tamaño y esos metadatos (None si no existe):
+   info = stat_object(access_key, secret_key, object_name, endpoint, bucket)
+
 Nota: para Parquet necesitas tener instalado 'pyarrow'
 '''
 
 import io
 import json
-from typing import Any
+from typing import Any, Dict, List, Optional
 
 import pandas as pd
 from minio import Minio
+from minio.error import S3Error
 
 DEFAULT_ENDPOINT = "minio.fdi.ucm.es"
 DEFAULT_BUCKET = "pd1"
@@ -66,11 +71,12 @@ def upload_file(
     object_name: str,
     file_path: str,
     endpoint: str = DEFAULT_ENDPOINT,
-    bucket: str = DEFAULT_BUCKET
+    bucket: str = DEFAULT_BUCKET,
+    metadata: Optional[Dict[str, str]] = None
 ) -> None:
     """Subir un archivo local a MinIO con ruta object_name"""
     c = _client(access_key, secret_key, endpoint)
-    c.fput_object(bucket, object_name, file_path)
+    c.fput_object(bucket, object_name, file_path, metadata=metadata)
 
 
 def download_file(
@@ -94,14 +100,15 @@ def upload_df_parquet(
     object_name: str,
     df: pd.DataFrame,
     endpoint: str = DEFAULT_ENDPOINT,
-    bucket: str = DEFAULT_BUCKET
+    bucket: str = DEFAULT_BUCKET,
+    metadata: Optional[Dict[str, str]] = None
 ) -> None:
     """Subir un pandas Dataframe como objeto parquet"""
     c = _client(access_key, secret_key, endpoint)
     buf = io.BytesIO()
     df.to_parquet(buf, index=False)
     buf.seek(0)
-    c.put_object(bucket, object_name, buf, length=buf.getbuffer().nbytes)
+    c.put_object(bucket, object_name, buf, length=buf.getbuffer().nbytes, metadata=metadata)
 
 
 def download_df_parquet(
@@ -109,9 +116,10 @@ def download_df_parquet(
     secret_key: str,
     object_name: str,
     endpoint: str = DEFAULT_ENDPOINT,
-    bucket: str = DEFAULT_BUCKET
+    bucket: str = DEFAULT_BUCKET,
+    columns: Optional[List[str]] = None
 ) -> pd.DataFrame:
-    """Descargar un archivo parquet como pandas Dataframe"""
+    """Descargar un archivo parquet como pandas Dataframe (opcionalmente sólo algunas columnas)"""
     c = _client(access_key, secret_key, endpoint)
     resp = c.get_object(bucket, object_name)
     try:
@@ -119,7 +127,7 @@ def download_df_parquet(
     finally:
         resp.close()
         resp.release_conn()
-    return pd.read_parquet(io.BytesIO(data))
+    return pd.read_parquet(io.BytesIO(data), columns=columns)
 
 
 # JSON (upload/download)
@@ -130,13 +138,14 @@ def upload_json(
     object_name: str,
     data: Any,
     endpoint: str = DEFAULT_ENDPOINT,
-    bucket: str = DEFAULT_BUCKET
+    bucket: str = DEFAULT_BUCKET,
+    metadata: Optional[Dict[str, str]] = None
 ) -> None:
     """Subir un objeto de Python como JSON"""
     c = _client(access_key, secret_key, endpoint)
     raw = json.dumps(data, ensure_ascii=False).encode("utf-8")
     buf = io.BytesIO(raw)
-    c.put_object(bucket, object_name, buf, length=len(raw))
+    c.put_object(bucket, object_name, buf, length=len(raw), metadata=metadata)
 
 
 def download_json(
@@ -155,3 +164,29 @@ def download_json(
         resp.close()
         resp.release_conn()
     return json.loads(raw.decode("utf-8"))
+
+
+# Metadatos de objetos
+
+def stat_object(
+    access_key: str,
+    secret_key: str,
+    object_name: str,
+    endpoint: str = DEFAULT_ENDPOINT,
+    bucket: str = DEFAULT_BUCKET
+) -> Optional[Dict[str, Any]]:
+    """etag, size y metadatos de usuario (sin el prefijo x-amz-meta-) de un objeto, o None si no existe"""
+    c = _client(access_key, secret_key, endpoint)
+    try:
+        st = c.stat_object(bucket, object_name)
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchObject", "ResourceNotFound"):
+            return None
+        raise
+    prefijo = "x-amz-meta-"
+    metadata = {
+        k.lower()[len(prefijo):]: v
+        for k, v in (st.metadata or {}).items()
+        if k.lower().startswith(prefijo)
+    }
+    return {"etag": st.etag, "size": st.size, "metadata": metadata}
@@ -0,0 +1,103 @@
+"""
+Utilidades vectorizadas para tiempos GTFS.
+
+Todas las funciones trabajan sobre columnas completas (Series o arrays de
+NumPy) en lugar de aplicar funciones de Python fila a fila.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+SEGUNDOS_DIA = 86400
+
+
+def hora_gtfs_a_segundos(horas) -> np.ndarray:
+    """
+    Convierte horas GTFS "HH:MM:SS" (o "H:MM:SS") a segundos desde la
+    medianoche del día de servicio. Admite horas >= 24 (viajes que terminan
+    después de medianoche). Los nulos y los valores que no tienen ese
+    formato se devuelven como NaN.
+
+    Si `horas` es categórico sólo se convierten las categorías (como mucho
+    una por segundo del día) y el resultado se expande con los códigos.
+    """
+    if isinstance(getattr(horas, "dtype", None), pd.CategoricalDtype):
+        horas = pd.Categorical(horas)
+        # El código -1 (nulo) cae en el NaN añadido al final
+        return np.append(hora_gtfs_a_segundos(horas.categories), np.nan)[horas.codes]
+
+    horas = pd.Series(horas, copy=False)
+    validas = horas.notna().to_numpy()
+    segundos = np.full(len(horas), np.nan)
+    if not validas.any():
+        return segundos
+
+    # Con un ancho fijo de 8 caracteres cada dígito está siempre en la misma
+    # posición y se puede leer como código de carácter sin partir el string
+    # (se lee un noveno carácter sólo para descartar los textos más largos)
+    texto = horas[validas].astype(str).str.zfill(8).to_numpy().astype("U9")
+    d = texto.view(np.uint32).reshape(-1, 9).astype(np.int64) - ord("0")
+
+    # Formato DD:DD:DD: dígitos en 0,1,3,4,6,7 y ":" en 2 y 5
+    digitos = d[:, [0, 1, 3, 4, 6, 7]]
+    formato = (
+        (d[:, 8] == -ord("0"))
+        & ((digitos >= 0) & (digitos <= 9)).all(axis=1)
+        & (d[:, [2, 5]] == ord(":") - ord("0")).all(axis=1)
+    )
+
+    valores = (
+        (d[:, 0] * 10 + d[:, 1]) * 3600
+        + (d[:, 3] * 10 + d[:, 4]) * 60
+        + d[:, 6] * 10 + d[:, 7]
+    )
+    segundos[validas] = np.where(formato, valores, np.nan)
+    return segundos
+
+
+def segundos_a_hora(segundos) -> np.ndarray:
+    """
+    Formatea segundos desde medianoche como "HH:MM:SS" (módulo 24 h). Los
+    nulos se devuelven como None.
+    """
+    segundos = np.asarray(segundos, dtype="float64")
+    validos = ~np.isnan(segundos)
+    s = segundos[validos].astype(np.int64) % SEGUNDOS_DIA
+
+    # Se escriben los 8 caracteres de cada hora como bytes y se decodifican
+    # todos juntos
+    d = np.empty((len(s), 8), dtype=np.uint8)
+    for col, valor in ((0, s // 3600), (3, s % 3600 // 60), (6, s % 60)):
+        d[:, col] = valor // 10 + ord("0")
+        d[:, col + 1] = valor % 10 + ord("0")
+    d[:, [2, 5]] = ord(":")
+
+    horas = np.full(len(segundos), None, dtype=object)
+    horas[validos] = d.view("S8").ravel().astype(str)
+    return horas
+
+
+def epoch_a_hora_local(epochs, tz="America/New_York"):
+    """
+    Convierte epochs (segundos UTC) a hora local de `tz` de forma vectorizada.
+
+    Devuelve dos arrays float64 (NaN para nulos):
+      - segundos desde la medianoche local
+      - día de la semana local (lunes=0 ... domingo=6)
+
+    El desfase de cada instante lo resuelve tz_convert, así que los cambios
+    de horario (DST) quedan bien aunque el rango cruce uno.
+    """
+    fechas = pd.to_datetime(pd.Series(epochs, copy=False), unit="s", utc=True)
+    nulos = fechas.isna().to_numpy()
+
+    # Hora de pared local expresada como segundos desde 1970-01-01 local
+    local = fechas.dt.tz_convert(tz).dt.tz_localize(None).to_numpy().astype("datetime64[s]").astype(np.int64)
+
+    segundos = (local % SEGUNDOS_DIA).astype("float64")
+    # 1970-01-01 fue jueves (3)
+    dia_semana = ((local // SEGUNDOS_DIA + 3) % 7).astype("float64")
+    segundos[nulos] = np.nan
+    dia_semana[nulos] = np.nan
+    return segundos, dia_semana
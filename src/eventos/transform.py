@@ -4,6 +4,7 @@ import os
 import sys
 
 
+from src.common.idempotencia import huella, huella_objeto, metadatos, salidas_actualizadas, version_codigo
 from src.common.minio_client import (
     download_df_parquet,
     upload_df_parquet,
@@ -14,6 +15,9 @@ from datetime import date, timedelta
 
 IDS = ["eventos", "eventos_deporte", "eventos_concierto"]
 
+# Los días ya transformados con la misma entrada y el mismo código se saltan
+VERSION_CODIGO = version_codigo(__file__)
+
 
 def iterate_dates(start, end):
     """Itera fechas (start y end inclusive)"""
@@ -51,7 +55,14 @@ def transform_gtfs_processed_range_to_cleaned(start, end, access_key, secret_key
         day = d.strftime("%Y-%m-%d")
 
         in_obj = build_processed_object(day)
+
         try:
+            entrada = huella_objeto(access_key, secret_key, in_obj)
+            huella_dia = huella(entrada=entrada, codigo=VERSION_CODIGO)
+            if entrada is not None and salidas_actualizadas(access_key, secret_key, [build_cleaned_object(day)], huella_dia):
+                print(f"  {day}: salida al día, saltando...")
+                continue
+
             df = download_df_parquet(access_key, secret_key, in_obj)
             print(f"  encontrado: {in_obj}")
         except Exception:
@@ -92,7 +103,7 @@ def transform_gtfs_processed_range_to_cleaned(start, end, access_key, secret_key
         df = df.drop(columns=["paradas_afectadas"])
 
         out_obj = build_cleaned_object(day)
-        upload_df_parquet(access_key, secret_key, out_obj, df)
+        upload_df_parquet(access_key, secret_key, out_obj, df, metadata=metadatos(huella_dia))
         print(f"Subido: {out_obj} ({len(df)} filas)")
 
 
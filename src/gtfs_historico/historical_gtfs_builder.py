@@ -2,11 +2,18 @@ import os
 import requests
 import zipfile
 import pandas as pd
-import numpy as np
-from datetime import datetime
-import pytz
 import tarfile
 import shutil
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.common.dimensiones import alinear_categorias, codificar_lineas, codificar_paradas
+from src.common.ficheros import escribir_atomico
+from src.common.minio_client import download_file, upload_file
+from src.common.tiempos import epoch_a_hora_local, hora_gtfs_a_segundos
+from src.gtfs_historico.lectura_csv import leer_csv, leer_csv_pandas
+from src.gtfs_historico.mobility_database import default_client
 
 # Descarga de datos realtime
 def download_realtime_data(target_date):
@@ -49,68 +56,84 @@ def download_realtime_data(target_date):
         
     return trips_file, stops_file
 
-# Descarga de datos static
-def download_static_data(target_date):
+
+# Miembros del .tar.xz de subwaydata.nyc y su esquema de lectura (lectura_csv.py)
+REALTIME_MEMBERS = {"trips": "rt_trips", "stop_times": "rt_stop_times"}
+
+
+def realtime_url(target_date):
+    return f"https://subwaydata.nyc/data/subwaydatanyc_{target_date}_csv.tar.xz"
+
+
+def realtime_source_fingerprint(target_date):
     """
-    1. Obtiene un access_token usando el refresh_token.
-    2. Consulta la API de Mobility Database autenticada para buscar el estático.
-    3. Descarga el ZIP y extrae trips.txt y stop_times.txt.
+    Identidad del .tar.xz del día según el servidor (ETag, Content-Length y
+    Last-Modified de un HEAD), sin descargarlo. None si no se puede saber.
     """
+    try:
+        response = requests.head(realtime_url(target_date), allow_redirects=True, timeout=30)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    fingerprint = {k: response.headers.get(k) for k in ("ETag", "Content-Length", "Last-Modified")}
+    return fingerprint if any(fingerprint.values()) else None
 
-    # OBTENER EL ACCESS TOKEN
-    refresh_token = os.getenv("MOBILITY_DATABASE_REFRESH_TOKEN")
-    assert refresh_token is not None, "La variable de entorno MOBILITY_DATABASE_REFRESH_TOKEN no está definida."
-    print("Autenticando con Mobility Database...")
-    token_url = 'https://api.mobilitydatabase.org/v1/tokens'
-    token_payload = { "refresh_token": refresh_token }
 
-    token_response = requests.post(token_url, json=token_payload)
+def stream_realtime_data(target_date):
+    """
+    Versión en streaming de download_realtime_data: descomprime el .tar.xz
+    a medida que se descarga y lee los CSV de trips y stop_times
+    directamente a tablas Arrow, sin escribir nada en disco.
 
-    if token_response.status_code != 200:
-        raise Exception(f"Fallo al obtener el access_token. HTTP {token_response.status_code}: {token_response.text}")
-        
-    # Extraemos el access token de la respuesta JSON
-    access_token = token_response.json().get("access_token")
-    
-   # CONSULTAR LA API CON EL TOKEN
-    target_dt = datetime.strptime(target_date, "%Y-%m-%d")
-    api_url = "https://api.mobilitydatabase.org/v1/gtfs_feeds/mdb-511/datasets"
-
-    # Añadimos el Access Token a las cabeceras (Headers)
-    headers = {
-        "Accept": "application/json",
-        "Authorization": f"Bearer {access_token}"
-    }
-
-    print(f"Consultando API Mobility Database para fecha: {target_date}...")
-    # Pasamos los headers en la petición GET
-    response = requests.get(api_url, headers=headers)
-    
-    if response.status_code == 401:
-        raise Exception("Error 401 No Autorizado: El Access Token es inválido o el Refresh Token ha expirado/es incorrecto.")
+    Devuelve (trips, stop_times) como pa.Table.
+    """
+    tar_filename = f"subwaydatanyc_{target_date}_csv.tar.xz"
+    url = realtime_url(target_date)
+
+    print(f"Descargando Realtime (streaming): {url}...")
+
+    response = requests.get(url, stream=True)
+    if response.status_code == 404:
+        raise Exception(f"Error 404: El archivo {tar_filename} no está disponible para esta fecha. Verifica la URL.")
     response.raise_for_status()
+    # Por si el servidor aplica Content-Encoding sobre el propio .tar.xz
+    response.raw.decode_content = True
 
-    # BUSCAR Y DESCARGAR EL ARCHIVO
-    datasets = response.json()
+    tablas = {}
+    with response, tarfile.open(fileobj=response.raw, mode="r|xz") as tar:
+        # Modo "r|": los miembros se recorren en orden, leyendo el stream una sola vez
+        for member in tar:
+            for nombre, tipo in REALTIME_MEMBERS.items():
+                if member.isfile() and member.name.endswith(f"_{target_date}_{nombre}.csv"):
+                    tablas[nombre] = leer_csv(tar.extractfile(member), tipo)
 
-    # Filtrar para encontrar el dataset publicado justo ANTES o EN nuestra fecha
-    valid_datasets = []
-    for ds in datasets:
-        # Extraemos la fecha de publicación (downloaded_at)
-        extracted_dt = datetime.strptime(ds['downloaded_at'][:10], "%Y-%m-%d")
-        if extracted_dt <= target_dt:
-            valid_datasets.append((extracted_dt, ds['hosted_url']))
-            
-    if not valid_datasets:
-        raise ValueError(f"No se encontró un GTFS estático anterior a {target_date}.")
-    
-    # Ordenar descendente para coger la versión más reciente válida
-    valid_datasets.sort(key=lambda x: x[0], reverse=True)
-    best_url = valid_datasets[0][1]
-    best_date_str = valid_datasets[0][0].strftime("%Y-%m-%d")
+    if set(tablas) != set(REALTIME_MEMBERS):
+        raise FileNotFoundError("Los CSVs esperados no se encontraron en el archivo descargado.")
+
+    return tablas["trips"], tablas["stop_times"]
+
+# Descarga de datos static
+def resolve_static_version(target_date, client=None):
+    """
+    Busca en Mobility Database el estático publicado justo antes o en
+    target_date. Con el mismo client, el token y el listado de datasets se
+    reutilizan entre días (ver mobility_database.py).
+
+    Devuelve la versión como diccionario: id (del dataset), date y url.
+    """
+    client = client if client is not None else default_client()
+    return client.resolve(target_date)
+
+
+def download_static_version(version):
+    """
+    Descarga el ZIP de una versión del estático (resolve_static_version) y
+    extrae trips.txt y stop_times.txt.
+    """
+    best_url = version["url"]
+    best_date_str = version["date"]
 
-    print(f"Feed estático seleccionado: Versión extraída el {best_date_str}")
-    
     zip_filename = f"static_mta_{best_date_str}.zip"
     if not os.path.exists(zip_filename):
         print(f"Descargando ZIP estático desde {best_url}...")
@@ -141,20 +164,123 @@ def download_static_data(target_date):
         
     return os.path.join(extract_dir, 'trips.txt'), os.path.join(extract_dir, 'stop_times.txt')
 
+
+def download_static_data(target_date, client=None):
+    """
+    Busca en Mobility Database el estático vigente en target_date, descarga
+    el ZIP y extrae trips.txt y stop_times.txt.
+    """
+    return download_static_version(resolve_static_version(target_date, client))
+
+
+# Caché de versiones del estático
+#
+# El estático cambia cada pocas semanas, así que static_merged (match_key,
+# stop_id, scheduled_seconds, route_id) se prepara una vez por versión y se
+# reutiliza en todos los días que la usan: en memoria dentro del proceso, en
+# disco local y en MinIO para otras máquinas/ejecuciones.
+DIR_STATIC_CACHE = "data/cache/gtfs_static"
+STATIC_COLUMNS = ['match_key', 'stop_id', 'scheduled_seconds', 'route_id']
+
+# Última versión usada en este proceso (un backfill recorre los días en orden)
+_STATIC_IN_MEMORY = {}
+
+
+def build_static_object(version_id):
+    return f"grupo5/processed/gtfs_static/version={version_id}/static_merged.parquet"
+
+
+def _read_static_cache(path):
+    static_merged = pd.read_parquet(path)
+    # Los códigos del Parquet son los del proceso que lo escribió: se recodifican
+    static_merged['stop_id'] = codificar_paradas(static_merged['stop_id'])
+    static_merged['route_id'] = codificar_lineas(static_merged['route_id'])
+    return static_merged
+
+
+def _write_static_cache(static_merged, path):
+    # Escritura atómica: varios procesos pueden compartir la caché
+    escribir_atomico(path, lambda tmp: static_merged.to_parquet(tmp, index=False))
+
+
+def load_static_merged(target_date, access_key=None, secret_key=None, cache_dir=DIR_STATIC_CACHE, client=None):
+    """
+    static_merged de la versión del estático vigente en target_date. Se busca
+    en este orden: memoria, caché local (cache_dir), MinIO (si se pasan
+    credenciales) y, si no está en ninguna, se descarga el ZIP, se prepara y
+    se guarda en la caché local y en MinIO.
+    """
+    version = resolve_static_version(target_date, client)
+    version_id = version["id"]
+    if version_id in _STATIC_IN_MEMORY:
+        print(f"Estático {version_id} reutilizado de memoria.")
+        return _STATIC_IN_MEMORY[version_id]
+
+    safe_id = str(version_id).replace("/", "_")
+    local_path = os.path.join(cache_dir, f"static_merged_{safe_id}.parquet")
+    static_merged = None
+
+    if os.path.exists(local_path):
+        print(f"Estático {version_id} leído de la caché local.")
+        static_merged = _read_static_cache(local_path)
+
+    elif access_key is not None and secret_key is not None:
+        try:
+            escribir_atomico(local_path, lambda tmp: download_file(access_key, secret_key, build_static_object(safe_id), tmp))
+            print(f"Estático {version_id} descargado de la caché en MinIO.")
+            static_merged = _read_static_cache(local_path)
+        except Exception as e:
+            # Versión aún no preparada en MinIO (o MinIO no disponible): se construye
+            print(f"Estático {version_id} no disponible en MinIO ({type(e).__name__}).")
+
+    if static_merged is None:
+        st_trips, st_stops = download_static_version(version)
+        try:
+            static_merged = build_static_merged(st_trips, st_stops)
+        finally:
+            # Borrar la carpeta estática entera (con los txt dentro)
+            static_dir = os.path.dirname(st_trips)
+            if os.path.exists(static_dir):
+                shutil.rmtree(static_dir)
+
+        _write_static_cache(static_merged, local_path)
+        if access_key is not None and secret_key is not None:
+            upload_file(access_key, secret_key, build_static_object(safe_id), local_path)
+            print(f"Estático {version_id} guardado en MinIO: {build_static_object(safe_id)}")
+
+    _STATIC_IN_MEMORY.clear()
+    _STATIC_IN_MEMORY[version_id] = static_merged
+    return static_merged
+
 # 3. PROCESAMIENTO Y CRUCE
-def build_delay_datalake(static_trips_path, static_stops_path, rt_trips_path, rt_stops_path):
-    # 1. Load Data
-    df_static_trips = pd.read_csv(static_trips_path)
-    df_static_st = pd.read_csv(static_stops_path)
-    
-    df_rt_trips = pd.read_csv(rt_trips_path)
-    df_rt_st = pd.read_csv(rt_stops_path)
+def _leer_tabla(origen, tipo):
+    """CSV en disco (ruta) o tabla Arrow ya leída (stream_realtime_data) a DataFrame"""
+    if isinstance(origen, pa.Table):
+        # Las columnas diccionario llegan a pandas como categóricas
+        return origen.to_pandas()
+    return leer_csv_pandas(origen, tipo)
+
+
+def build_static_merged(static_trips_path, static_stops_path):
+    """
+    Prepara el estático para el cruce: una fila por (viaje, parada) con
+    match_key, stop_id, scheduled_seconds y route_id.
+    """
+    # Sólo las columnas usadas, con tipo declarado (lectura_csv.py). Los
+    # identificadores se leen como categóricos: se repiten millones de veces
+    # y así los merges comparan códigos enteros en lugar de textos
+    df_static_trips = leer_csv_pandas(static_trips_path, 'static_trips')
+    df_static_st = leer_csv_pandas(static_stops_path, 'static_stop_times')
+
+    df_static_st['stop_id'] = codificar_paradas(df_static_st['stop_id'])
+    df_static_trips['route_id'] = codificar_lineas(df_static_trips['route_id'])
 
     # Prepare Static Data
     # 
     # Extract the matching key from static trip_id 
     # Example: "SIR-FA2017-SI017-Weekday-08_147100_SI..N03R" -> "147100_SI..N03R"
-    df_static_trips['match_key'] = df_static_trips['trip_id'].str.extract(r'_(\d{6}_.*)$')
+    df_static_trips['match_key'] = df_static_trips['trip_id'].str.extract(r'_(\d{6}_.*)$')[0].astype('category')
+    df_static_st['trip_id'], df_static_trips['trip_id'] = alinear_categorias(df_static_st['trip_id'], df_static_trips['trip_id'])
     
     # Merge static trips and stop_times
     static_merged = pd.merge(
@@ -163,35 +289,53 @@ def build_delay_datalake(static_trips_path, static_stops_path, rt_trips_path, rt
         on='trip_id'
     )
 
-    # Function to convert GTFS string time "HH:MM:SS" to total seconds
-    def gtfs_time_to_seconds(t):
-        if pd.isna(t): return np.nan
-        h, m, s = map(int, str(t).split(':'))
-        return h * 3600 + m * 60 + s
+    # Calculate scheduled seconds past midnight: "HH:MM:SS" (horas >= 24 incluidas)
+    # convertido sobre toda la columna, sin partir cada string en Python
+    static_merged['scheduled_seconds'] = hora_gtfs_a_segundos(static_merged['arrival_time'])
 
-    # Calculate scheduled seconds past midnight
-    static_merged['scheduled_seconds'] = static_merged['arrival_time'].apply(gtfs_time_to_seconds)
+    return static_merged[STATIC_COLUMNS]
+
+
+def build_delay_datalake(static_trips_path, static_stops_path, rt_trips_path, rt_stops_path):
+    """Cruce completo a partir de los ficheros del estático (sin caché)"""
+    return join_realtime_delays(build_static_merged(static_trips_path, static_stops_path), rt_trips_path, rt_stops_path)
+
+
+def _load_realtime(static_merged, rt_trips_path, rt_stops_path):
+    """
+    Lee los datos realtime del día y alinea sus categorías con static_merged.
+    Devuelve (static_merged, df_rt_trips, df_rt_st) listos para cruzar.
+    """
+    # 1. Load Data
+    df_rt_trips = _leer_tabla(rt_trips_path, 'rt_trips')
+    df_rt_st = _leer_tabla(rt_stops_path, 'rt_stop_times')
+
+    # Paradas sobre la dimensión del proceso; las claves de viaje, con las
+    # mismas categorías a ambos lados de cada merge
+    df_rt_st['stop_id'] = codificar_paradas(df_rt_st['stop_id'])
+    df_rt_st['trip_uid'], df_rt_trips['trip_uid'] = alinear_categorias(df_rt_st['trip_uid'], df_rt_trips['trip_uid'])
+    static_merged = static_merged.copy(deep=False)
+    static_merged['stop_id'] = codificar_paradas(static_merged['stop_id'])
 
-    # Prepare Realtime Data
-    # 
     # In subwaydatanyc datasets, the 'trip_id' column in trips.csv IS the match key
+    df_rt_trips = df_rt_trips.rename(columns={'trip_id': 'match_key'})
+    df_rt_trips['match_key'], static_merged['match_key'] = alinear_categorias(df_rt_trips['match_key'], static_merged['match_key'])
+    return static_merged, df_rt_trips, df_rt_st
+
+
+def _compute_delays(static_merged, df_rt_trips, df_rt_st):
+    """Cruce y cálculo de retrasos (el día entero o una partición)"""
+    # Prepare Realtime Data
     rt_merged = pd.merge(
         df_rt_st, 
-        df_rt_trips[['trip_uid', 'trip_id']], 
+        df_rt_trips[['trip_uid', 'match_key']], 
         on='trip_uid'
     )
-    # Rename for clarity during join with static
-    rt_merged.rename(columns={'trip_id': 'match_key'}, inplace=True)
 
-    # Function to convert UNIX timestamp to seconds past midnight in Local NYC time
-    nyc_tz = pytz.timezone('America/New_York')
-    def unix_to_seconds_past_midnight(ts):
-        if pd.isna(ts): return np.nan
-        dt = datetime.fromtimestamp(ts, nyc_tz)
-        return dt.hour * 3600 + dt.minute * 60 + dt.second
-
-    # Calculate actual seconds past midnight
-    rt_merged['actual_seconds'] = rt_merged['arrival_time'].apply(unix_to_seconds_past_midnight)
+    # Calculate actual seconds past midnight in Local NYC time: tz_convert sobre
+    # toda la columna aplica a cada epoch su desfase (EST/EDT), así que los
+    # días con cambio de hora quedan bien
+    rt_merged['actual_seconds'], _ = epoch_a_hora_local(rt_merged['arrival_time'], tz='America/New_York')
 
     # Join and Calculate Delay
     # 
@@ -235,34 +379,109 @@ def build_delay_datalake(static_trips_path, static_stops_path, rt_trips_path, rt
     return datalake_ready_df
 
 
-def process_mta_date(target_date):
+def join_realtime_delays(static_merged, rt_trips_path, rt_stops_path):
+    """
+    Cruza los tiempos reales del día con static_merged (build_static_merged
+    o load_static_merged) y calcula los retrasos. Los datos realtime pueden
+    ser rutas a los CSV o las tablas de stream_realtime_data.
+    """
+    return _compute_delays(*_load_realtime(static_merged, rt_trips_path, rt_stops_path))
+
+
+def _match_key_partition(match_key, partitions):
+    """
+    Partición de cada fila según el hash de su match_key. El hash se calcula
+    sólo sobre las categorías, así que una misma clave cae en la misma
+    partición en el estático y en el realtime. Las claves nulas van a la 0.
+    """
+    categorias = match_key.cat.categories
+    por_categoria = pd.util.hash_array(categorias.to_numpy(dtype=object)) % partitions
+    return np.append(por_categoria, 0)[match_key.cat.codes.to_numpy()].astype(np.int64)
+
+
+def join_realtime_delays_partitioned(static_merged, rt_trips_path, rt_stops_path, output_file, partitions=16):
+    """
+    Igual que join_realtime_delays pero por particiones de match_key: ambos
+    lados se reparten por hash de match_key y cada partición se cruza y se
+    escribe como row group(s) en un único Parquet (output_file), de modo que
+    los merges intermedios nunca contienen el día entero.
+
+    El resultado contiene las mismas filas que join_realtime_delays, en otro
+    orden. Devuelve el número de filas escritas.
+    """
+    static_merged, df_rt_trips, df_rt_st = _load_realtime(static_merged, rt_trips_path, rt_stops_path)
+
+    static_part = _match_key_partition(static_merged['match_key'], partitions)
+    trips_part = _match_key_partition(df_rt_trips['match_key'], partitions)
+    # Cada parada realtime hereda la partición de su viaje (trip_uid -> match_key)
+    por_uid = np.zeros(len(df_rt_st['trip_uid'].cat.categories) + 1, dtype=np.int64)
+    por_uid[df_rt_trips['trip_uid'].cat.codes.to_numpy()] = trips_part
+    st_part = por_uid[df_rt_st['trip_uid'].cat.codes.to_numpy()]
+
+    # Posiciones de cada partición (orden estable) sin copiar los DataFrames
+    static_idx = np.argsort(static_part, kind='stable'), np.bincount(static_part, minlength=partitions)
+    trips_idx = np.argsort(trips_part, kind='stable'), np.bincount(trips_part, minlength=partitions)
+    st_idx = np.argsort(st_part, kind='stable'), np.bincount(st_part, minlength=partitions)
+
+    def partition(df, idx, p):
+        orden, tamaños = idx
+        fin = tamaños[:p + 1].sum()
+        return df.iloc[orden[fin - tamaños[p]:fin]]
+
+    writer = None
+    rows = 0
+    try:
+        for p in range(partitions):
+            part = _compute_delays(partition(static_merged, static_idx, p),
+                                   partition(df_rt_trips, trips_idx, p),
+                                   partition(df_rt_st, st_idx, p))
+            if writer is None:
+                table = pa.Table.from_pandas(part, preserve_index=False)
+                writer = pq.ParquetWriter(output_file, table.schema)
+            else:
+                table = pa.Table.from_pandas(part, schema=writer.schema, preserve_index=False)
+            writer.write_table(table)
+            rows += len(part)
+            del part, table
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+# Particiones de match_key para el cruce con memoria acotada (0 = día entero de una vez)
+PARTITIONS = int(os.getenv("GTFS_DELAYS_PARTITIONS", "0"))
+
+
+def process_mta_date(target_date, access_key=None, secret_key=None, client=None, partitions=PARTITIONS,
+                     cache_dir=DIR_STATIC_CACHE):
     """
     Orquesta la descarga, procesamiento y limpieza para un solo día.
     Devuelve el DataFrame final para que el orquestador lo suba a MinIO.
+
+    El estático se toma de la caché de versiones (load_static_merged); con
+    credenciales de MinIO la caché se comparte en grupo5/processed/gtfs_static/.
+    Un mismo MobilityDatabaseClient (client) sirve para todos los días.
+
+    Con partitions > 0 el cruce se hace por particiones de match_key y se
+    escribe en streaming (join_realtime_delays_partitioned).
     """
-    # Descargar archivos temporales (tiempos teóricos y reales) al disco local
-    rt_trips, rt_stops = download_realtime_data(target_date)
-    st_trips, st_stops = download_static_data(target_date)
-    
-    # Cargar datos en memoria y calcular delays
-    print(f"Procesando cruce de datos para {target_date}...")
-    df_final = build_delay_datalake(st_trips, st_stops, rt_trips, rt_stops)
+    # Tiempos reales en memoria (streaming, sin ficheros) y estático de la caché de versiones
+    rt_trips, rt_stops = stream_realtime_data(target_date)
+    static_merged = load_static_merged(target_date, access_key, secret_key, cache_dir, client)
     
     # Guardar el parquet en una carpeta temporal
     tmp_dir = "tmp"
     os.makedirs(tmp_dir, exist_ok=True)
     output_file = f"{tmp_dir}/mta_delays_{target_date}.parquet"
-    df_final.to_parquet(output_file, engine="pyarrow")
 
-    # Borrar todos los archivos crudos del disco local
-    for f in [rt_trips, rt_stops]:
-        if os.path.exists(f): 
-            os.remove(f)
-    
-    # Borrar la carpeta estática entera (con los txt dentro)
-    static_dir = os.path.dirname(st_trips)
-    if os.path.exists(static_dir): 
-        shutil.rmtree(static_dir)
+    # Cargar datos en memoria y calcular delays
+    print(f"Procesando cruce de datos para {target_date}...")
+    if partitions > 0:
+        join_realtime_delays_partitioned(static_merged, rt_trips, rt_stops, output_file, partitions)
+    else:
+        df_final = join_realtime_delays(static_merged, rt_trips, rt_stops)
+        df_final.to_parquet(output_file, engine="pyarrow")
         
     # Devolvemos la ruta del parquet temporal para que el orquestador lo suba
-    return output_file
\ No newline at end of file
+    return output_file
@@ -2,9 +2,19 @@
 Ejecutar usando -m
 '''
 import os
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import date, timedelta
 from minio import Minio
-from src.gtfs_historico.historical_gtfs_builder import process_mta_date
+from src.common import dimensiones, tiempos
+from src.common.idempotencia import huella, metadatos, salidas_actualizadas, version_codigo
+from src.gtfs_historico import historical_gtfs_builder, lectura_csv, mobility_database
+from src.gtfs_historico.historical_gtfs_builder import (
+    DIR_STATIC_CACHE, load_static_merged, process_mta_date, realtime_source_fingerprint,
+)
+from src.gtfs_historico.mobility_database import MobilityDatabaseClient
 from src.common.minio_client import upload_file, DEFAULT_BUCKET 
 
 # Configuracion MinIO
@@ -15,6 +25,40 @@ assert SECRET_KEY is not None, "La variable de entorno MINIO_SECRET_KEY no está
 
 BUCKET_NAME = DEFAULT_BUCKET
 
+# Procesos para el backfill en paralelo (1 = un día detrás de otro)
+PROCESSES = int(os.getenv("GTFS_BACKFILL_PROCESSES", "1"))
+# Subidas a MinIO simultáneas mientras los procesos siguen con otros días
+UPLOAD_THREADS = 4
+
+# Todos los módulos que determinan el contenido de cada día (ver src/common/idempotencia.py)
+VERSION_CODIGO = version_codigo(
+    __file__, historical_gtfs_builder.__file__, lectura_csv.__file__, mobility_database.__file__,
+    tiempos.__file__, dimensiones.__file__,
+)
+
+
+def build_delays_object(target_date_str):
+    return f"grupo5/processed/gtfs_with_delays/date={target_date_str}/mta_delays_{target_date_str}.parquet"
+
+
+def day_fingerprint(target_date_str, client):
+    """
+    Huella del día: fuente realtime (HEAD del .tar.xz), versión del estático
+    y versión del código. None si la fuente no da con qué identificarla (el
+    día se procesa siempre).
+    """
+    realtime = realtime_source_fingerprint(target_date_str)
+    if realtime is None:
+        return None
+    return huella(realtime=realtime, static=client.resolve(target_date_str)["id"], codigo=VERSION_CODIGO)
+
+
+def is_day_current(target_date_str, huella_dia):
+    return huella_dia is not None and salidas_actualizadas(
+        ACCESS_KEY, SECRET_KEY, [build_delays_object(target_date_str)], huella_dia
+    )
+
+
 # Función generadora de fechas
 def daterange(start_date, end_date):
     """Generador para iterar día a día entre dos fechas"""
@@ -22,12 +66,14 @@ def daterange(start_date, end_date):
         yield start_date + timedelta(n)
 
 
-def process_and_store_gtfs_range(start: str, end: str) -> None:
+def process_and_store_gtfs_range(start: str, end: str, processes: int = PROCESSES) -> None:
     """Procesa y sube GTFS para un rango de fechas.
 
     Args:
         start: fecha inicio 'YYYY-MM-DD'
         end: fecha fin 'YYYY-MM-DD'
+        processes: con más de 1, los días se reparten entre procesos
+            (ver process_and_store_gtfs_range_parallel)
     """
     from datetime import datetime
 
@@ -36,16 +82,29 @@ def process_and_store_gtfs_range(start: str, end: str) -> None:
 
     print(f"Iniciando pipeline para fechas desde {start_date} hasta {end_date}")
 
+    # Un solo cliente para todo el rango: token y listado de datasets se piden una vez
+    client = MobilityDatabaseClient()
+
+    if processes > 1:
+        return process_and_store_gtfs_range_parallel(start_date, end_date, processes, client)
+
     for single_date in daterange(start_date, end_date):
         target_date_str = single_date.strftime("%Y-%m-%d")
+        local_parquet_path = None
         print(f"Procesando día: {target_date_str}")
 
         try:
-            # Procesa los datos static y realtime del día y devuelve ruta del Parquet final
-            local_parquet_path = process_mta_date(target_date_str)
+            # Días ya subidos con las mismas entradas y el mismo código: nada que hacer
+            huella_dia = day_fingerprint(target_date_str, client)
+            if is_day_current(target_date_str, huella_dia):
+                print(f"Día {target_date_str} al día en MinIO, saltando.")
+                continue
+
+            # Procesa los datos static (caché de versiones en MinIO) y realtime del día y devuelve ruta del Parquet final
+            local_parquet_path = process_mta_date(target_date_str, ACCESS_KEY, SECRET_KEY, client)
 
             # Subir el parquet a MinIO
-            minio_destination_path = f"grupo5/processed/gtfs_with_delays/date={target_date_str}/mta_delays_{target_date_str}.parquet"
+            minio_destination_path = build_delays_object(target_date_str)
 
             print(f"Subiendo archivo a MinIO: {minio_destination_path} en el bucket {BUCKET_NAME}...")
 
@@ -56,6 +115,7 @@ def process_and_store_gtfs_range(start: str, end: str) -> None:
                 object_name=minio_destination_path,
                 file_path=local_parquet_path,
                 bucket=BUCKET_NAME,
+                metadata=metadatos(huella_dia) if huella_dia else None,
             )
 
             print(f" Archivo subido correctamente a MinIO.")
@@ -74,6 +134,135 @@ def process_and_store_gtfs_range(start: str, end: str) -> None:
                 except Exception:
                     pass
 
+# Backfill en paralelo
+#
+# Cada proceso trabajador descarga y cruza días completos dentro de su propio
+# directorio de trabajo (los ficheros temporales de cada día usan nombres
+# relativos: tmp/, static_gtfs_<fecha>/...). El proceso principal:
+#   - resuelve una sola vez la versión del estático de todos los días y
+#     prepara cada versión en la caché local antes de arrancar los procesos,
+#     así que los trabajadores sólo leen de esa caché;
+#   - sube a MinIO en hilos cada día terminado mientras los procesos siguen
+#     con los siguientes, de modo que descargas, cálculo y subidas se solapan.
+
+# Estado de cada proceso trabajador
+_WORKER = {}
+
+
+def _init_worker(scratch_base, static_cache_dir, client):
+    scratch = os.path.join(scratch_base, f"worker_{os.getpid()}")
+    os.makedirs(scratch, exist_ok=True)
+    os.chdir(scratch)
+    _WORKER["static_cache_dir"] = static_cache_dir
+    _WORKER["client"] = client
+
+
+def _process_day_worker(target_date_str):
+    """Procesa un día en el proceso trabajador y devuelve la ruta absoluta del Parquet"""
+    local_parquet_path = process_mta_date(target_date_str, client=_WORKER["client"],
+                                          cache_dir=_WORKER["static_cache_dir"])
+    return os.path.abspath(local_parquet_path)
+
+
+def _upload_day(target_date_str, local_parquet_path, huella_dia):
+    try:
+        upload_file(
+            access_key=ACCESS_KEY,
+            secret_key=SECRET_KEY,
+            object_name=build_delays_object(target_date_str),
+            file_path=local_parquet_path,
+            bucket=BUCKET_NAME,
+            metadata=metadatos(huella_dia) if huella_dia else None,
+        )
+    finally:
+        if os.path.exists(local_parquet_path):
+            os.remove(local_parquet_path)
+
+
+def process_and_store_gtfs_range_parallel(start_date, end_date, processes, client) -> None:
+    """Backfill de start_date a end_date (date) con `processes` procesos"""
+    all_days = [d.strftime("%Y-%m-%d") for d in daterange(start_date, end_date)]
+
+    # Huellas de todos los días en hilos (HEAD + stat): los días al día se saltan
+    def check(target_date_str):
+        try:
+            huella_dia = day_fingerprint(target_date_str, client)
+            return huella_dia, is_day_current(target_date_str, huella_dia)
+        except Exception as e:
+            print(f"Error comprobando la fecha {target_date_str}: {e!r}")
+            return None, False
+
+    client.datasets()
+    with ThreadPoolExecutor(max_workers=UPLOAD_THREADS * 2) as checks:
+        fingerprints = dict(zip(all_days, checks.map(check, all_days)))
+    days = [d for d in all_days if not fingerprints[d][1]]
+    print(f"{len(all_days) - len(days)} días al día en MinIO; {len(days)} por procesar.")
+    if not days:
+        return
+
+    # Versión del estático de cada día (el listado de datasets se pide una vez).
+    # Un día sin versión o cuya versión no se puede preparar cuenta como
+    # fallido y no se manda al pool, igual que un día que falla al procesarse
+    failed = []
+    day_versions = {}
+    for target_date_str in days:
+        try:
+            day_versions[target_date_str] = client.resolve(target_date_str)["id"]
+        except Exception as e:
+            print(f"Error resolviendo el estático de {target_date_str}: {e!r}")
+            failed.append(target_date_str)
+
+    static_cache_dir = os.path.abspath(DIR_STATIC_CACHE)
+    versions = {}
+    for target_date_str, version_id in day_versions.items():
+        versions.setdefault(version_id, []).append(target_date_str)
+    for version_id, version_days in versions.items():
+        print(f"Preparando estático {version_id} (primer día: {version_days[0]})...")
+        try:
+            load_static_merged(version_days[0], ACCESS_KEY, SECRET_KEY, static_cache_dir, client)
+        except Exception as e:
+            print(f"Error preparando el estático {version_id}: {e!r}")
+            failed.extend(version_days)
+    skipped = set(failed)
+    pending = [d for d in days if d not in skipped]
+
+    scratch_base = tempfile.mkdtemp(prefix="gtfs_backfill_")
+    try:
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(scratch_base, static_cache_dir, client),
+        ) as pool, ThreadPoolExecutor(max_workers=UPLOAD_THREADS) as uploads:
+            processing = {pool.submit(_process_day_worker, d): d for d in pending}
+            uploading = {}
+            for future in as_completed(processing):
+                target_date_str = processing[future]
+                try:
+                    local_parquet_path = future.result()
+                except Exception as e:
+                    print(f"Error procesando la fecha {target_date_str}: {e!r}")
+                    failed.append(target_date_str)
+                    continue
+                print(f"Día {target_date_str} procesado. Subiendo a MinIO: {build_delays_object(target_date_str)}")
+                uploading[uploads.submit(_upload_day, target_date_str, local_parquet_path, fingerprints[target_date_str][0])] = target_date_str
+
+            for future in as_completed(uploading):
+                target_date_str = uploading[future]
+                try:
+                    future.result()
+                    print(f" Día {target_date_str} subido correctamente a MinIO.")
+                except Exception as e:
+                    print(f"Error subiendo la fecha {target_date_str}: {e!r}")
+                    failed.append(target_date_str)
+    finally:
+        shutil.rmtree(scratch_base, ignore_errors=True)
+
+    print(f"Backfill terminado: {len(days) - len(failed)}/{len(days)} días correctos.")
+    if failed:
+        print(f"Días con error: {sorted(failed)}")
+
+
 if __name__ == "__main__":
     # Definir el rango de fechas a procesar
     start = date(2025, 12, 1)
@@ -0,0 +1,124 @@
+"""
+Lectura de los CSV del constructor histórico con el lector CSV de Arrow.
+
+Para cada fichero se declara el esquema de las únicas columnas que se usan
+después; el resto del fichero se salta sin convertirlo. Los identificadores
+se leen directamente como diccionario (categóricos en pandas) y el parseo
+usa varios hilos.
+
+    static_trips       trips.txt del GTFS estático
+    static_stop_times  stop_times.txt del GTFS estático
+    rt_trips           subwaydatanyc_<fecha>_trips.csv
+    rt_stop_times      subwaydatanyc_<fecha>_stop_times.csv
+
+Ejemplo (benchmark contra pd.read_csv):
+    uv run python -m src.gtfs_historico.lectura_csv --static_trips trips.txt \
+        --static_stop_times stop_times.txt --rt_trips ..._trips.csv --rt_stop_times ..._stop_times.csv
+"""
+
+import argparse
+import sys
+import time
+from typing import List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+
+IDENTIFICADOR = pa.dictionary(pa.int32(), pa.string())
+
+ESQUEMAS = {
+    # trip_id es único por fila en trips.txt: como diccionario no ahorraría nada
+    "static_trips": {"trip_id": pa.string(), "route_id": IDENTIFICADOR},
+    # arrival_time "HH:MM:SS": como mucho una hora distinta por segundo del día
+    "static_stop_times": {"trip_id": IDENTIFICADOR, "stop_id": IDENTIFICADOR, "arrival_time": IDENTIFICADOR},
+    "rt_trips": {"trip_uid": IDENTIFICADOR, "trip_id": IDENTIFICADOR},
+    # Epoch con huecos: float64 (como pd.read_csv) admite tanto "1735830060" como "1735830060.0"
+    "rt_stop_times": {"trip_uid": IDENTIFICADOR, "stop_id": IDENTIFICADOR, "arrival_time": pa.float64()},
+}
+
+# Equivalente en pd.read_csv (la lectura anterior), para el benchmark
+DTYPES_PANDAS = {
+    "static_trips": {"trip_id": "str", "route_id": "category"},
+    "static_stop_times": {"trip_id": "category", "stop_id": "category", "arrival_time": "category"},
+    "rt_trips": {"trip_uid": "category", "trip_id": "category"},
+    "rt_stop_times": {"trip_uid": "category", "stop_id": "category"},
+}
+
+TAM_BLOQUE = 16 << 20
+
+
+def leer_csv(origen, tipo: str) -> pa.Table:
+    """
+    Lee el CSV `tipo` (clave de ESQUEMAS) desde una ruta o un objeto tipo
+    fichero, sólo con las columnas declaradas y con sus tipos.
+    """
+    esquema = ESQUEMAS[tipo]
+    return pa_csv.read_csv(
+        origen,
+        read_options=pa_csv.ReadOptions(use_threads=True, block_size=TAM_BLOQUE),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=esquema,
+            include_columns=list(esquema),
+            # Un campo vacío es nulo, como en pd.read_csv: arrival_time puede
+            # venir vacío en las paradas que no son timepoint
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def leer_csv_pandas(origen, tipo: str) -> pd.DataFrame:
+    """leer_csv pasado a pandas: los diccionarios quedan como categóricos"""
+    return leer_csv(origen, tipo).to_pandas()
+
+
+def benchmark_lectura(rutas: dict, repeticiones: int = 3) -> pd.DataFrame:
+    """
+    Compara, para cada fichero de `rutas` ({tipo: ruta}), la lectura con
+    pd.read_csv (todas las columnas) y con leer_csv: mejor tiempo de
+    `repeticiones` y memoria del DataFrame resultante.
+    """
+    filas = []
+    for tipo, ruta in rutas.items():
+        for metodo, leer in (
+            ("pandas", lambda: pd.read_csv(ruta, dtype=DTYPES_PANDAS[tipo])),
+            ("arrow", lambda: leer_csv_pandas(ruta, tipo)),
+        ):
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                df = leer()
+                tiempos.append(time.perf_counter() - inicio)
+            filas.append({
+                "fichero": tipo,
+                "metodo": metodo,
+                "filas": len(df),
+                "columnas": df.shape[1],
+                "segundos": min(tiempos),
+                "memoria_mb": df.memory_usage(deep=True).sum() / 2**20,
+            })
+            del df
+    return pd.DataFrame(filas)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark de lectura de los CSV del histórico: pandas vs Arrow.")
+    for tipo in ESQUEMAS:
+        parser.add_argument(f"--{tipo}", default=None, help=f"Ruta del CSV {tipo}.")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    rutas = {tipo: getattr(args, tipo) for tipo in ESQUEMAS if getattr(args, tipo)}
+    if not rutas:
+        print("[lectura_csv] FAIL indica al menos un CSV")
+        return 1
+    print(benchmark_lectura(rutas, args.repeticiones).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,105 @@
+"""
+Cliente de la API de Mobility Database para una ejecución completa del
+backfill histórico.
+
+En lugar de autenticarse y descargar el listado de datasets en cada día, el
+cliente:
+    - guarda el access_token hasta poco antes de que caduque,
+    - descarga una sola vez el listado de datasets del feed (mdb-511),
+    - resuelve cada fecha a su versión del estático con una búsqueda binaria
+      sobre las fechas downloaded_at ordenadas.
+"""
+
+import os
+import time
+from bisect import bisect_right
+from datetime import datetime
+
+import requests
+
+
+API_URL = "https://api.mobilitydatabase.org/v1"
+FEED_ID = "mdb-511"
+
+# Los access_token de Mobility Database duran una hora; se renuevan con margen
+TOKEN_TTL = 3600
+TOKEN_MARGIN = 120
+
+
+class MobilityDatabaseClient:
+    """Token y listado de datasets cacheados durante toda la ejecución"""
+
+    def __init__(self, refresh_token=None, feed_id=FEED_ID, session=None):
+        self.refresh_token = refresh_token or os.getenv("MOBILITY_DATABASE_REFRESH_TOKEN")
+        assert self.refresh_token is not None, "La variable de entorno MOBILITY_DATABASE_REFRESH_TOKEN no está definida."
+        self.feed_id = feed_id
+        self.session = session or requests.Session()
+
+        self._token = None
+        self._token_expira = 0.0
+        self._fechas = None
+        self._datasets = None
+
+    def access_token(self):
+        """Access token vigente, pidiendo uno nuevo sólo si ha caducado"""
+        if self._token is not None and time.time() < self._token_expira - TOKEN_MARGIN:
+            return self._token
+
+        print("Autenticando con Mobility Database...")
+        response = self.session.post(f"{API_URL}/tokens", json={"refresh_token": self.refresh_token})
+        if response.status_code != 200:
+            raise Exception(f"Fallo al obtener el access_token. HTTP {response.status_code}: {response.text}")
+
+        datos = response.json()
+        self._token = datos.get("access_token")
+        self._token_expira = time.time() + TOKEN_TTL
+        if datos.get("expiration_datetime_utc"):
+            expira = datetime.fromisoformat(datos["expiration_datetime_utc"].replace("Z", "+00:00"))
+            self._token_expira = expira.timestamp()
+        return self._token
+
+    def _get(self, url):
+        response = self.session.get(url, headers={"Accept": "application/json", "Authorization": f"Bearer {self.access_token()}"})
+        if response.status_code == 401:
+            # Token revocado antes de tiempo: se pide otro una vez
+            self._token = None
+            response = self.session.get(url, headers={"Accept": "application/json", "Authorization": f"Bearer {self.access_token()}"})
+        if response.status_code == 401:
+            raise Exception("Error 401 No Autorizado: El Access Token es inválido o el Refresh Token ha expirado/es incorrecto.")
+        response.raise_for_status()
+        return response.json()
+
+    def datasets(self):
+        """Datasets del feed ordenados por downloaded_at (se descargan una vez)"""
+        if self._datasets is None:
+            print(f"Consultando API Mobility Database: datasets de {self.feed_id}...")
+            datasets = sorted(self._get(f"{API_URL}/gtfs_feeds/{self.feed_id}/datasets"), key=lambda ds: ds["downloaded_at"])
+            self._datasets = datasets
+            self._fechas = [ds["downloaded_at"][:10] for ds in datasets]
+        return self._datasets
+
+    def resolve(self, target_date):
+        """
+        Versión del estático vigente en target_date ('YYYY-MM-DD'): el último
+        dataset descargado ese día o antes. Devuelve id, date y url.
+        """
+        datasets = self.datasets()
+        # Las fechas ISO se ordenan igual como texto que como fecha
+        i = bisect_right(self._fechas, target_date) - 1
+        if i < 0:
+            raise ValueError(f"No se encontró un GTFS estático anterior a {target_date}.")
+
+        ds = datasets[i]
+        print(f"Feed estático seleccionado: Versión extraída el {self._fechas[i]}")
+        return {"id": ds.get("id") or self._fechas[i], "date": self._fechas[i], "url": ds["hosted_url"]}
+
+
+_DEFAULT_CLIENT = None
+
+
+def default_client():
+    """Cliente compartido del proceso (se crea al primer uso)"""
+    global _DEFAULT_CLIENT
+    if _DEFAULT_CLIENT is None:
+        _DEFAULT_CLIENT = MobilityDatabaseClient()
+    return _DEFAULT_CLIENT
@@ -24,6 +24,9 @@ from datetime import date, timedelta
 from typing import Dict, Any, List
 import pandas as pd
 
+from src.common import dimensiones
+from src.common.dimensiones import codificar_lineas, codificar_paradas
+from src.common.idempotencia import huella, huella_objeto, metadatos, salidas_actualizadas, version_codigo
 from src.common.minio_client import download_df_parquet, upload_df_parquet, upload_json
 
 
@@ -39,6 +42,11 @@ REQUIRED_COLS = [
 ]
 
 
+# Los días ya transformados con la misma entrada y el mismo código (esta
+# etapa y la codificación de identificadores) se saltan
+VERSION_CODIGO = version_codigo(__file__, dimensiones.__file__)
+
+
 def iterate_dates(start: date, end: date):
     """Itera fechas (start y end inclusive)"""
     cur = start
@@ -127,15 +135,20 @@ def add_derivated_features(df: pd.DataFrame, service_date: str) -> pd.DataFrame:
 def coerce_types(df: pd.DataFrame) -> pd.DataFrame:
     """
     Forzar datatypes
+
+    Los identificadores se guardan como categóricos: route_id y stop_id sobre
+    las dimensiones del proceso (src.common.dimensiones) y match_key /
+    trip_uid con un diccionario propio del día.
     """
     out = df.copy()
-    # strings
-    for c in ["match_key", "route_id", "stop_id"]:
-        out[c] = out[c].astype("string")
+    # identificadores categóricos
+    out["route_id"] = codificar_lineas(out["route_id"])
+    out["stop_id"] = codificar_paradas(out["stop_id"])
+    out["match_key"] = out["match_key"].astype("category")
 
     # trip_uid (opcional)
     if "trip_uid" in out.columns:
-        out["trip_uid"] = out["trip_uid"].astype("string")
+        out["trip_uid"] = out["trip_uid"].astype("category")
 
     # booleans
     out["is_unscheduled"] = out["is_unscheduled"].astype("bool")
@@ -228,6 +241,17 @@ def transform_gtfs_processed_range_to_cleaned(
         day = d.strftime("%Y-%m-%d")
 
         in_obj = build_processed_object(day)
+        salidas = [
+            build_cleaned_scheduled_object(day), build_quality_scheduled_object(day),
+            build_cleaned_unscheduled_object(day), build_quality_unscheduled_object(day),
+        ]
+        entrada = huella_objeto(access_key, secret_key, in_obj)
+        huella_dia = huella(entrada=entrada, codigo=VERSION_CODIGO)
+        if entrada is not None and salidas_actualizadas(access_key, secret_key, salidas, huella_dia):
+            print(f"[gtfs_historico.transform] SKIP {day} (salidas al día)")
+            continue
+        meta = metadatos(huella_dia)
+
         df_before = download_df_parquet(access_key, secret_key, in_obj)
 
         outputs = transform_processed_day_to_cleaned(df_before, service_date=day)
@@ -235,12 +259,12 @@ def transform_gtfs_processed_range_to_cleaned(
         df_uns = outputs["unscheduled"]
 
         # write scheduled
-        upload_df_parquet(access_key, secret_key, build_cleaned_scheduled_object(day), df_sched)
-        upload_json(access_key, secret_key, build_quality_scheduled_object(day), quality_report(df_before, df_sched, "scheduled"))
+        upload_df_parquet(access_key, secret_key, build_cleaned_scheduled_object(day), df_sched, metadata=meta)
+        upload_json(access_key, secret_key, build_quality_scheduled_object(day), quality_report(df_before, df_sched, "scheduled"), metadata=meta)
 
         # write unscheduled
-        upload_df_parquet(access_key, secret_key, build_cleaned_unscheduled_object(day), df_uns)
-        upload_json(access_key, secret_key, build_quality_unscheduled_object(day), quality_report(df_before, df_uns, "unscheduled"))
+        upload_df_parquet(access_key, secret_key, build_cleaned_unscheduled_object(day), df_uns, metadata=meta)
+        upload_json(access_key, secret_key, build_quality_unscheduled_object(day), quality_report(df_before, df_uns, "unscheduled"), metadata=meta)
 
         print(
             f"[gtfs_historico.transform] OK {day} "
@@ -12,12 +12,14 @@ from typing import Callable, Dict, List
 # importar funciones de transformación de cada fuente
 from src.gtfs_historico.transform import run_transform as transform_gtfs_historico
 from src.eventos.transform import run_transform as transform_eventos
+from src.analytics.headways import run_headways
 
 TransformFn = Callable[[str, str], None]
 
 REGISTRY: Dict[str, TransformFn] = {
     "gtfs_historico": transform_gtfs_historico,
-    "eventos":  transform_eventos
+    "eventos":  transform_eventos,
+    "headways": run_headways,
 }
 
 
@@ -0,0 +1,182 @@
+"""
+Buffer circular en memoria de las últimas observaciones de retraso.
+
+Para features de corto plazo (retraso medio de los últimos 15 minutos en una
+parada, tendencia de una línea...) se guarda, para cada (línea, parada,
+dirección), un anillo con sus últimas `capacidad` observaciones (epoch y
+retraso). Todo vive en arrays de NumPy reservados al crear el buffer:
+
+    tiempos  int64   [max_claves, capacidad]
+    valores  float32 [max_claves, capacidad]
+
+así que la memoria es fija (unos 12 bytes por hueco) y no depende del
+tiempo que lleve el proceso en marcha. Si se llenan las claves, se reutiliza
+la fila de la clave que lleva más tiempo sin observaciones.
+
+Añadir una observación es O(1) (escribir en la posición de la cabeza del
+anillo), y los agregados sobre una ventana (media, máximo y pendiente) se
+calculan para todas las claves a la vez con operaciones por filas.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+MAX_CLAVES = 8192
+CAPACIDAD = 32
+VENTANA = 15 * 60
+
+
+def claves_buffer(linea_id, parada_id, direccion) -> np.ndarray:
+    """Hash de 64 bits de (línea, parada, dirección)"""
+    return pd.util.hash_pandas_object(
+        pd.DataFrame({
+            "linea_id": np.asarray(linea_id, dtype=object),
+            "parada_id": np.asarray(parada_id, dtype=object),
+            "direccion": np.asarray(direccion, dtype=np.int64),
+        }),
+        index=False,
+    ).to_numpy()
+
+
+class BufferCircular:
+    """
+    Anillos de observaciones por clave en arrays de tamaño fijo. Las claves
+    son hashes de 64 bits en un pd.Index que apunta a la fila de cada una.
+    """
+
+    def __init__(self, max_claves: int = MAX_CLAVES, capacidad: int = CAPACIDAD):
+        self.max_claves = max_claves
+        self.capacidad = capacidad
+
+        self.tiempos = np.zeros((max_claves, capacidad), dtype=np.int64)
+        self.valores = np.zeros((max_claves, capacidad), dtype=np.float32)
+        self.cabeza = np.zeros(max_claves, dtype=np.int64)
+        self.ultimo = np.zeros(max_claves, dtype=np.int64)
+
+        # Clave e identificadores de cada fila (fila libre: clave 0)
+        self.clave_fila = np.zeros(max_claves, dtype=np.uint64)
+        self.linea = np.empty(max_claves, dtype=object)
+        self.parada = np.empty(max_claves, dtype=object)
+        self.direccion = np.full(max_claves, -1, dtype=np.int8)
+        self.ocupadas = 0
+        self.claves = pd.Index(np.empty(0, dtype=np.uint64))
+
+    def __len__(self):
+        return self.ocupadas
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.tiempos, self.valores, self.cabeza, self.ultimo, self.clave_fila, self.direccion))
+
+    def _filas(self, claves, linea_id, parada_id, direccion) -> np.ndarray:
+        """Fila de cada observación, asignando filas a las claves nuevas"""
+        filas = self.claves.get_indexer(claves)
+        if (filas >= 0).all():
+            return filas
+
+        nuevas, primera = np.unique(claves[filas < 0], return_index=True)
+        origen = np.flatnonzero(filas < 0)[primera]
+
+        libres = np.arange(self.ocupadas, min(self.max_claves, self.ocupadas + len(nuevas)))
+        self.ocupadas += len(libres)
+        if len(libres) < len(nuevas):
+            # Sin filas libres: se reutilizan las de claves más antiguas que no estén en este lote
+            en_uso = np.zeros(self.max_claves, dtype=bool)
+            en_uso[filas[filas >= 0]] = True
+            en_uso[libres] = True
+            candidatas = np.flatnonzero(~en_uso)
+            antiguas = candidatas[np.argsort(self.ultimo[candidatas], kind="stable")][:len(nuevas) - len(libres)]
+            libres = np.concatenate([libres, antiguas])
+            nuevas, origen = nuevas[:len(libres)], origen[:len(libres)]
+
+        self.clave_fila[libres] = nuevas
+        self.linea[libres] = np.asarray(linea_id, dtype=object)[origen]
+        self.parada[libres] = np.asarray(parada_id, dtype=object)[origen]
+        self.direccion[libres] = np.asarray(direccion, dtype=np.int64)[origen]
+        self.tiempos[libres] = 0
+        self.cabeza[libres] = 0
+        self.ultimo[libres] = 0
+
+        self.claves = pd.Index(self.clave_fila[:self.ocupadas])
+        return self.claves.get_indexer(claves)
+
+    def añadir(self, linea_id, parada_id, direccion, epoch, retraso) -> None:
+        """Añade un lote de observaciones (arrays alineados, en orden de llegada)"""
+        epoch = np.asarray(epoch, dtype=np.int64)
+        retraso = np.asarray(retraso, dtype=np.float32)
+        if not len(epoch):
+            return
+
+        claves = claves_buffer(linea_id, parada_id, direccion)
+        filas = self._filas(claves, linea_id, parada_id, direccion)
+        validas = filas >= 0
+        filas, epoch, retraso = filas[validas], epoch[validas], retraso[validas]
+
+        # Varias observaciones de una misma clave van a huecos consecutivos del anillo;
+        # si son más que la capacidad sólo quedan las últimas
+        serie = pd.Series(filas)
+        desplazamiento = serie.groupby(filas, sort=False).cumcount().to_numpy()
+        cuantas = serie.groupby(filas, sort=False).transform("size").to_numpy()
+        quedan = desplazamiento >= cuantas - self.capacidad
+        filas, epoch, retraso, desplazamiento = filas[quedan], epoch[quedan], retraso[quedan], desplazamiento[quedan]
+
+        huecos = (self.cabeza[filas] + desplazamiento) % self.capacidad
+        self.tiempos[filas, huecos] = epoch
+        self.valores[filas, huecos] = retraso
+
+        unicas, n = np.unique(filas, return_counts=True)
+        self.cabeza[unicas] = (self.cabeza[unicas] + n) % self.capacidad
+        np.maximum.at(self.ultimo, filas, epoch)
+
+    def agregados(self, ahora: int, ventana: int = VENTANA, filas: np.ndarray = None) -> pd.DataFrame:
+        """
+        Para cada clave con observaciones en (ahora - ventana, ahora]:
+        número de observaciones, media, máximo, pendiente del retraso
+        (segundos de retraso por minuto) y epoch de la última observación.
+        """
+        filas = np.arange(self.ocupadas) if filas is None else filas
+        t = self.tiempos[filas]
+        v = self.valores[filas].astype(np.float64)
+        dentro = (t > ahora - ventana) & (t <= ahora) & (t > 0)
+
+        n = dentro.sum(axis=1)
+        con_datos = n > 0
+        n_seguro = np.maximum(n, 1)
+
+        media = np.where(dentro, v, 0).sum(axis=1) / n_seguro
+        maximo = np.where(dentro, v, -np.inf).max(axis=1)
+
+        # Mínimos cuadrados por fila: pendiente = cov(t, v) / var(t), con t en minutos
+        minutos = np.where(dentro, (t - ahora) / 60.0, 0)
+        media_t = minutos.sum(axis=1) / n_seguro
+        dt = np.where(dentro, minutos - media_t[:, None], 0)
+        dv = np.where(dentro, v - media[:, None], 0)
+        varianza = (dt * dt).sum(axis=1)
+        pendiente = np.divide((dt * dv).sum(axis=1), varianza, out=np.full(len(filas), np.nan), where=varianza > 0)
+
+        filas = filas[con_datos]
+        return pd.DataFrame({
+            "linea_id": self.linea[filas],
+            "parada_id": self.parada[filas],
+            "direccion": self.direccion[filas],
+            "n": n[con_datos],
+            "media": media[con_datos],
+            "maximo": maximo[con_datos],
+            "pendiente": pendiente[con_datos],
+            "ultimo_epoch": self.ultimo[filas],
+        })
+
+    def consultar(self, linea_id, parada_id, direccion, ahora: int, ventana: int = VENTANA) -> pd.DataFrame:
+        """Agregados sólo de las claves pedidas (las que no existen se omiten)"""
+        filas = self.claves.get_indexer(claves_buffer(linea_id, parada_id, direccion))
+        return self.agregados(ahora, ventana, filas[filas >= 0])
+
+
+def tendencia_lineas(agregados: pd.DataFrame) -> pd.DataFrame:
+    """Tendencia por línea y dirección: media de medias y de pendientes de sus paradas"""
+    return agregados.groupby(["linea_id", "direccion"], as_index=False).agg(
+        paradas=("parada_id", "size"),
+        media=("media", "mean"),
+        pendiente=("pendiente", "mean"),
+    )
@@ -0,0 +1,132 @@
+"""
+Detección de cambios entre dos consultas consecutivas a GTFS-Realtime.
+
+Entre dos consultas separadas 30 segundos la mayoría de stop_time_update no
+cambian. DetectorCambios guarda, para cada (viaje_id, parada_id), la última
+llegada/partida vista y deja pasar sólo las observaciones nuevas o
+modificadas, de modo que el cálculo de retrasos, el almacenamiento y la
+detección de anomalías escalan con el ritmo de cambio y no con el tamaño
+del feed.
+
+Una observación también se considera cambio cuando pasa de predicción
+futura a llegada ya realizada (llegada_epoch < captura_epoch), aunque sus
+tiempos no se hayan movido: es el momento en que su retraso pasa a ser
+real.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# Pasado este tiempo sin aparecer en el feed, un (viaje, parada) se olvida
+TTL_ESTADO = 3 * 3600
+
+
+def claves_observacion(df: pd.DataFrame) -> np.ndarray:
+    """Hash de 64 bits de (viaje_id, parada_id) para cada fila"""
+    return pd.util.hash_pandas_object(df[['viaje_id', 'parada_id']], index=False).to_numpy()
+
+
+class DetectorCambios:
+    """
+    Tabla compacta en memoria (unos 25 bytes por (viaje, parada)) con la
+    última observación de cada clave. Las claves son hashes de 64 bits en un
+    pd.Index, y llegada, partida, último visto y si ya era pasado son arrays
+    de NumPy alineados con él.
+    """
+
+    def __init__(self, ttl: int = TTL_ESTADO):
+        self.ttl = ttl
+        self.claves = pd.Index(np.empty(0, dtype=np.uint64))
+        self.llegada = np.empty(0, dtype=np.int64)
+        self.partida = np.empty(0, dtype=np.int64)
+        self.visto = np.empty(0, dtype=np.int64)
+        self.pasado = np.empty(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.claves)
+
+    def filtrar(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Recibe el DataFrame decodificado de un ciclo (viaje_id, parada_id,
+        llegada_epoch, partida_epoch, captura_epoch), actualiza el estado y
+        devuelve sólo las filas nuevas o cambiadas.
+        """
+        if df.empty:
+            return df
+
+        claves = claves_observacion(df)
+        llegada = df['llegada_epoch'].to_numpy(dtype='int64', na_value=0)
+        partida = df['partida_epoch'].to_numpy(dtype='int64', na_value=0)
+        captura = df['captura_epoch'].to_numpy(dtype='int64', na_value=0)
+        pasado = (llegada > 0) & (llegada < captura)
+
+        posiciones = self.claves.get_indexer(claves)
+        conocidas = posiciones >= 0
+        p = posiciones[conocidas]
+
+        cambiada = ~conocidas
+        cambiada[conocidas] = (
+            (self.llegada[p] != llegada[conocidas])
+            | (self.partida[p] != partida[conocidas])
+            | (pasado[conocidas] & ~self.pasado[p])
+        )
+
+        self._actualizar(claves, llegada, partida, captura, pasado, posiciones)
+        return df[cambiada]
+
+    def _actualizar(self, claves, llegada, partida, captura, pasado, posiciones):
+        conocidas = posiciones >= 0
+        p = posiciones[conocidas]
+        self.llegada[p] = llegada[conocidas]
+        self.partida[p] = partida[conocidas]
+        self.visto[p] = captura[conocidas]
+        self.pasado[p] |= pasado[conocidas]
+
+        nuevas = ~conocidas & ~pd.Index(claves).duplicated(keep='last')
+        vigentes = self.visto >= captura.max() - self.ttl
+
+        # Sin altas ni bajas se conserva el índice (y su tabla hash) tal cual
+        if not nuevas.any() and vigentes.all():
+            return
+
+        self.claves = pd.Index(np.concatenate([self.claves.to_numpy()[vigentes], claves[nuevas]]))
+        self.llegada = np.concatenate([self.llegada[vigentes], llegada[nuevas]])
+        self.partida = np.concatenate([self.partida[vigentes], partida[nuevas]])
+        self.visto = np.concatenate([self.visto[vigentes], captura[nuevas]])
+        self.pasado = np.concatenate([self.pasado[vigentes], pasado[nuevas]])
+
+
+class FiltroObservaciones:
+    """
+    Deja pasar cada (viaje_id, parada_id, llegada_epoch) una sola vez.
+
+    El feed vuelve a publicar en cada ciclo todas las llegadas que siguen en
+    él; quien acumula estadísticas sobre las observaciones (el detector de
+    anomalías) sólo debe verlas la primera vez. Las claves se olvidan cuando
+    su llegada queda `ttl` segundos por detrás de la más reciente vista.
+    """
+
+    def __init__(self, ttl: int = TTL_ESTADO):
+        self.ttl = ttl
+        self.claves = pd.Index(np.empty(0, dtype=np.uint64))
+        self.llegada = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.claves)
+
+    def filtrar(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Devuelve las filas de df cuya (viaje, parada, llegada) no se había visto"""
+        if df.empty:
+            return df
+
+        claves = pd.util.hash_pandas_object(
+            df[['viaje_id', 'parada_id', 'llegada_epoch']], index=False).to_numpy()
+        llegada = df['llegada_epoch'].to_numpy(dtype='int64', na_value=0)
+        nuevas = (self.claves.get_indexer(claves) < 0) & ~pd.Index(claves).duplicated()
+
+        vigentes = self.llegada >= max(llegada.max(), self.llegada.max(initial=0)) - self.ttl
+        if nuevas.any() or not vigentes.all():
+            self.claves = pd.Index(np.concatenate([self.claves.to_numpy()[vigentes], claves[nuevas]]))
+            self.llegada = np.concatenate([self.llegada[vigentes], llegada[nuevas]])
+        return df[nuevas]
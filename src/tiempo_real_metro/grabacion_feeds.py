@@ -0,0 +1,332 @@
+"""
+Grabación y reproducción de los feeds GTFS-Realtime.
+
+Permite medir y comprobar el camino extracción → retraso → snapshot sin
+depender de la API de la MTA.
+
+Grabación: en cada ciclo se guardan los FeedMessage tal cual llegan (bytes
+protobuf) de todas las FUENTES en ficheros de segmento comprimidos con zstd.
+Cada segmento cubre `--segundos_por_segmento` segundos y su nombre empieza
+por el epoch de su primer ciclo, así que los segmentos de un rango de tiempo
+se localizan sólo por el nombre:
+
+    data/grabaciones/feeds_<epoch>.bin.zst
+
+Cada registro del segmento es una cabecera fija seguida de grupo, error y
+contenido:
+    ciclo (int64) | captura (float64) | segundos (float32) |
+    len(grupo) (uint16) | len(error) (uint16) | len(contenido) (uint32)
+
+Cada ciclo termina con un registro de cierre (sólo cabecera, con grupo
+vacío) y se vacía el compresor, así que si el grabador muere sin cerrar el
+segmento (kill, caída de la máquina) se pierde como mucho el ciclo en curso:
+la reproducción lee el segmento truncado hasta el último ciclo cerrado y
+sigue con el siguiente.
+
+Reproducción: los registros se reagrupan por ciclo con el mismo formato que
+devuelve descargar_feeds y se pasan por procesar_ciclo y compactar_snapshot
+a velocidad real (1), acelerada (p. ej. 10) o lo más rápido posible (max).
+Al final se informa del rendimiento y de la latencia por ciclo.
+
+Uso:
+    uv run python -m src.tiempo_real_metro.grabacion_feeds grabar --dir data/grabaciones --intervalo 30
+    uv run python -m src.tiempo_real_metro.grabacion_feeds reproducir --dir data/grabaciones --velocidad 10
+"""
+
+import argparse
+import signal
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import numpy as np
+import pyarrow as pa
+
+from src.tiempo_real_metro.deteccion_cambios import DetectorCambios
+from src.tiempo_real_metro.horario_previsto import DIR_CACHE, cargar_horario_previsto, indice_horario
+from src.tiempo_real_metro.realtime_data import FUENTES, crear_sesion, descargar_feeds
+from src.tiempo_real_metro.snapshots_realtime import INTERVALO, compactar_snapshot, procesar_ciclo
+
+
+DIR_GRABACIONES = Path("data/grabaciones")
+
+SEGUNDOS_POR_SEGMENTO = 600
+
+CABECERA = struct.Struct("<qdfHHI")
+
+
+def nombre_segmento(epoch: int) -> str:
+    return f"feeds_{epoch:010d}.bin.zst"
+
+
+def segmentos(dir_grabaciones=DIR_GRABACIONES, desde: float = None, hasta: float = None) -> List[Path]:
+    """
+    Segmentos ordenados por tiempo que pueden contener ciclos del rango
+    [desde, hasta]. Un segmento empieza en su epoch y termina donde empieza
+    el siguiente.
+    """
+    rutas = sorted(Path(dir_grabaciones).glob("feeds_*.bin.zst"))
+    inicios = [int(r.name.split("_")[1].split(".")[0]) for r in rutas]
+
+    seleccion = []
+    for i, ruta in enumerate(rutas):
+        fin = inicios[i + 1] if i + 1 < len(rutas) else float("inf")
+        if (desde is None or fin > desde) and (hasta is None or inicios[i] <= hasta):
+            seleccion.append(ruta)
+    return seleccion
+
+
+# ─────────────────────────────────────────────
+#  Grabación
+# ─────────────────────────────────────────────
+
+class GrabadorFeeds:
+    """
+    Escribe los resultados de descargar_feeds en segmentos zstd, abriendo un
+    segmento nuevo cada `segundos_por_segmento`.
+    """
+
+    def __init__(self, dir_grabaciones=DIR_GRABACIONES, segundos_por_segmento: int = SEGUNDOS_POR_SEGMENTO):
+        self.dir_grabaciones = Path(dir_grabaciones)
+        self.dir_grabaciones.mkdir(parents=True, exist_ok=True)
+        self.segundos_por_segmento = segundos_por_segmento
+        self.salida = None
+        self.inicio_segmento = None
+
+    def grabar(self, resultados: Dict[str, dict], ciclo_epoch: int) -> int:
+        """Guarda un ciclo completo y devuelve los bytes sin comprimir escritos"""
+        if self.salida is None or ciclo_epoch - self.inicio_segmento >= self.segundos_por_segmento:
+            self.cerrar()
+            self.inicio_segmento = ciclo_epoch
+            self.salida = pa.CompressedOutputStream(str(self.dir_grabaciones / nombre_segmento(ciclo_epoch)), "zstd")
+
+        escritos = 0
+        for grupo, resultado in resultados.items():
+            grupo_bytes = grupo.encode("utf-8")
+            error = (resultado["error"] or "").encode("utf-8")
+            contenido = resultado["contenido"] or b""
+            self.salida.write(CABECERA.pack(
+                ciclo_epoch, resultado["captura"], resultado["segundos"],
+                len(grupo_bytes), len(error), len(contenido),
+            ))
+            self.salida.write(grupo_bytes)
+            self.salida.write(error)
+            self.salida.write(contenido)
+            escritos += CABECERA.size + len(grupo_bytes) + len(error) + len(contenido)
+
+        # Registro de cierre del ciclo, y fin de bloque zstd para que el ciclo
+        # quede legible aunque el segmento no llegue a cerrarse
+        self.salida.write(CABECERA.pack(ciclo_epoch, 0.0, 0.0, 0, 0, 0))
+        self.salida.flush()
+        return escritos + CABECERA.size
+
+    def cerrar(self) -> None:
+        # Cerrar el stream escribe el final de la trama zstd
+        if self.salida is not None:
+            self.salida.close()
+            self.salida = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+def grabar(dir_grabaciones=DIR_GRABACIONES, intervalo: float = INTERVALO,
+           segundos_por_segmento: int = SEGUNDOS_POR_SEGMENTO, parar: threading.Event = None) -> None:
+    parar = threading.Event() if parar is None else parar
+    sesion = crear_sesion()
+
+    with GrabadorFeeds(dir_grabaciones, segundos_por_segmento) as grabador:
+        proximo = time.monotonic()
+        while not parar.is_set():
+            ciclo_epoch = int(time.time())
+            try:
+                resultados = descargar_feeds(sesion=sesion)
+                escritos = grabador.grabar(resultados, ciclo_epoch)
+                fallidos = sum(r["contenido"] is None for r in resultados.values())
+                print(f"[grabacion_feeds] ciclo {ciclo_epoch} bytes={escritos} feeds_fallidos={fallidos}")
+            except Exception as e:
+                print(f"[grabacion_feeds] FAIL ciclo error={e!r}", file=sys.stderr)
+
+            proximo = max(proximo + intervalo, time.monotonic())
+            parar.wait(proximo - time.monotonic())
+
+    print("[grabacion_feeds] Detenido.")
+
+
+# ─────────────────────────────────────────────
+#  Reproducción
+# ─────────────────────────────────────────────
+
+def _leer_registros(entrada) -> Iterator[dict]:
+    while True:
+        cabecera = entrada.read(CABECERA.size)
+        if not cabecera:
+            return
+        if len(cabecera) < CABECERA.size:
+            raise EOFError("registro incompleto")
+        ciclo, captura, segundos, n_grupo, n_error, n_contenido = CABECERA.unpack(cabecera)
+        grupo = entrada.read(n_grupo)
+        error = entrada.read(n_error)
+        contenido = entrada.read(n_contenido)
+        if (len(grupo), len(error), len(contenido)) != (n_grupo, n_error, n_contenido):
+            raise EOFError("registro incompleto")
+        if not n_grupo:
+            yield {"ciclo": ciclo, "cierre": True}
+            continue
+        grupo, error = grupo.decode("utf-8"), error.decode("utf-8")
+        yield {
+            "ciclo": ciclo, "grupo": grupo, "url": FUENTES.get(grupo, {}).get("url"),
+            "contenido": contenido if not error else None, "error": error or None,
+            "captura": captura, "segundos": segundos,
+        }
+
+
+def leer_segmento(ruta) -> Iterator[dict]:
+    """
+    Recorre los registros de un segmento en orden. Un ciclo sólo se entrega
+    al leer su registro de cierre; si el segmento está truncado (grabador
+    que no llegó a cerrarlo) se descarta el ciclo cortado y se avisa.
+    """
+    ciclo = []
+    try:
+        with pa.input_stream(str(ruta), compression="zstd") as entrada:
+            for registro in _leer_registros(entrada):
+                if registro.get("cierre"):
+                    yield from ciclo
+                    ciclo = []
+                else:
+                    ciclo.append(registro)
+    except (OSError, EOFError) as e:
+        print(f"[grabacion_feeds] Segmento truncado {ruta}: se descarta el ciclo en curso ({e})", file=sys.stderr)
+        return
+    # Segmentos grabados sin registros de cierre
+    yield from ciclo
+
+
+def ciclos_grabados(dir_grabaciones=DIR_GRABACIONES, desde: float = None, hasta: float = None) -> Iterator[tuple]:
+    """
+    Devuelve (ciclo_epoch, resultados) para cada ciclo grabado en el rango,
+    con `resultados` en el mismo formato que descargar_feeds.
+    """
+    actual, resultados = None, {}
+    for ruta in segmentos(dir_grabaciones, desde, hasta):
+        for registro in leer_segmento(ruta):
+            ciclo = registro.pop("ciclo")
+            if (desde is not None and ciclo < desde) or (hasta is not None and ciclo > hasta):
+                continue
+            if ciclo != actual and resultados:
+                yield actual, resultados
+                resultados = {}
+            actual = ciclo
+            resultados[registro["grupo"]] = registro
+    if resultados:
+        yield actual, resultados
+
+
+def reproducir(dir_grabaciones=DIR_GRABACIONES, velocidad: float = None, desde: float = None,
+               hasta: float = None, solo_cambios: bool = False, dir_cache=DIR_CACHE) -> dict:
+    """
+    Reproduce los ciclos grabados por el camino procesar_ciclo →
+    compactar_snapshot. Con velocidad=None no se espera entre ciclos; con
+    velocidad=v se respeta el espaciado original dividido entre v.
+
+    Devuelve un resumen con ciclos, filas, bytes de feed, filas por segundo
+    de proceso y percentiles de latencia por ciclo.
+    """
+    indice = indice_horario(cargar_horario_previsto(dir_cache=dir_cache))
+    detector = DetectorCambios() if solo_cambios else None
+
+    latencias = []
+    filas = 0
+    bytes_feed = 0
+    retraso_max = 0.0
+    inicio_reloj = time.monotonic()
+    primer_ciclo = None
+
+    for ciclo_epoch, resultados in ciclos_grabados(dir_grabaciones, desde, hasta):
+        if primer_ciclo is None:
+            primer_ciclo = ciclo_epoch
+
+        if velocidad is not None:
+            objetivo = inicio_reloj + (ciclo_epoch - primer_ciclo) / velocidad
+            espera = objetivo - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            else:
+                retraso_max = max(retraso_max, -espera)
+
+        inicio = time.perf_counter()
+        df = procesar_ciclo(resultados, indice, detector=detector)
+        compactar_snapshot(df, ciclo_epoch)
+        latencias.append(time.perf_counter() - inicio)
+
+        filas += len(df)
+        bytes_feed += sum(len(r["contenido"] or b"") for r in resultados.values())
+
+    total = time.monotonic() - inicio_reloj
+    proceso = float(np.sum(latencias))
+    return {
+        "ciclos": len(latencias),
+        "filas": filas,
+        "bytes_feed": bytes_feed,
+        "segundos_totales": total,
+        "filas_por_segundo": filas / proceso if proceso else 0.0,
+        "latencia_p50": float(np.percentile(latencias, 50)) if latencias else 0.0,
+        "latencia_p99": float(np.percentile(latencias, 99)) if latencias else 0.0,
+        "retraso_max": retraso_max,
+    }
+
+
+def _velocidad(valor: str):
+    return None if valor == "max" else float(valor)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Graba y reproduce los feeds GTFS-Realtime de la MTA.")
+    sub = parser.add_subparsers(dest="modo", required=True)
+
+    p_grabar = sub.add_parser("grabar", help="Graba los feeds en segmentos zstd.")
+    p_grabar.add_argument("--dir", default=str(DIR_GRABACIONES), help="Directorio de los segmentos.")
+    p_grabar.add_argument("--intervalo", type=float, default=INTERVALO, help="Segundos entre ciclos.")
+    p_grabar.add_argument("--segundos_por_segmento", type=int, default=SEGUNDOS_POR_SEGMENTO,
+                          help="Segundos de grabación por fichero de segmento.")
+
+    p_reproducir = sub.add_parser("reproducir", help="Reproduce una grabación por el pipeline de tiempo real.")
+    p_reproducir.add_argument("--dir", default=str(DIR_GRABACIONES), help="Directorio de los segmentos.")
+    p_reproducir.add_argument("--velocidad", type=_velocidad, default=None,
+                              help="1 = tiempo real, 10 = diez veces más rápido, max = sin esperas (por defecto).")
+    p_reproducir.add_argument("--desde", type=float, default=None, help="Epoch del primer ciclo a reproducir.")
+    p_reproducir.add_argument("--hasta", type=float, default=None, help="Epoch del último ciclo a reproducir.")
+    p_reproducir.add_argument("--solo_cambios", action="store_true",
+                              help="Procesa sólo las observaciones nuevas o modificadas entre ciclos.")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+
+    if args.modo == "grabar":
+        parar = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: parar.set())
+        grabar(args.dir, args.intervalo, args.segundos_por_segmento, parar)
+        return 0
+
+    resumen = reproducir(args.dir, args.velocidad, args.desde, args.hasta, args.solo_cambios)
+    print(
+        f"[grabacion_feeds] ciclos={resumen['ciclos']} filas={resumen['filas']} "
+        f"MB_feed={resumen['bytes_feed'] / 1e6:.1f} filas/s={resumen['filas_por_segundo']:.0f} "
+        f"latencia_p50={resumen['latencia_p50'] * 1000:.1f}ms latencia_p99={resumen['latencia_p99'] * 1000:.1f}ms "
+        f"retraso_max={resumen['retraso_max']:.2f}s total={resumen['segundos_totales']:.1f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,257 @@
+"""
+Caché local del horario previsto (GTFS Supplemented de la MTA).
+
+El ZIP gtfs_supplemented.zip pesa cientos de MB y cambia pocas veces al día,
+así que la tabla de stop_times ya preparada (day, trip_id y
+segundos_previstos calculados) se guarda en un Parquet local junto a los
+metadatos de la versión descargada (ETag / Last-Modified).
+
+En cada arranque se hace una petición condicional: si el servidor responde
+304 se carga directamente el Parquet; sólo si el feed ha cambiado se vuelve
+a descargar y a reconstruir la tabla.
+
+Estructura de la caché:
+    data/cache/gtfs_supplemented/
+        stop_times.parquet   → tabla preparada
+        version.json         → etag, last_modified, versión del código que
+                               preparó la tabla y fecha de comprobación
+
+Si la caché la preparó otra versión del código (VERSION_CODIGO), se vuelve a
+descargar el ZIP sin petición condicional y se reconstruye.
+"""
+
+import json
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import requests
+
+from src.common import tiempos
+from src.common.dimensiones import indexar
+from src.common.ficheros import escribir_atomico
+from src.common.idempotencia import version_codigo
+from src.common.tiempos import SEGUNDOS_DIA, hora_gtfs_a_segundos
+
+
+URL_GTFS_SUPPLEMENTED = "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_supplemented.zip"
+
+DIR_CACHE = Path("data/cache/gtfs_supplemented")
+
+# Si la última comprobación es más reciente que esto, no se pregunta al servidor
+COMPROBAR_CADA = 15 * 60
+
+# Versión del código que prepara la tabla: si cambia, la caché no vale
+VERSION_CODIGO = version_codigo(__file__, tiempos.__file__)
+
+
+def preparar_stop_times(f) -> pd.DataFrame:
+    """
+    Lee stop_times.txt y lo adapta al formato de los datos en tiempo real.
+
+    Las operaciones de texto sobre trip_id se hacen sólo sobre los valores
+    únicos (decenas de miles) y se propagan a las filas (millones) por
+    código categórico.
+    """
+    df = pd.read_csv(
+        f,
+        usecols=['trip_id', 'stop_id', 'arrival_time', 'stop_sequence'],
+        dtype={'trip_id': 'category', 'stop_id': 'category', 'arrival_time': 'string', 'stop_sequence': 'int32'},
+    )
+
+    viajes = df['trip_id'].cat.categories.to_series()
+
+    #Día en el que se lleva a cabo el servivio, viene dado como parte del trip_id
+    dias = viajes.str.split('-').str[-2]
+
+    #Modificamos trip_id para que tenga el mismo formato que el id del otro dataframe
+    ids = viajes.str.split('_', n=1).str[-1]
+
+    codigos = df['trip_id'].cat.codes.to_numpy()
+    df['day'] = pd.Categorical(dias.to_numpy()[codigos])
+    df['trip_id'] = pd.Categorical(ids.to_numpy()[codigos])
+
+    #Horas mayores a 24 horas pasan al día siguiente
+    segundos = hora_gtfs_a_segundos(df['arrival_time']) % SEGUNDOS_DIA
+    df['segundos_previstos'] = pd.array(segundos, dtype='Int32')
+
+    return df[['trip_id', 'stop_id', 'day', 'stop_sequence', 'segundos_previstos']]
+
+
+def _leer_version(dir_cache):
+    ruta = Path(dir_cache) / "version.json"
+    if not ruta.exists() or not (Path(dir_cache) / "stop_times.parquet").exists():
+        return None
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _guardar_version(dir_cache, version):
+    def escribir(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(version, f, ensure_ascii=False, indent=2)
+    escribir_atomico(Path(dir_cache) / "version.json", escribir)
+
+
+def _cargar_parquet(dir_cache, version):
+    df = pd.read_parquet(Path(dir_cache) / "stop_times.parquet")
+    df.attrs['version'] = version.get('etag') or version.get('last_modified')
+    return df
+
+
+def cargar_horario_previsto(url=URL_GTFS_SUPPLEMENTED, dir_cache=DIR_CACHE, sesion=None,
+                            comprobar_cada=COMPROBAR_CADA, timeout=(3.05, 120)):
+    """
+    Devuelve el DataFrame de horarios previstos usando la caché local.
+
+    - Si la caché se comprobó hace menos de `comprobar_cada` segundos, se
+      carga sin tocar la red.
+    - Si no, se pide el ZIP con If-None-Match / If-Modified-Since. Con 304
+      se carga la caché; con 200 se reconstruye y se guarda la nueva versión.
+    - Si la caché la preparó otra versión del código, se pide sin
+      condiciones y se reconstruye.
+    - Si la petición falla (error de red o respuesta de error) y existe una
+      caché previa, se usa esa.
+
+    La versión (ETag o Last-Modified) queda en df.attrs['version'].
+    """
+    dir_cache = Path(dir_cache)
+    dir_cache.mkdir(parents=True, exist_ok=True)
+    sesion = requests.Session() if sesion is None else sesion
+
+    version = _leer_version(dir_cache)
+    vigente = version is not None and version.get('codigo') == VERSION_CODIGO
+    if vigente and time.time() - version.get('comprobado', 0) < comprobar_cada:
+        return _cargar_parquet(dir_cache, version)
+
+    headers = {}
+    if vigente:
+        if version.get('etag'):
+            headers['If-None-Match'] = version['etag']
+        if version.get('last_modified'):
+            headers['If-Modified-Since'] = version['last_modified']
+
+    try:
+        response = sesion.get(url, headers=headers, stream=True, timeout=timeout)
+    except requests.RequestException as e:
+        if version is None:
+            raise
+        print(f"  No se pudo comprobar el horario previsto ({e!r}), se usa la versión en caché")
+        return _cargar_parquet(dir_cache, version)
+
+    with response:
+        if response.status_code == 304:
+            version['comprobado'] = time.time()
+            _guardar_version(dir_cache, version)
+            return _cargar_parquet(dir_cache, version)
+
+        try:
+            response.raise_for_status()
+        except requests.HTTPError as e:
+            if version is None:
+                raise
+            print(f"  El servidor del horario previsto respondió con error ({e!r}), se usa la versión en caché")
+            return _cargar_parquet(dir_cache, version)
+
+        print("  Horario previsto nuevo o modificado, reconstruyendo caché...")
+        with tempfile.TemporaryFile(dir=dir_cache) as zip_tmp:
+            for parte in response.iter_content(chunk_size=1024 * 1024):
+                zip_tmp.write(parte)
+            zip_tmp.seek(0)
+
+            with zipfile.ZipFile(zip_tmp, 'r') as z:
+                with z.open("stop_times.txt") as f:
+                    df = preparar_stop_times(f)
+
+        escribir_atomico(dir_cache / "stop_times.parquet", lambda tmp: df.to_parquet(tmp, index=False))
+
+        version = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'codigo': VERSION_CODIGO,
+            'comprobado': time.time(),
+        }
+        _guardar_version(dir_cache, version)
+
+    df.attrs['version'] = version.get('etag') or version.get('last_modified')
+    return df
+
+
+class IndiceHorario:
+    """
+    Índice sobre el horario previsto para buscar los segundos previstos de un
+    lote de observaciones en tiempo real sin hacer un pd.merge contra toda la
+    tabla de stop_times en cada ciclo.
+
+    Cada (trip_id, stop_id, day) se codifica como un único entero de 64 bits
+    a partir de los códigos de cada identificador, y las claves se guardan en
+    un pd.Index con tabla hash. Construirlo cuesta lo mismo que un merge,
+    pero se hace una vez por versión del horario; cada búsqueda posterior es
+    proporcional al tamaño del lote.
+    """
+
+    def __init__(self, df):
+        self.version = df.attrs.get('version')
+
+        viajes = pd.Categorical(df['trip_id'])
+        paradas = pd.Categorical(df['stop_id'])
+        dias = pd.Categorical(df['day'])
+
+        self.viajes = pd.Index(viajes.categories)
+        self.paradas = pd.Index(paradas.categories)
+        self.dias = pd.Index(dias.categories)
+
+        claves = self._codificar(viajes.codes, paradas.codes, dias.codes)
+
+        # Un viaje puede pasar dos veces por la misma parada: nos quedamos con
+        # la primera aparición, igual que una búsqueda por clave única
+        unicas = ~pd.Index(claves).duplicated() & (claves >= 0)
+        self.claves = pd.Index(claves[unicas])
+        self.segundos_previstos = df['segundos_previstos'].to_numpy(dtype='float64', na_value=np.nan)[unicas]
+        self.stop_sequence = df['stop_sequence'].to_numpy()[unicas]
+
+    def _codificar(self, viaje, parada, dia):
+        viaje = np.asarray(viaje, dtype=np.int64)
+        parada = np.asarray(parada, dtype=np.int64)
+        dia = np.asarray(dia, dtype=np.int64)
+        claves = (viaje * len(self.paradas) + parada) * len(self.dias) + dia
+        return np.where((viaje < 0) | (parada < 0) | (dia < 0), -1, claves)
+
+    def __len__(self):
+        return len(self.claves)
+
+    def buscar(self, viaje_id, parada_id, dia):
+        """
+        Devuelve la posición en el índice de cada observación, o -1 si no
+        tiene horario previsto.
+        """
+        claves = self._codificar(
+            indexar(self.viajes, viaje_id),
+            indexar(self.paradas, parada_id),
+            indexar(self.dias, dia),
+        )
+        posiciones = self.claves.get_indexer(claves)
+        posiciones[claves < 0] = -1
+        return posiciones
+
+
+_INDICES = {}
+
+
+def indice_horario(df):
+    """
+    Devuelve el índice del horario previsto, construyéndolo sólo la primera
+    vez que se ve cada versión (df.attrs['version']).
+    """
+    version = df.attrs.get('version')
+    indice = _INDICES.get(version)
+    if indice is None or version is None:
+        indice = IndiceHorario(df)
+        if version is not None:
+            _INDICES.clear()
+            _INDICES[version] = indice
+    return indice
@@ -0,0 +1,167 @@
+"""
+Métricas de frescura y latencia del bucle de tiempo real.
+
+En cada ciclo se anota, por feed:
+    - timestamp_feed: timestamp de la cabecera del FeedMessage (epoch)
+    - frescura: segundos entre el timestamp del feed y la descarga
+    - segundos_descarga, bytes, error
+    - segundos_parseo y filas decodificadas
+
+y, para el ciclo completo, lo que tarda cada etapa (descarga, decodificación,
+cruce con el horario, escritura...), las filas resultantes y la frescura
+extremo a extremo: segundos entre el feed más antiguo del ciclo y el final
+de la escritura.
+
+Al terminar cada ciclo, también si ha fallado, se exportan de dos formas:
+    - data/metricas/realtime.prom: fichero de texto en formato Prometheus
+      (para el textfile collector de node_exporter), reescrito de forma
+      atómica con los valores del último ciclo y los contadores de ciclos y
+      ciclos fallidos.
+    - data/metricas/ciclos_YYYY-MM-DD.jsonl: una línea JSON por ciclo, con
+      la fecha de Nueva York, igual que las particiones de snapshots.
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from src.common.ficheros import escribir_texto_atomico
+
+
+DIR_METRICAS = Path("data/metricas")
+FICHERO_PROMETHEUS = "realtime.prom"
+ZONA = ZoneInfo("America/New_York")
+
+# (nombre, tipo, ayuda) de las métricas por feed; el valor sale de la clave homónima
+METRICAS_FEED = [
+    ("timestamp_feed", "gauge", "Timestamp de la cabecera del feed (epoch)"),
+    ("frescura", "gauge", "Segundos entre el timestamp del feed y su descarga"),
+    ("segundos_descarga", "gauge", "Segundos de descarga del feed"),
+    ("segundos_parseo", "gauge", "Segundos de decodificación del feed"),
+    ("bytes", "gauge", "Tamaño del feed descargado"),
+    ("filas", "gauge", "Filas decodificadas del feed"),
+    ("error", "gauge", "1 si la descarga del feed ha fallado en el último ciclo"),
+]
+
+
+class MetricasCiclo:
+    """Métricas de un ciclo. Las etapas se cronometran con `etapa()`"""
+
+    def __init__(self, ciclo_epoch: int):
+        self.ciclo_epoch = ciclo_epoch
+        self.inicio = time.perf_counter()
+        self.etapas = {}
+        self.feeds = {}
+        self.filas = 0
+        self.fin_epoch = None
+        self.error = None
+
+    @contextmanager
+    def etapa(self, nombre: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.etapas[nombre] = self.etapas.get(nombre, 0.0) + time.perf_counter() - inicio
+
+    def registrar_feeds(self, resultados: dict) -> None:
+        """Toma las métricas de cada feed de los resultados de descargar_feeds ya decodificados"""
+        for grupo, resultado in resultados.items():
+            contenido = resultado.get('contenido')
+            timestamp = resultado.get('timestamp_feed') or None
+            self.feeds[grupo] = {
+                'timestamp_feed': timestamp,
+                'frescura': resultado['captura'] - timestamp if timestamp else None,
+                'segundos_descarga': resultado.get('segundos'),
+                'segundos_parseo': resultado.get('segundos_parseo'),
+                'bytes': len(contenido) if contenido is not None else 0,
+                'filas': resultado.get('filas', 0),
+                'error': int(contenido is None),
+            }
+
+    def fallar(self, error: Exception) -> None:
+        self.error = repr(error)
+
+    def cerrar(self, filas: int) -> None:
+        self.filas = filas
+        self.fin_epoch = time.time()
+        self.etapas['total'] = time.perf_counter() - self.inicio
+
+    @property
+    def frescura(self):
+        """Antigüedad del feed más antiguo del ciclo al terminar la escritura"""
+        timestamps = [f['timestamp_feed'] for f in self.feeds.values() if f['timestamp_feed']]
+        if not timestamps or self.fin_epoch is None:
+            return None
+        return self.fin_epoch - min(timestamps)
+
+    def a_dict(self) -> dict:
+        return {
+            'ciclo_epoch': self.ciclo_epoch,
+            'fin_epoch': self.fin_epoch,
+            'filas': self.filas,
+            'error': self.error,
+            'frescura': self.frescura,
+            'etapas': self.etapas,
+            'feeds': self.feeds,
+        }
+
+
+class ExportadorMetricas:
+    """
+    Exporta cada MetricasCiclo al fichero Prometheus y al JSONL del día.
+    Mantiene los contadores acumulados desde el arranque (ciclos, ciclos
+    fallidos y errores por feed).
+    """
+
+    def __init__(self, dir_metricas=DIR_METRICAS, prefijo: str = "metro_realtime"):
+        self.dir = Path(dir_metricas)
+        self.prefijo = prefijo
+        self.ciclos = 0
+        self.fallidos = 0
+        self.errores = {}
+
+    def texto_prometheus(self, metricas: MetricasCiclo) -> str:
+        p = self.prefijo
+        lineas = []
+
+        def metrica(nombre, tipo, ayuda, muestras):
+            lineas.append(f"# HELP {p}_{nombre} {ayuda}")
+            lineas.append(f"# TYPE {p}_{nombre} {tipo}")
+            # Los valores desconocidos (feed caído, sin timestamp) se omiten
+            for etiquetas, valor in muestras:
+                if valor is not None:
+                    lineas.append(f"{p}_{nombre}{etiquetas} {float(valor)!r}")
+
+        metrica("ciclos_total", "counter", "Ciclos ejecutados desde el arranque", [("", self.ciclos)])
+        metrica("ciclos_fallidos_total", "counter", "Ciclos fallidos desde el arranque", [("", self.fallidos)])
+        metrica("ciclo_error", "gauge", "1 si el último ciclo ha fallado", [("", int(metricas.error is not None))])
+        metrica("ciclo_epoch", "gauge", "Epoch de inicio del último ciclo", [("", metricas.ciclo_epoch)])
+        metrica("ciclo_filas", "gauge", "Filas del snapshot del último ciclo", [("", metricas.filas)])
+        metrica("ciclo_frescura", "gauge", "Segundos entre el feed más antiguo y el final del ciclo",
+                [("", metricas.frescura)])
+        metrica("etapa_segundos", "gauge", "Segundos de cada etapa del último ciclo",
+                [(f'{{etapa="{etapa}"}}', segundos) for etapa, segundos in metricas.etapas.items()])
+
+        for nombre, tipo, ayuda in METRICAS_FEED:
+            metrica(f"feed_{nombre}", tipo, ayuda,
+                    [(f'{{grupo="{grupo}"}}', feed[nombre]) for grupo, feed in metricas.feeds.items()])
+        metrica("feed_errores_total", "counter", "Descargas fallidas por feed desde el arranque",
+                [(f'{{grupo="{grupo}"}}', n) for grupo, n in self.errores.items()])
+
+        return "\n".join(lineas) + "\n"
+
+    def exportar(self, metricas: MetricasCiclo) -> None:
+        self.ciclos += 1
+        self.fallidos += int(metricas.error is not None)
+        for grupo, feed in metricas.feeds.items():
+            self.errores[grupo] = self.errores.get(grupo, 0) + feed['error']
+
+        escribir_texto_atomico(self.dir / FICHERO_PROMETHEUS, self.texto_prometheus(metricas))
+
+        dia = datetime.fromtimestamp(metricas.ciclo_epoch, tz=ZONA).strftime("%Y-%m-%d")
+        with open(self.dir / f"ciclos_{dia}.jsonl", "a") as f:
+            f.write(json.dumps(metricas.a_dict()) + "\n")
@@ -0,0 +1,155 @@
+"""
+Procesamiento del tiempo real repartido por grupos de feed en varios procesos.
+
+Cada grupo de FUENTES (ACES, BDFMS, 1234567S...) se asigna siempre al mismo
+proceso trabajador, de modo que el estado por grupo (DetectorCambios con
+--solo_cambios) vive en un único sitio. El proceso principal sólo descarga
+los feeds (E/S, en hilos) y reparte los bytes protobuf tal cual; cada
+trabajador decodifica, calcula retrasos contra su propio índice del horario
+y devuelve el resultado como un stream IPC de Arrow (bytes), sin serializar
+DataFrames con pickle. El proceso principal une las tablas de todos los
+grupos en un único snapshot por ciclo.
+
+Los trabajadores leen el horario previsto de la caché local (nunca de la
+red) y lo recargan cuando el principal les indica una versión nueva.
+
+Si el proceso de un shard muere (falta de memoria, fallo en pyarrow...), su
+executor queda roto: se sustituye por uno nuevo, cuyo trabajador arranca con
+el estado vacío (también su DetectorCambios), y el ciclo sigue con los
+demás shards.
+"""
+
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from src.common.dimensiones import codificar_lineas, codificar_paradas
+from src.tiempo_real_metro.deteccion_cambios import DetectorCambios
+from src.tiempo_real_metro.horario_previsto import DIR_CACHE, cargar_horario_previsto, indice_horario
+from src.tiempo_real_metro.realtime_data import FUENTES
+
+
+# Estado de cada proceso trabajador
+_ESTADO = {}
+
+
+def df_a_ipc(df: pd.DataFrame) -> bytes:
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    sumidero = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sumidero, tabla.schema) as escritor:
+        escritor.write_table(tabla)
+    return sumidero.getvalue().to_pybytes()
+
+
+def ipc_a_tabla(datos: bytes) -> pa.Table:
+    return pa.ipc.open_stream(pa.py_buffer(datos)).read_all()
+
+
+def _iniciar_trabajador(dir_cache, solo_cambios):
+    _ESTADO["dir_cache"] = Path(dir_cache)
+    _ESTADO["detector"] = DetectorCambios() if solo_cambios else None
+    _ESTADO["version"] = None
+
+
+def _procesar_grupos(resultados: dict, version):
+    # Import diferido: snapshots_realtime importa este módulo
+    from src.tiempo_real_metro.snapshots_realtime import procesar_ciclo
+
+    if _ESTADO["version"] != version or "indice" not in _ESTADO:
+        horario = cargar_horario_previsto(dir_cache=_ESTADO["dir_cache"], comprobar_cada=float("inf"))
+        _ESTADO["indice"] = indice_horario(horario)
+        _ESTADO["version"] = version
+
+    df = procesar_ciclo(resultados, _ESTADO["indice"], detector=_ESTADO["detector"])
+    # Las métricas de decodificación se anotan en los resultados, que aquí son una copia
+    metricas = {
+        grupo: {clave: resultado[clave] for clave in ("timestamp_feed", "filas", "segundos_parseo") if clave in resultado}
+        for grupo, resultado in resultados.items()
+    }
+    return df_a_ipc(df), metricas
+
+
+class ProcesadorShards:
+    """
+    Un ProcessPoolExecutor de un solo proceso por shard; los grupos de feed
+    se reparten entre shards por número de líneas para equilibrar la carga.
+    """
+
+    def __init__(self, procesos: int, fuentes=FUENTES, solo_cambios: bool = False, dir_cache=DIR_CACHE):
+        self.fuentes = fuentes
+        self.dir_cache = dir_cache
+        self.solo_cambios = solo_cambios
+        self.executors = [self._crear_executor() for _ in range(min(procesos, len(fuentes)))]
+
+        carga = [0] * len(self.executors)
+        self.shard_de_grupo = {}
+        for grupo in sorted(fuentes, key=lambda g: -len(fuentes[g]["lineas"])):
+            shard = carga.index(min(carga))
+            self.shard_de_grupo[grupo] = shard
+            carga[shard] += len(fuentes[grupo]["lineas"])
+
+    def _crear_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_iniciar_trabajador, initargs=(str(self.dir_cache), self.solo_cambios))
+
+    def _reiniciar(self, shard: int) -> None:
+        """Sustituye el executor roto de un shard por uno con un trabajador nuevo"""
+        self.executors[shard].shutdown(wait=False, cancel_futures=True)
+        self.executors[shard] = self._crear_executor()
+
+    def _enviar(self, shard: int, grupos: dict, version):
+        try:
+            return self.executors[shard].submit(_procesar_grupos, grupos, version)
+        except BrokenProcessPool:
+            # El trabajador murió entre dos ciclos: no se ha perdido nada de este
+            self._reiniciar(shard)
+            return self.executors[shard].submit(_procesar_grupos, grupos, version)
+
+    def procesar(self, resultados: dict, version) -> pd.DataFrame:
+        """
+        Equivalente a procesar_ciclo, con cada grupo en su proceso. Las
+        métricas de decodificación de cada feed se copian en `resultados`.
+
+        Los grupos de un shard cuyo proceso ha muerto se pierden en este
+        ciclo; el shard se reinicia para el siguiente. Si no queda ningún
+        shard con resultado, se lanza el error.
+        """
+        por_shard = [{} for _ in self.executors]
+        for grupo, resultado in resultados.items():
+            por_shard[self.shard_de_grupo[grupo]][grupo] = resultado
+
+        futuros = {
+            shard: self._enviar(shard, grupos, version)
+            for shard, grupos in enumerate(por_shard) if grupos
+        }
+        tablas, error = [], None
+        for shard, futuro in futuros.items():
+            try:
+                datos, metricas = futuro.result()
+            except BrokenProcessPool as e:
+                print(f"[procesamiento_shards] FAIL shard={shard} grupos={sorted(por_shard[shard])} "
+                      f"error={e!r}, se reinicia", file=sys.stderr)
+                self._reiniciar(shard)
+                error = e
+                continue
+            tablas.append(ipc_a_tabla(datos))
+            for grupo, valores in metricas.items():
+                resultados[grupo].update(valores)
+        if error is not None and not tablas:
+            raise error
+
+        # Cada shard trae su propio diccionario de identificadores; se unifican al pasar a pandas
+        tabla = pa.concat_tables(tablas, promote_options="permissive")
+        df = tabla.unify_dictionaries().to_pandas()
+        df["linea_id"] = codificar_lineas(df["linea_id"])
+        df["parada_id"] = codificar_paradas(df["parada_id"])
+        return df
+
+    def cerrar(self) -> None:
+        for executor in self.executors:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -14,8 +14,9 @@ PROCESO:
     1. Se extraen los datos en tiempo real de la API para cada línea y se
        construye un DataFrame con el viaje, parada, hora de llegada/salida
        real y timestamp de la extracción.
-    2. Se descargan los horarios previstos y se adaptan para que sean
-       compatibles con los datos en tiempo real.
+    2. Se cargan los horarios previstos, adaptados para que sean
+       compatibles con los datos en tiempo real, desde una caché local que
+       sólo se reconstruye cuando cambia el ZIP publicado.
     3. Se cruzan ambos DataFrames y se calcula el retraso en segundos,
        filtrando predicciones futuras y ajustando viajes que cruzan la
        medianoche.
@@ -27,15 +28,18 @@ OUTPUT:
 
 
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, wait
+import time
 import pandas as pd
 import numpy as np
+import pyarrow as pa
 from pathlib import Path
 from google.transit import gtfs_realtime_pb2
-import urllib.request
-import zipfile
-import io
-import math
+from src.common.dimensiones import codificar_lineas, codificar_paradas
+from src.common.tiempos import epoch_a_hora_local, hora_gtfs_a_segundos, segundos_a_hora
+from src.tiempo_real_metro.horario_previsto import DIR_CACHE, IndiceHorario, cargar_horario_previsto, indice_horario
 
 
 # ─────────────────────────────────────────────
@@ -77,56 +81,261 @@ FUENTES = {
 }
 
 
+# Tiempo máximo para establecer la conexión con cada endpoint
+TIMEOUT_CONEXION = 3.05
+
+# Plazo total (conexión + descarga) de cada feed dentro de un ciclo
+PLAZO_FEED = 10
+
+
+# ─────────────────────────────────────────────
+#  Descarga de feeds
+# ─────────────────────────────────────────────
+
+def crear_sesion(reintentos=2, tam_pool=len(FUENTES)):
+    """
+    Crea una sesión HTTP compartida con keep-alive, un pool de conexiones
+    con hueco para todos los feeds y reintentos ante errores del servidor.
+    Los timeouts de lectura no se reintentan: ya han consumido el plazo
+    del feed.
+    """
+    reintento = Retry(
+        total=reintentos,
+        read=0,
+        backoff_factor=0.2,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+    )
+    adaptador = HTTPAdapter(pool_connections=tam_pool, pool_maxsize=tam_pool, max_retries=reintento)
+
+    sesion = requests.Session()
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+
+def descargar_feed(sesion, url, plazo=PLAZO_FEED):
+    """
+    Descarga el contenido binario de un feed. Si la descarga completa supera
+    `plazo` segundos se lanza requests.Timeout, aunque el servidor siga
+    enviando datos poco a poco.
+
+    Se lee con read1, que devuelve en cuanto llega algo, en lugar de
+    iter_content, que espera a completar cada bloque: así el plazo se
+    comprueba con cada paquete y no cada 64 KB.
+    """
+    limite = time.monotonic() + plazo
+
+    with sesion.get(url, timeout=(TIMEOUT_CONEXION, plazo), stream=True) as response:
+        response.raise_for_status()
+        partes = []
+        while True:
+            parte = response.raw.read1(64 * 1024, decode_content=True)
+            if not parte:
+                break
+            if time.monotonic() > limite:
+                raise requests.Timeout(f"Plazo de {plazo}s superado descargando {url}")
+            partes.append(parte)
+
+    return b"".join(partes)
+
+
+def _descarga_con_metadatos(sesion, grupo, url, plazo):
+    inicio = time.monotonic()
+    resultado = {'grupo': grupo, 'url': url, 'contenido': None, 'error': None}
+    try:
+        resultado['contenido'] = descargar_feed(sesion, url, plazo)
+    except Exception as e:
+        resultado['error'] = repr(e)
+    resultado['captura'] = time.time()
+    resultado['segundos'] = time.monotonic() - inicio
+    return resultado
+
+
+def descargar_feeds(fuentes=None, sesion=None, plazo=PLAZO_FEED):
+    """
+    Descarga todos los feeds a la vez sobre una sesión compartida.
+
+    Cada feed tiene su propio plazo, de modo que uno lento no bloquea al
+    resto: la latencia del ciclo queda acotada por el feed más lento y no
+    por la suma de todos. Los feeds que fallan o no terminan a tiempo se
+    devuelven con 'contenido' a None y el motivo en 'error'.
+
+    Devuelve un diccionario {grupo: {'grupo', 'url', 'contenido', 'error',
+    'captura', 'segundos'}}.
+    """
+    fuentes = FUENTES if fuentes is None else fuentes
+    sesion = crear_sesion(tam_pool=len(fuentes)) if sesion is None else sesion
+
+    executor = ThreadPoolExecutor(max_workers=len(fuentes))
+    futuros = {
+        executor.submit(_descarga_con_metadatos, sesion, grupo, info['url'], plazo): grupo
+        for grupo, info in fuentes.items()
+    }
+
+    # Margen para los reintentos internos del adaptador: pasado el plazo, los
+    # feeds pendientes se dan por perdidos en este ciclo
+    hechos, _ = wait(futuros, timeout=plazo + TIMEOUT_CONEXION)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    resultados = {}
+    for futuro, grupo in futuros.items():
+        if futuro in hechos:
+            resultados[grupo] = futuro.result()
+        else:
+            resultados[grupo] = {
+                'grupo': grupo, 'url': fuentes[grupo]['url'], 'contenido': None,
+                'error': f"Plazo de {plazo}s superado", 'captura': time.time(), 'segundos': plazo,
+            }
+    return resultados
+
+
 # ─────────────────────────────────────────────
 #  Datos a DataFrame
 # ─────────────────────────────────────────────
 
+# Esquema columnar de los trip updates decodificados. Los identificadores van
+# codificados como diccionario y los tiempos como epoch (segundos UTC);
+# llegada/partida son nulos si el feed no los trae
+IDENTIFICADOR = pa.dictionary(pa.int32(), pa.string())
+
+ESQUEMA_TIEMPO_REAL = pa.schema([
+    ('viaje_id', IDENTIFICADOR),
+    ('linea_id', IDENTIFICADOR),
+    ('parada_id', IDENTIFICADOR),
+    ('llegada_epoch', pa.int64()),
+    ('partida_epoch', pa.int64()),
+    ('captura_epoch', pa.int64()),
+])
+
+
+def decodificar_feed(contenido, lineas, captura=None, metricas=None):
+    """
+    Decodifica un feed ya descargado directamente a columnas Arrow.
+
+    Se reparten los trip updates por route_id en una sola pasada y cada
+    stop_time_update se escribe en arrays NumPy reservados de antemano, sin
+    crear un diccionario ni un datetime por fila. Todas las filas comparten
+    un único timestamp de captura (epoch), el del momento de la descarga.
+
+    Si se pasa un diccionario `metricas`, se anotan en él el timestamp de la
+    cabecera del feed (timestamp_feed, 0 si no lo trae) y las filas generadas.
+    """
+    fuentes = gtfs_realtime_pb2.FeedMessage()
+    fuentes.ParseFromString(contenido)
+
+    lineas = set(lineas)
+    trayectos = [
+        entity.trip_update for entity in fuentes.entity
+        if entity.HasField('trip_update') and entity.trip_update.trip.route_id in lineas
+    ]
+
+    n = sum(len(trayecto.stop_time_update) for trayecto in trayectos)
+    viaje_id = np.empty(n, dtype=object)
+    linea_id = np.empty(n, dtype=object)
+    parada_id = np.empty(n, dtype=object)
+    llegada = np.zeros(n, dtype=np.int64)
+    partida = np.zeros(n, dtype=np.int64)
+
+    i = 0
+    for trayecto in trayectos:
+        fin = i + len(trayecto.stop_time_update)
+        viaje_id[i:fin] = trayecto.trip.trip_id
+        linea_id[i:fin] = trayecto.trip.route_id
+        for j, stop in enumerate(trayecto.stop_time_update, i):
+            parada_id[j] = stop.stop_id
+            # Un campo ausente en protobuf se lee como 0
+            llegada[j] = stop.arrival.time
+            partida[j] = stop.departure.time
+        i = fin
+
+    captura = int(time.time() if captura is None else captura)
+    if metricas is not None:
+        metricas['timestamp_feed'] = fuentes.header.timestamp
+        metricas['filas'] = n
+
+    return pa.RecordBatch.from_arrays([
+        pa.array(viaje_id, type=pa.string()).dictionary_encode(),
+        pa.array(linea_id, type=pa.string()).dictionary_encode(),
+        pa.array(parada_id, type=pa.string()).dictionary_encode(),
+        pa.array(llegada, mask=llegada == 0),
+        pa.array(partida, mask=partida == 0),
+        pa.array(np.full(n, captura, dtype=np.int64)),
+    ], schema=ESQUEMA_TIEMPO_REAL)
+
+
+def batches_a_dataframe(batches):
+    """
+    Une los batches decodificados en un DataFrame. Los epochs se mantienen
+    como enteros (Int64 con nulos) en lugar de pasar a float, y los
+    identificadores como categóricos; línea y parada sobre las dimensiones
+    del proceso.
+    """
+    tabla = pa.Table.from_batches(batches, schema=ESQUEMA_TIEMPO_REAL)
+    df = tabla.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+    df['linea_id'] = codificar_lineas(df['linea_id'])
+    df['parada_id'] = codificar_paradas(df['parada_id'])
+    return df
+
+
+def extraccion_grupo(url, lineas, sesion=None, plazo=PLAZO_FEED):
+    """
+    Extrae los datos de todas las líneas de un mismo feed.
+
+    El feed se descarga y se decodifica una única vez.
+    """
+    sesion = crear_sesion(tam_pool=1) if sesion is None else sesion
+    return decodificar_feed(descargar_feed(sesion, url, plazo), lineas)
+
+
 def extraccion_linea(url, linea):
     """
     Extrae los datos de una línea
     """
-    response = requests.get(url)
-    fuentes = gtfs_realtime_pb2.FeedMessage()
-    fuentes.ParseFromString(response.content)
+    return batches_a_dataframe([extraccion_grupo(url, [linea])])
 
-    datos_linea = []
-    for entity in fuentes.entity:
-        if entity.HasField('trip_update'):
-            trayecto = entity.trip_update
 
-            if trayecto.trip.route_id == linea:
-                for stop in trayecto.stop_time_update:
-                    campos = {
-                        'viaje_id': trayecto.trip.trip_id,
-                        'linea_id': trayecto.trip.route_id,
-                        'parada_id': stop.stop_id,
-                        'hora_llegada': datetime.fromtimestamp(stop.arrival.time) if stop.HasField('arrival') else None,
-                        'hora_partida': datetime.fromtimestamp(stop.departure.time) if stop.HasField('departure') else None,
-                        'timestamp': datetime.now(),                       
-                    }
+def extraccion_datos(concurrente=True, sesion=None, plazo=PLAZO_FEED, fuentes=None):
+    """
+    Descarga cada feed de FUENTES una sola vez y unifica la información
+    de todas sus líneas en una dataframe.
+
+    Con concurrente=True todos los feeds se piden a la vez; los que fallan se
+    omiten y el ciclo devuelve los datos del resto.
+    """
+    fuentes = FUENTES if fuentes is None else fuentes
+    sesion = crear_sesion(tam_pool=len(fuentes)) if sesion is None else sesion
 
-                    datos_linea.append(campos)
-    return datos_linea
+    if concurrente:
+        resultados = descargar_feeds(fuentes, sesion, plazo)
+    else:
+        resultados = {
+            grupo: _descarga_con_metadatos(sesion, grupo, info['url'], plazo)
+            for grupo, info in fuentes.items()
+        }
 
+    return decodificar_resultados(resultados, fuentes)
 
-def extraccion_datos():
+
+def decodificar_resultados(resultados, fuentes=FUENTES):
     """
-    Repite la función anterior para cada linea y unifica la información
-    de cada una de ellas en una dataframe
+    Decodifica el resultado de descargar_feeds en un único DataFrame,
+    omitiendo los feeds que han fallado.
+
+    Cada resultado decodificado se completa con timestamp_feed, filas y
+    segundos_parseo (ver metricas.py).
     """
+    batches = []
+    for grupo, resultado in resultados.items():
+        if resultado['contenido'] is None:
+            print(f"  Error descargando feed {grupo}: {resultado['error']}")
+            continue
 
-    todas_las_lineas = []
-    for info in FUENTES.values():
-        todas_las_lineas.extend(info['lineas'])
-    
-    todos_los_datos = []
-    for linea in todas_las_lineas:
-        for grupo, info in FUENTES.items():
-            if linea in info['lineas']:
-                fuentes_url = info['url']
-            todos_los_datos.extend(extraccion_linea(fuentes_url, linea))  
+        inicio = time.perf_counter()
+        batches.append(decodificar_feed(resultado['contenido'], fuentes[grupo]['lineas'], resultado['captura'], resultado))
+        resultado['segundos_parseo'] = time.perf_counter() - inicio
 
-    return pd.DataFrame(todos_los_datos)
+    return batches_a_dataframe(batches)
 
 
 # ─────────────────────────────────────────────
@@ -137,12 +346,16 @@ def extraccion_datos():
 def conversion_hora_NYC(df):
 
     """
-    Para las variables de tipo datetime, modifica el valor a la hora local de NY
+    A partir de los epochs (UTC) calcula, en hora local de NY, los segundos
+    desde medianoche de la llegada real y el día de la semana de la captura. Cada columna se convierte completa de una vez y
+    los epochs se conservan.
     """
-    
-    df['hora_llegada'] = df['hora_llegada'].dt.tz_localize('UTC').dt.tz_convert('America/New_York')  
-    df['hora_partida'] = df['hora_partida'].dt.tz_localize('UTC').dt.tz_convert('America/New_York')
-    df['timestamp'] = df['timestamp'].dt.tz_localize('UTC').dt.tz_convert('America/New_York')
+
+    segundos_llegada, _ = epoch_a_hora_local(df['llegada_epoch'])
+    _, dia_captura = epoch_a_hora_local(df['captura_epoch'])
+
+    df['segundos_reales'] = segundos_llegada
+    df['dow'] = dia_captura
 
     return df
 
@@ -152,17 +365,12 @@ def dia_segun_fecha_y_formato(df):
     Según el dia en el que se ha hecho la extracción, crea una nueva variable
     que lo clasifica en 3 grupos (Weekday, Saturday, Sunday).
 
-    Posteriormente cambia el formato de las horas y lo convierte a string.
+    Las horas se mantienen como enteros; el formato HH:MM:SS se genera
+    sólo en la salida.
     """
 
-    df['dia'] = df['timestamp'].dt.strftime("%A")
-    df['dia'] = df['dia'].apply(
-        lambda x: 'Weekday' if x not in ('Saturday', 'Sunday') else x
-    )
-
-    df['hora_llegada'] = df['hora_llegada'].dt.strftime('%H:%M:%S')
-    df['hora_partida'] = df['hora_partida'].dt.strftime('%H:%M:%S')
-    df['timestamp'] = df['timestamp'].dt.strftime('%H:%M:%S')
+    dow = df['dow'].to_numpy()
+    df['dia'] = np.where(dow == 5, 'Saturday', np.where(dow == 6, 'Sunday', 'Weekday'))
 
     return df
 
@@ -172,13 +380,8 @@ def direccion_tren(df):
     Según el id de cada parada, se crea una nueva columna que contiene la dirección del tren (0,1)
     """
 
-    norte = (df['parada_id'].str[-1] == 'N')
-    sur = (df['parada_id'].str[-1] == 'S')
-
-    df.loc[norte, 'direccion'] = 1 #Dirección Norte
-    df.loc[sur, 'direccion'] = 0 #Dirección Sur
-
-    df['direccion'] = df['direccion'].astype('Int64')
+    #Dirección Norte = 1, Dirección Sur = 0
+    df['direccion'] = df['parada_id'].str[-1].map({'N': 1, 'S': 0}).astype('Int64')
 
     return df
 
@@ -188,40 +391,23 @@ def normalizar_horas(columna):
     """
     Para horas mayores a 24 horas, se convierte a hora del día siguiente
     """
-    columna = columna.str.replace('24:', '00:', regex=False)
-    columna = columna.str.replace('25:', '01:', regex=False)
-    columna = columna.str.replace('26:', '02:', regex=False)
-    columna = columna.str.replace('27:', '03:', regex=False)
-    return columna
+    return pd.Series(segundos_a_hora(hora_a_segundos(columna)), index=columna.index)
 
 def hora_a_segundos(hora):
 
     """
-    Dado un string con una hora, se calculan los segundos totales
+    Dada una columna de horas en string, se calculan los segundos totales
     """
-    if pd.isna(hora): 
-        return np.nan
-    
-    partes = hora.split(':')
-
-    return int(partes[0]) * 3600 + int(partes[1]) * 60 + int(partes[2])
+    return hora_gtfs_a_segundos(hora)
 
 
 def hora_posterior(hora1, hora2):
 
     """
-    Comprueba si la hora dada como primer parámetro es mayor
-    segunda.
+    Comprueba, elemento a elemento, si la hora dada como primer parámetro
+    es mayor que la segunda.
     """
-    
-    partes1 = hora1.split(':')
-    partes2 = hora2.split(':')
-
-    return (
-        (int(partes1[0]) > int(partes2[0])) | 
-        ((int(partes1[0]) == int(partes2[0])) & (int(partes1[1]) > int(partes2[1]))) |
-        ((int(partes1[0]) == int(partes2[0])) & (int(partes1[1]) == int(partes2[1])) & ((int(partes1[2]) > int(partes2[2]))))
-    )
+    return hora_a_segundos(hora1) > hora_a_segundos(hora2)
 
 def filter_delay_outliers(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -231,15 +417,14 @@ def filter_delay_outliers(df: pd.DataFrame) -> pd.DataFrame:
 
 def dia_a_numerico(df):
 
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df['dow'] = df['timestamp'].dt.dayofweek
-    df['is_weekend'] = df['dow'].isin([5, 6]).astype(int)
+    df['dow'] = df['dow'].astype(int)
+    df['is_weekend'] = (df['dow'] >= 5).astype(int)
     return df
 
 def hora_ciclica(df):
-    hour_float = df["hora_llegada"].str.split(':').str[0].astype("float")
-    df["hour_sin"] = hour_float.apply(lambda h: math.sin(2 * math.pi * h / 24) if pd.notna(h) else None)
-    df["hour_cos"] = hour_float.apply(lambda h: math.cos(2 * math.pi * h / 24) if pd.notna(h) else None)
+    angulo = 2 * np.pi * (df["segundos_reales"].to_numpy(dtype=float) // 3600) / 24
+    df["hour_sin"] = np.sin(angulo)
+    df["hour_cos"] = np.cos(angulo)
 
     return df
 
@@ -255,7 +440,16 @@ def creacion_df_tiempo_real():
     Creación de dataframe de tiempo real
     """
 
-    df = extraccion_datos()
+    return preparar_tiempo_real(extraccion_datos())
+
+
+def preparar_tiempo_real(df):
+
+    """
+    Añade al DataFrame decodificado los segundos reales, el tipo de día y la
+    dirección del tren
+    """
+
     conversion_hora_NYC(df)
     dia_segun_fecha_y_formato(df)
     direccion_tren(df)
@@ -263,7 +457,7 @@ def creacion_df_tiempo_real():
     #Eliminación de filas con nulos en alguna columna
     df = df.dropna()
 
-    df['segundos_reales'] = df['hora_llegada'].apply(hora_a_segundos)
+    df['segundos_reales'] = df['segundos_reales'].astype('int64')
 
     return df
 
@@ -273,33 +467,17 @@ def creacion_df_tiempo_real():
 # ─────────────────────────────────────────────
 
 
-def creacion_df_previsto():
+def creacion_df_previsto(dir_cache=DIR_CACHE):
 
     """
-    Creación de dataframe de horarios previstos
-    """
-
-    url = "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_supplemented.zip"
-
-    with urllib.request.urlopen(url) as response:
-        zip_data = io.BytesIO(response.read())
-
-    with zipfile.ZipFile(zip_data, 'r') as z:
-        with z.open("stop_times.txt") as f:
-            df = pd.read_csv(f)
+    Creación de dataframe de horarios previstos.
 
-    #Día en el que se lleva a cabo el servivio, viene dado como parte del trip_id
-    df['day'] = df['trip_id'].str.split('-').str[-2]
-
-    #Modificamos trip_id para que tenga el mismo formato que el id del otro dataframe
-    df['trip_id'] = df['trip_id'].str.split('_', n=1).str[-1]
-
-    df['arrival_time'] = normalizar_horas(df['arrival_time'])
-    df['departure_time'] = normalizar_horas(df['departure_time'])
-
-    df['segundos_previstos'] = df['arrival_time'].apply(hora_a_segundos)
+    La tabla preparada se guarda en una caché local (Parquet) asociada a la
+    versión del ZIP, de modo que sólo se vuelve a descargar y procesar
+    stop_times.txt cuando el feed cambia.
+    """
 
-    return df
+    return cargar_horario_previsto(dir_cache=dir_cache)
 
 
 # ─────────────────────────────────────────────
@@ -309,32 +487,47 @@ def creacion_df_previsto():
 def union_dataframes(df1, df2):
 
     """
-    Une los dos dataframes anteriores
+    Une los dos dataframes anteriores.
+
+    df2 puede ser el DataFrame de horarios previstos o directamente su
+    IndiceHorario; en el primer caso el índice se construye una sola vez por
+    versión del horario y se reutiliza en los ciclos siguientes.
+
+    La salida conserva llegada_epoch para quien necesita el instante exacto
+    de cada llegada (headways, predicción).
     """
 
-    df = pd.merge(df1, df2, left_on=['viaje_id', 'parada_id', 'dia'], right_on=['trip_id', 'stop_id', 'day'])
+    indice = df2 if isinstance(df2, IndiceHorario) else indice_horario(df2)
+
+    posiciones = indice.buscar(df1['viaje_id'], df1['parada_id'], df1['dia'])
+    encontradas = posiciones >= 0
+
+    df = df1[encontradas].copy()
+    df['stop_sequence'] = indice.stop_sequence[posiciones[encontradas]]
+    df['segundos_previstos'] = indice.segundos_previstos[posiciones[encontradas]]
     
     #Calcula el retraso de los trenes restando el tiempo de llegada actual menos el tiempo de llegada previsto
-    df['delay'] = df['segundos_reales']-df['segundos_previstos']
+    delay = df['segundos_reales'].to_numpy(dtype=float) - df['segundos_previstos'].to_numpy(dtype=float)
 
     #Ajuste para viajes que deberían llegar al final del día (23:00) pero por retraso llega al día siguiente
-    df.loc[df['delay'] > 43200, 'delay'] -= 86400
-    df.loc[df['delay'] < -43200, 'delay'] += 86400
+    delay = np.where(delay > 43200, delay - 86400, delay)
+    delay = np.where(delay < -43200, delay + 86400, delay)
 
     #Comprueba que los datos dados son de trenes que ya han realizado sus paradas y no son predicciones que realiza la
-    # api para el futuro de los trayectos. Los que son predicciones marcamos el delay a None
-    df['delay'] = np.where(
-    df.apply(lambda row: hora_posterior(row['timestamp'], row['hora_llegada']), axis=1),
-    df['delay'],  # valor si True
-    None    # valor si False
-    )
+    # api para el futuro de los trayectos. Al comparar epochs no hay problema con los viajes que cruzan la medianoche
+    pasado = df['llegada_epoch'].to_numpy(dtype='int64') < df['captura_epoch'].to_numpy(dtype='int64')
+    df['delay'] = np.where(pasado, delay, np.nan)
 
     #Filtro para delays con valores masivos y transformacion del día de la semana a valor numérico
     df = filter_delay_outliers(df)
     df = dia_a_numerico(df)
     df = hora_ciclica(df)
 
-    df = df.drop(['dia', 'hora_partida','timestamp', 'segundos_reales', 'trip_id', 'stop_id', 'arrival_time', 'departure_time', 'day', 'segundos_previstos'], axis=1)
+    #Único paso a string: la hora de llegada en la salida
+    df['hora_llegada'] = segundos_a_hora(df['segundos_reales'])
+
+    df = df[['viaje_id', 'linea_id', 'parada_id', 'hora_llegada', 'llegada_epoch', 'direccion', 'stop_sequence',
+             'delay', 'dow', 'is_weekend', 'hour_sin', 'hour_cos']]
     df = df.dropna()
 
     return df
@@ -0,0 +1,379 @@
+"""
+Servicio continuo de snapshots en tiempo real.
+
+Cada `--intervalo` segundos descarga todos los feeds GTFS-Realtime de la MTA,
+calcula el retraso de cada tren frente al horario previsto (en caché) y
+acumula el resultado en memoria. Cada `--ciclos_por_objeto` ciclos (o al
+cambiar de día, o al parar el servicio) el buffer se sube a MinIO como un
+único Parquet compacto, para no generar miles de objetos pequeños.
+
+Escribe a (MinIO):
+    grupo5/analytics/snapshots_realtime/date=YYYY-MM-DD/snapshots_YYYY-MM-DD_HHMMSS_HHMMSS.parquet
+
+Uso:
+    uv run python -m src.tiempo_real_metro.snapshots_realtime --intervalo 30 --ciclos_por_objeto 20
+
+Con --solo_cambios sólo se procesan y guardan las observaciones nuevas o
+modificadas desde el ciclo anterior (ver deteccion_cambios).
+
+Con --estado_anomalias RUTA.npz cada ciclo pasa también por el detector de
+anomalías (src.analytics.anomalias), que imprime las alertas de parada y de
+línea y guarda su estado en esa ruta para arrancar en caliente. Si la ruta no
+existe todavía, el detector se siembra con los últimos --dias_semilla días
+del histórico.
+
+Con --headways se calculan también los headways en tiempo real de las
+llegadas nuevas de cada ciclo (src.analytics.headways) y se suben por bloques
+de ciclos igual que los snapshots, a
+    grupo5/analytics/headways_realtime/date=YYYY-MM-DD/headways_YYYY-MM-DD_HHMMSS_HHMMSS.parquet
+
+Con --procesos N > 1 la decodificación y el cálculo de retrasos se reparten
+por grupos de feed entre N procesos (ver procesamiento_shards).
+
+Se detiene de forma ordenada con Ctrl+C / SIGTERM: termina el ciclo en curso
+y sube lo que quede en el buffer.
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from typing import List, Tuple
+
+import pandas as pd
+
+from src.analytics.anomalias import DIAS_SEMILLA, DetectorAnomalias, alertas_ciclo, cargar_o_sembrar
+from src.analytics.headways import HeadwaysTiempoReal, build_headways_realtime_object
+from src.common.dimensiones import concatenar
+from src.common.minio_client import upload_df_parquet
+from src.tiempo_real_metro.deteccion_cambios import DetectorCambios, FiltroObservaciones
+from src.tiempo_real_metro.horario_previsto import COMPROBAR_CADA, cargar_horario_previsto, indice_horario
+from src.tiempo_real_metro.metricas import DIR_METRICAS, ExportadorMetricas, MetricasCiclo
+from src.tiempo_real_metro.procesamiento_shards import ProcesadorShards
+from src.tiempo_real_metro.realtime_data import (
+    FUENTES,
+    crear_sesion,
+    decodificar_resultados,
+    descargar_feeds,
+    preparar_tiempo_real,
+    union_dataframes,
+)
+
+
+PREFIJO_SNAPSHOTS = "grupo5/analytics/snapshots_realtime"
+
+INTERVALO = 30
+CICLOS_POR_OBJETO = 20
+
+# Si MinIO no responde, como mucho se guardan en memoria estos objetos pendientes
+MAX_OBJETOS_PENDIENTES = 3
+
+
+def build_snapshot_object(dia: str, desde: str, hasta: str) -> str:
+    return f"{PREFIJO_SNAPSHOTS}/date={dia}/snapshots_{dia}_{desde}_{hasta}.parquet"
+
+
+def procesar_ciclo(resultados, indice, fuentes=FUENTES, detector=None, metricas=None) -> pd.DataFrame:
+    """
+    Convierte el resultado de descargar_feeds en el DataFrame de retrasos del
+    ciclo. Los feeds que han fallado se omiten.
+
+    Con un DetectorCambios sólo se procesan las observaciones nuevas o que
+    han cambiado desde el ciclo anterior.
+
+    Con un MetricasCiclo se cronometra cada etapa (decodificacion,
+    preparacion y cruce con el horario).
+    """
+    metricas = MetricasCiclo(0) if metricas is None else metricas
+    with metricas.etapa('decodificacion'):
+        df = decodificar_resultados(resultados, fuentes)
+        if detector is not None:
+            df = detector.filtrar(df)
+    with metricas.etapa('preparacion'):
+        df = preparar_tiempo_real(df)
+    with metricas.etapa('cruce'):
+        return union_dataframes(df, indice)
+
+
+def compactar_snapshot(df: pd.DataFrame, ciclo_epoch: int) -> pd.DataFrame:
+    """
+    Reduce tipos para que cada ciclo ocupe lo mínimo en memoria y en Parquet
+    """
+    return pd.DataFrame({
+        'ciclo_epoch': pd.Series(ciclo_epoch, index=df.index, dtype='int64'),
+        'viaje_id': df['viaje_id'].astype('category'),
+        'linea_id': df['linea_id'].astype('category'),
+        'parada_id': df['parada_id'].astype('category'),
+        'direccion': df['direccion'].astype('int8'),
+        'stop_sequence': df['stop_sequence'].astype('int16'),
+        'hora_llegada': df['hora_llegada'].astype('string'),
+        'delay': df['delay'].astype('int32'),
+        'dow': df['dow'].astype('int8'),
+        'is_weekend': df['is_weekend'].astype('int8'),
+        'hour_sin': df['hour_sin'].astype('float32'),
+        'hour_cos': df['hour_cos'].astype('float32'),
+    })
+
+
+def detectar_anomalias(detector: DetectorAnomalias, df: pd.DataFrame,
+                       vistas: FiltroObservaciones = None) -> pd.DataFrame:
+    """
+    Puntúa los retrasos del ciclo y devuelve sus alertas. Con `vistas` sólo
+    se puntúan las llegadas que no se habían visto en ciclos anteriores, para
+    que una misma observación republicada no mueva la línea base ni repita
+    la alerta en cada ciclo.
+    """
+    if vistas is not None:
+        df = vistas.filtrar(df)
+    hora = df['hora_llegada'].str[:2].to_numpy(dtype='int64')
+    hora_semana = df['dow'].to_numpy(dtype='int64') * 24 + hora
+    puntuaciones = detector.actualizar(df['linea_id'], df['parada_id'], hora_semana, df['delay'])
+    return alertas_ciclo(puntuaciones)
+
+
+def _dia_y_hora(epoch):
+    """Fecha (YYYY-MM-DD) y hora (HHMMSS) locales de NY de un epoch"""
+    fecha = pd.Timestamp(epoch, unit='s', tz='UTC').tz_convert('America/New_York')
+    return fecha.strftime('%Y-%m-%d'), fecha.strftime('%H%M%S')
+
+
+class EscritorSnapshots:
+    """
+    Acumula los snapshots de varios ciclos y los sube a MinIO como un único
+    objeto por bloque de ciclos y día. El nombre de cada objeto sale de
+    construir_objeto(dia, hora_desde, hora_hasta).
+    """
+
+    def __init__(self, access_key: str, secret_key: str, ciclos_por_objeto: int = CICLOS_POR_OBJETO,
+                 construir_objeto=build_snapshot_object):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.ciclos_por_objeto = ciclos_por_objeto
+        self.construir_objeto = construir_objeto
+        self.buffer: List[Tuple[int, pd.DataFrame]] = []
+        self.pendientes: List[Tuple[str, pd.DataFrame]] = []
+
+    def añadir(self, snapshot: pd.DataFrame, ciclo_epoch: int) -> None:
+        # Un objeto nunca mezcla dos días
+        if self.buffer and _dia_y_hora(self.buffer[0][0])[0] != _dia_y_hora(ciclo_epoch)[0]:
+            self.vaciar()
+
+        self.buffer.append((ciclo_epoch, snapshot))
+        if len(self.buffer) >= self.ciclos_por_objeto:
+            self.vaciar()
+
+    def vaciar(self) -> None:
+        if self.buffer:
+            dia, hora_desde = _dia_y_hora(self.buffer[0][0])
+            _, hora_hasta = _dia_y_hora(self.buffer[-1][0])
+            df = concatenar(snapshot for _, snapshot in self.buffer)
+            self.pendientes.append((self.construir_objeto(dia, hora_desde, hora_hasta), df))
+            self.buffer = []
+
+        while self.pendientes:
+            objeto, df = self.pendientes[0]
+            try:
+                upload_df_parquet(self.access_key, self.secret_key, objeto, df)
+            except Exception as e:
+                print(f"[snapshots_realtime] FAIL subida {objeto}: {e!r}", file=sys.stderr)
+                # Se reintenta en el siguiente vaciado, descartando lo más antiguo si se acumula
+                del self.pendientes[:-MAX_OBJETOS_PENDIENTES]
+                return
+            print(f"[snapshots_realtime] Subido {objeto} ({len(df)} filas)")
+            self.pendientes.pop(0)
+
+
+def ejecutar(access_key: str, secret_key: str, intervalo: float = INTERVALO,
+             ciclos_por_objeto: int = CICLOS_POR_OBJETO, parar: threading.Event = None,
+             solo_cambios: bool = False, estado_anomalias: str = None, procesos: int = 1,
+             dir_metricas=DIR_METRICAS, dias_semilla: int = DIAS_SEMILLA, headways: bool = False) -> None:
+    """
+    Bucle principal: un ciclo cada `intervalo` segundos hasta que se activa
+    `parar`. Si un ciclo tarda más que el intervalo, el siguiente empieza
+    inmediatamente y se avisa del retraso en lugar de acumular ciclos.
+
+    Con solo_cambios=True cada snapshot contiene únicamente las
+    observaciones nuevas o modificadas respecto al ciclo anterior.
+
+    Con estado_anomalias se ejecuta el detector de anomalías en cada ciclo y
+    su estado se guarda en esa ruta cada `ciclos_por_objeto` ciclos y al parar.
+    Si la ruta no existe, se siembra con los últimos `dias_semilla` días.
+    El detector sólo recibe cada (viaje, parada, llegada) la primera vez que
+    aparece, con o sin solo_cambios.
+
+    Con headways=True se calculan los headways de las llegadas nuevas de cada
+    ciclo y se suben igual que los snapshots.
+
+    Con procesos > 1 cada grupo de feed se procesa en su propio proceso.
+
+    Las métricas de frescura y latencia de cada ciclo se exportan en
+    dir_metricas (fichero Prometheus y JSONL, ver metricas.py); con
+    dir_metricas=None no se exportan.
+    """
+    parar = threading.Event() if parar is None else parar
+    shards = ProcesadorShards(procesos, solo_cambios=solo_cambios) if procesos > 1 else None
+    detector = DetectorCambios() if solo_cambios and shards is None else None
+    anomalias, vistas = None, None
+    if estado_anomalias is not None:
+        anomalias = cargar_o_sembrar(estado_anomalias, access_key, secret_key, dias_semilla)
+        vistas = FiltroObservaciones()
+    exportador = ExportadorMetricas(dir_metricas) if dir_metricas is not None else None
+    ciclos = 0
+    sesion = crear_sesion()
+    escritor = EscritorSnapshots(access_key, secret_key, ciclos_por_objeto)
+    headways_rt, escritor_headways = None, None
+    if headways:
+        headways_rt = HeadwaysTiempoReal()
+        escritor_headways = EscritorSnapshots(access_key, secret_key, ciclos_por_objeto, build_headways_realtime_object)
+
+    horario = cargar_horario_previsto(sesion=sesion)
+    indice = indice_horario(horario)
+    ultima_carga_horario = time.monotonic()
+
+    proximo = time.monotonic()
+    while not parar.is_set():
+        inicio = time.monotonic()
+        ciclo_epoch = int(time.time())
+        metricas = MetricasCiclo(ciclo_epoch)
+        resultados, filas = {}, 0
+        try:
+            if inicio - ultima_carga_horario >= COMPROBAR_CADA:
+                horario = cargar_horario_previsto(sesion=sesion)
+                indice = indice_horario(horario)
+                ultima_carga_horario = inicio
+
+            with metricas.etapa('descarga'):
+                resultados = descargar_feeds(sesion=sesion)
+            if shards is not None:
+                with metricas.etapa('shards'):
+                    df = shards.procesar(resultados, horario.attrs.get('version'))
+            else:
+                df = procesar_ciclo(resultados, indice, detector=detector, metricas=metricas)
+            with metricas.etapa('escritura'):
+                escritor.añadir(compactar_snapshot(df, ciclo_epoch), ciclo_epoch)
+
+            if headways_rt is not None:
+                with metricas.etapa('headways'):
+                    nuevos = headways_rt.actualizar_ciclo(df)
+                    escritor_headways.añadir(nuevos.assign(ciclo_epoch=ciclo_epoch), ciclo_epoch)
+
+            if anomalias is not None:
+                with metricas.etapa('anomalias'):
+                    alertas = detectar_anomalias(anomalias, df, vistas)
+                for alerta in alertas.itertuples(index=False):
+                    print(f"[snapshots_realtime] ALERTA {alerta.tipo} linea={alerta.linea_id} "
+                          f"parada={alerta.parada_id} z={alerta.z_score:.1f} delay={alerta.delay:.0f}")
+                ciclos += 1
+                if ciclos % ciclos_por_objeto == 0:
+                    anomalias.guardar(estado_anomalias)
+            filas = len(df)
+        except Exception as e:
+            metricas.fallar(e)
+            print(f"[snapshots_realtime] FAIL ciclo error={e!r}", file=sys.stderr)
+        finally:
+            # Los ciclos fallidos también se exportan (ciclo_error y ciclos_fallidos_total)
+            metricas.registrar_feeds(resultados)
+            metricas.cerrar(filas)
+            if exportador is not None:
+                try:
+                    exportador.exportar(metricas)
+                except Exception as e:
+                    print(f"[snapshots_realtime] FAIL métricas error={e!r}", file=sys.stderr)
+
+        if metricas.error is None:
+            frescura = metricas.frescura
+            print(f"[snapshots_realtime] ciclo filas={filas} segundos={time.monotonic() - inicio:.2f}"
+                  + (f" frescura={frescura:.0f}s" if frescura is not None else ""))
+
+        proximo += intervalo
+        ahora = time.monotonic()
+        if proximo < ahora:
+            print(f"[snapshots_realtime] Ciclo más lento que el intervalo ({ahora - inicio:.1f}s > {intervalo}s)", file=sys.stderr)
+            proximo = ahora
+        parar.wait(proximo - ahora)
+
+    escritor.vaciar()
+    if escritor_headways is not None:
+        escritor_headways.vaciar()
+    if shards is not None:
+        shards.cerrar()
+    if anomalias is not None:
+        anomalias.guardar(estado_anomalias)
+    print("[snapshots_realtime] Detenido.")
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Servicio continuo que guarda snapshots de retrasos en tiempo real en MinIO."
+    )
+    parser.add_argument(
+        "--intervalo",
+        type=float,
+        default=INTERVALO,
+        help="Segundos entre ciclos de consulta a la MTA.",
+    )
+    parser.add_argument(
+        "--ciclos_por_objeto",
+        type=int,
+        default=CICLOS_POR_OBJETO,
+        help="Ciclos que se agrupan en cada objeto Parquet subido a MinIO.",
+    )
+    parser.add_argument(
+        "--solo_cambios",
+        action="store_true",
+        help="Procesa y guarda sólo las observaciones nuevas o modificadas entre ciclos.",
+    )
+    parser.add_argument(
+        "--estado_anomalias",
+        default=None,
+        help="Ruta .npz del estado del detector de anomalías (se activa al indicarla).",
+    )
+    parser.add_argument(
+        "--dias_semilla",
+        type=int,
+        default=DIAS_SEMILLA,
+        help="Días de histórico con los que sembrar el detector si no hay estado guardado (0 = en frío).",
+    )
+    parser.add_argument(
+        "--headways",
+        action="store_true",
+        help="Calcula y guarda los headways en tiempo real de las llegadas nuevas de cada ciclo.",
+    )
+    parser.add_argument(
+        "--procesos",
+        type=int,
+        default=1,
+        help="Procesos entre los que repartir los grupos de feed (1 = todo en el proceso principal).",
+    )
+    parser.add_argument(
+        "--dir_metricas",
+        default=str(DIR_METRICAS),
+        help="Directorio del fichero Prometheus y del JSONL de métricas por ciclo (vacío = no exportar).",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+
+    access_key = os.getenv("MINIO_ACCESS_KEY")
+    if access_key is None:
+        raise AssertionError("MINIO_ACCESS_KEY no definida")
+
+    secret_key = os.getenv("MINIO_SECRET_KEY")
+    if secret_key is None:
+        raise AssertionError("MINIO_SECRET_KEY no definida")
+
+    parar = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: parar.set())
+
+    ejecutar(access_key, secret_key, args.intervalo, args.ciclos_por_objeto, parar, args.solo_cambios,
+             args.estado_anomalias, args.procesos, args.dir_metricas or None, args.dias_semilla, args.headways)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
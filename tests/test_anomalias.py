@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+from src.analytics.anomalias import (
+    ESCALA_MINIMA,
+    DetectorAnomalias,
+    alertas_ciclo,
+    claves_detector,
+    sembrar_desde_historico,
+)
+
+
+def _observar(detector, retrasos):
+    n = len(retrasos)
+    return detector.actualizar(["A"] * n, ["101N"] * n, [8] * n, retrasos)
+
+
+def test_primera_observacion_cero_no_congela_la_clave():
+    detector = DetectorAnomalias()
+    _observar(detector, [0.0])
+
+    rng = np.random.default_rng(0)
+    puntuaciones = _observar(detector, rng.normal(60, 30, 500))
+
+    assert np.isfinite(puntuaciones["z_score"]).all()
+    assert puntuaciones["anomalia"].sum() < 10
+    assert 40 < detector.media[0] < 80
+    assert detector.desviacion[0] > ESCALA_MINIMA
+
+
+def test_retrasos_constantes_no_dan_z_infinito():
+    detector = DetectorAnomalias()
+    _observar(detector, [0.0] * 100)
+
+    puntuaciones = _observar(detector, [0.0, 5.0, 600.0])
+
+    assert np.isfinite(puntuaciones["z_score"]).all()
+    assert puntuaciones["anomalia"].tolist() == [False, False, True]
+
+
+def test_lote_respeta_el_orden_dentro_de_cada_clave():
+    en_lote = DetectorAnomalias()
+    uno_a_uno = DetectorAnomalias()
+    retrasos = [30.0, 90.0, 60.0, 1200.0]
+
+    _observar(en_lote, retrasos)
+    for retraso in retrasos:
+        _observar(uno_a_uno, [retraso])
+
+    np.testing.assert_allclose(en_lote.media, uno_a_uno.media)
+    np.testing.assert_allclose(en_lote.desviacion, uno_a_uno.desviacion)
+
+
+def test_guardar_y_cargar_conservan_el_estado(tmp_path):
+    detector = DetectorAnomalias(umbral=3.0)
+    _observar(detector, [10.0, 20.0, 30.0])
+    ruta = tmp_path / "estado.npz"
+    detector.guardar(ruta)
+
+    cargado = DetectorAnomalias.cargar(ruta)
+    assert cargado.umbral == 3.0
+    assert cargado.claves.equals(detector.claves)
+    np.testing.assert_array_equal(cargado.media, detector.media)
+    np.testing.assert_array_equal(cargado.n, detector.n)
+
+
+def test_sembrado_da_historia_a_la_clave():
+    detector = DetectorAnomalias()
+    baselines = pd.DataFrame({"route_id": ["A"], "stop_id": ["101N"], "hora_semana": [8],
+                              "media": [60.0], "desviacion": [1.0], "n": [500]})
+    sembrar_desde_historico(detector, baselines)
+
+    assert detector.claves.get_indexer(claves_detector(["A"], ["101N"], [8])).tolist() == [0]
+    assert detector.desviacion[0] == ESCALA_MINIMA
+    assert _observar(detector, [1800.0])["anomalia"].tolist() == [True]
+
+
+def test_alerta_de_linea_con_suficientes_paradas_anomalas():
+    puntuaciones = pd.DataFrame({
+        "linea_id": ["A"] * 4 + ["C"] * 10,
+        "parada_id": [f"A{i}" for i in range(4)] + [f"C{i}" for i in range(10)],
+        "z_score": [6.0, 7.0, 8.0, 0.5] + [9.0] * 3 + [0.0] * 7,
+        "delay": [900.0] * 14,
+        "anomalia": [True, True, True, False] + [True] * 3 + [False] * 7,
+    })
+    alertas = alertas_ciclo(puntuaciones)
+
+    assert (alertas["tipo"] == "parada").sum() == 6
+    assert alertas.loc[alertas["tipo"] == "linea", "linea_id"].tolist() == ["A", "C"]
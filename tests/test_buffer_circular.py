@@ -0,0 +1,38 @@
+import numpy as np
+
+from src.tiempo_real_metro.buffer_circular import BufferCircular
+
+
+def test_anillo_guarda_solo_las_ultimas_observaciones():
+    buffer = BufferCircular(max_claves=4, capacidad=3)
+    buffer.añadir(["A"] * 5, ["101N"] * 5, [1] * 5, [100, 200, 300, 400, 500], [1, 2, 3, 4, 5])
+
+    agregados = buffer.agregados(ahora=500, ventana=1_000)
+    assert agregados["n"].tolist() == [3]
+    assert agregados["media"].tolist() == [4.0]
+    assert agregados["maximo"].tolist() == [5.0]
+    assert agregados["ultimo_epoch"].tolist() == [500]
+
+
+def test_ventana_y_pendiente():
+    buffer = BufferCircular(max_claves=4, capacidad=8)
+    # Una observación fuera de la ventana y tres dentro, subiendo 60 s por minuto
+    buffer.añadir(["A"] * 4, ["101N"] * 4, [1] * 4, [0, 1_000, 1_060, 1_120], [900, 0, 60, 120])
+
+    agregados = buffer.agregados(ahora=1_120, ventana=300)
+    assert agregados["n"].tolist() == [3]
+    np.testing.assert_allclose(agregados["pendiente"], [60.0])
+
+
+def test_sin_filas_libres_se_reutiliza_la_clave_mas_antigua():
+    buffer = BufferCircular(max_claves=2, capacidad=4)
+    buffer.añadir(["A", "C"], ["101N", "102N"], [1, 1], [100, 200], [10, 20])
+    buffer.añadir(["E"], ["103N"], [1], [300], [30])
+
+    assert len(buffer) == 2
+    agregados = buffer.agregados(ahora=300, ventana=1_000).set_index("linea_id")
+    assert sorted(agregados.index) == ["C", "E"]
+    # La fila reutilizada no arrastra observaciones de la clave anterior
+    assert agregados.loc["E", "n"] == 1
+    assert agregados.loc["E", "media"] == 30.0
+    assert buffer.consultar(["A"], ["101N"], [1], ahora=300).empty
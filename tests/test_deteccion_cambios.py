@@ -0,0 +1,53 @@
+import pandas as pd
+
+from src.tiempo_real_metro.deteccion_cambios import DetectorCambios, FiltroObservaciones
+
+
+def _ciclo(captura, llegada=1_000, partida=1_010, viajes=("T1",)):
+    n = len(viajes)
+    return pd.DataFrame({
+        "viaje_id": list(viajes),
+        "parada_id": ["101N"] * n,
+        "llegada_epoch": pd.array([llegada] * n, dtype="Int64"),
+        "partida_epoch": pd.array([partida] * n, dtype="Int64"),
+        "captura_epoch": [captura] * n,
+    })
+
+
+def test_sin_cambios_no_pasa_nada():
+    detector = DetectorCambios()
+    assert len(detector.filtrar(_ciclo(900))) == 1
+    assert len(detector.filtrar(_ciclo(930))) == 0
+
+
+def test_cambio_de_tiempos_pasa():
+    detector = DetectorCambios()
+    detector.filtrar(_ciclo(900))
+    assert len(detector.filtrar(_ciclo(930, llegada=1_060))) == 1
+    assert len(detector.filtrar(_ciclo(960, llegada=1_060, partida=pd.NA))) == 1
+
+
+def test_paso_de_prevision_a_llegada_realizada_pasa_una_vez():
+    detector = DetectorCambios()
+    detector.filtrar(_ciclo(900))
+    assert len(detector.filtrar(_ciclo(1_030))) == 1
+    assert len(detector.filtrar(_ciclo(1_060))) == 0
+
+
+def test_claves_caducan_pasado_el_ttl():
+    detector = DetectorCambios(ttl=100)
+    detector.filtrar(_ciclo(900, viajes=("T1", "T2")))
+    detector.filtrar(_ciclo(990, viajes=("T2",)))
+    assert len(detector) == 2
+
+    detector.filtrar(_ciclo(1_050, viajes=("T2",)))
+    assert len(detector) == 1
+    # T1 ha caducado: vuelve a entrar como nuevo
+    assert len(detector.filtrar(_ciclo(1_060, viajes=("T1",)))) == 1
+
+
+def test_filtro_observaciones_caduca_por_llegada():
+    vistas = FiltroObservaciones(ttl=100)
+    vistas.filtrar(_ciclo(0, llegada=1_000))
+    vistas.filtrar(_ciclo(0, llegada=1_200, viajes=("T2",)))
+    assert len(vistas) == 1
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from src.common.dimensiones import Dimension, concatenar, indexar
+
+
+def test_dimension_solo_crece_por_el_final():
+    paradas = Dimension("paradas", "stop_id")
+    primera = paradas.codificar(["101N", "103N"])
+    segunda = paradas.codificar(pd.Series(["103N", "104S", None], dtype="category"))
+
+    assert paradas.valores.tolist() == ["101N", "103N", "104S"]
+    assert primera.cat.codes.tolist() == [0, 1]
+    assert segunda.cat.codes.tolist() == [1, 2, -1]
+    assert segunda.dtype == paradas.tipo
+
+
+def test_concatenar_mantiene_categoricas_con_categorias_distintas():
+    df = concatenar([
+        pd.DataFrame({"parada_id": pd.Categorical(["101N"]), "delay": [1]}),
+        pd.DataFrame({"parada_id": pd.Categorical(["103N"]), "delay": [2]}),
+    ])
+
+    assert isinstance(df["parada_id"].dtype, pd.CategoricalDtype)
+    assert df["parada_id"].tolist() == ["101N", "103N"]
+
+
+def test_indexar_categorico_coincide_con_get_indexer():
+    indice = pd.Index(["A", "B", "C"])
+    valores = pd.Series(["C", "Z", None, "A"])
+
+    esperado = np.array([2, -1, -1, 0])
+    np.testing.assert_array_equal(indexar(indice, valores), esperado)
+    np.testing.assert_array_equal(indexar(indice, valores.astype("category")), esperado)
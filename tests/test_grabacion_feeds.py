@@ -0,0 +1,42 @@
+from src.tiempo_real_metro.grabacion_feeds import GrabadorFeeds, ciclos_grabados, segmentos
+
+
+def _resultados(ciclo):
+    return {
+        "ACES": {"contenido": f"feed-{ciclo}".encode(), "error": None, "captura": ciclo + 0.5, "segundos": 0.2},
+        "G": {"contenido": None, "error": "Timeout()", "captura": ciclo + 0.7, "segundos": 10.0},
+    }
+
+
+def test_grabar_y_reproducir_ciclos_entre_segmentos(tmp_path):
+    with GrabadorFeeds(tmp_path, segundos_por_segmento=60) as grabador:
+        for ciclo in (1_000, 1_030, 1_060, 1_090):
+            grabador.grabar(_resultados(ciclo), ciclo)
+
+    assert [ruta.name for ruta in segmentos(tmp_path)] == ["feeds_0000001000.bin.zst", "feeds_0000001060.bin.zst"]
+
+    ciclos = list(ciclos_grabados(tmp_path))
+    assert [ciclo for ciclo, _ in ciclos] == [1_000, 1_030, 1_060, 1_090]
+    _, resultados = ciclos[1]
+    assert resultados["ACES"]["contenido"] == b"feed-1030"
+    assert resultados["ACES"]["captura"] == 1_030.5
+    assert resultados["G"]["contenido"] is None
+    assert resultados["G"]["error"] == "Timeout()"
+
+    assert [ciclo for ciclo, _ in ciclos_grabados(tmp_path, desde=1_030, hasta=1_060)] == [1_030, 1_060]
+
+
+def test_segmento_sin_cerrar_se_lee_hasta_el_ultimo_ciclo_cerrado(tmp_path):
+    grabador = GrabadorFeeds(tmp_path, segundos_por_segmento=600)
+    grabador.grabar(_resultados(1_000), 1_000)
+    grabador.grabar(_resultados(1_030), 1_030)
+    (ruta,) = segmentos(tmp_path)
+
+    # El grabador muere a mitad del tercer ciclo: el fichero queda cortado
+    tamaño = ruta.stat().st_size
+    grabador.grabar(_resultados(1_060), 1_060)
+    datos = ruta.read_bytes()
+    grabador.cerrar()
+    ruta.write_bytes(datos[:tamaño + (len(datos) - tamaño) // 2])
+
+    assert [ciclo for ciclo, _ in ciclos_grabados(tmp_path)] == [1_000, 1_030]
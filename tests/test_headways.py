@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from src.analytics.headways import HeadwaysTiempoReal, calcular_headways_dia, headways_por_grupo
+
+
+def test_desviacion_compara_el_mismo_par_de_trenes():
+    # T2 estaba previsto 300 s después de T1 pero llega 60 s antes que él
+    df = pd.DataFrame({
+        "match_key": ["T1", "T2", "T3"],
+        "route_id": ["A"] * 3,
+        "stop_id": ["101N"] * 3,
+        "scheduled_seconds": [1000.0, 1300.0, 1600.0],
+        "delay_seconds": [400.0, 40.0, 0.0],
+    })
+    headways = calcular_headways_dia(df).set_index("match_key")
+
+    # Orden real: T2 (1340), T1 (1400), T3 (1600)
+    assert headways.loc["T1", "headway_real"] == 60
+    assert headways.loc["T1", "headway_previsto"] == -300
+    assert headways.loc["T3", "headway_real"] == 200
+    assert headways.loc["T3", "headway_previsto"] == 600
+    assert np.isnan(headways.loc["T2", "desviacion"])
+
+
+def test_tiempo_real_guarda_la_prevista_del_ultimo_tren_real():
+    headways = HeadwaysTiempoReal()
+    headways.actualizar(["A", "A"], ["101N", "101N"], [1, 1], [1340.0, 1400.0], [1300.0, 1000.0])
+    nuevas = headways.actualizar(["A"], ["101N"], [1], [1600.0], [1600.0])
+
+    assert nuevas["headway_real"].tolist() == [200.0]
+    assert nuevas["headway_previsto"].tolist() == [600.0]
+
+
+def test_headways_por_grupo_separa_grupos_y_descarta_huecos_largos():
+    grupo = np.array([0, 1, 0, 0, 1])
+    tiempos = np.array([100.0, 50.0, 400.0, 10_000.0, np.nan])
+
+    headways = headways_por_grupo(grupo, tiempos, max_headway=3600)
+
+    np.testing.assert_array_equal(headways, [np.nan, np.nan, 300.0, np.nan, np.nan])
+
+
+def test_tiempo_real_ignora_llegadas_reemitidas():
+    headways = HeadwaysTiempoReal()
+    primera = headways.actualizar(["A"] * 2, ["101N"] * 2, [1] * 2, [1000.0, 1000.0], [990.0, 990.0])
+    repetida = headways.actualizar(["A"], ["101N"], [1], [1000.0], [990.0])
+    siguiente = headways.actualizar(["A"], ["101N"], [1], [1300.0], [1290.0])
+
+    assert len(primera) == 1
+    assert repetida.empty
+    assert siguiente["headway_real"].tolist() == [300.0]
@@ -0,0 +1,192 @@
+import io
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import src.gtfs_historico.historical_gtfs_builder as builder
+
+DIA = "2025-12-01"
+
+RT_TRIPS = "trip_uid,trip_id,route_id,direction_id\nU1,000600_A..S,A,1\nU2,000700_A..S,A,1\n"
+RT_STOP_TIMES = (
+    "trip_uid,stop_id,arrival_time,departure_time\n"
+    "U1,A02S,1764565620,1764565650\n"
+    "U1,A03S,,\n"
+    "U2,A02S,1764566220.0,1764566250\n"
+)
+
+
+def _tar_xz(miembros):
+    contenido = io.BytesIO()
+    with tarfile.open(fileobj=contenido, mode="w:xz") as tar:
+        for nombre, texto in miembros.items():
+            datos = texto.encode()
+            info = tarfile.TarInfo(nombre)
+            info.size = len(datos)
+            tar.addfile(info, io.BytesIO(datos))
+    return contenido.getvalue()
+
+
+@pytest.fixture
+def servidor_realtime(monkeypatch):
+    archivos = {}
+
+    class Servidor(BaseHTTPRequestHandler):
+        def do_GET(self):
+            datos = archivos.get(self.path)
+            self.send_response(200 if datos is not None else 404)
+            self.end_headers()
+            if datos is not None:
+                self.wfile.write(datos)
+
+        def log_message(self, *args):
+            pass
+
+    http = ThreadingHTTPServer(("127.0.0.1", 0), Servidor)
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{http.server_address[1]}"
+    monkeypatch.setattr(builder, "realtime_url", lambda dia: f"{url}/{dia}.tar.xz")
+    yield archivos
+    http.shutdown()
+    http.server_close()
+
+
+def test_stream_realtime_lee_los_csv_del_tar_sin_extraerlos(servidor_realtime, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    servidor_realtime[f"/{DIA}.tar.xz"] = _tar_xz({
+        f"datos/subwaydatanyc_{DIA}_trips.csv": RT_TRIPS,
+        f"datos/subwaydatanyc_{DIA}_stop_times.csv": RT_STOP_TIMES,
+        "datos/LEEME.txt": "otros ficheros del archivo",
+    })
+
+    trips, stop_times = builder.stream_realtime_data(DIA)
+
+    assert trips.column_names == ["trip_uid", "trip_id"]
+    assert pa.types.is_dictionary(trips.schema.field("trip_id").type)
+    assert stop_times.column("arrival_time").to_pylist() == [1764565620.0, None, 1764566220.0]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stream_realtime_sin_los_csv_esperados_falla(servidor_realtime):
+    servidor_realtime[f"/{DIA}.tar.xz"] = _tar_xz({f"datos/subwaydatanyc_{DIA}_trips.csv": RT_TRIPS})
+
+    with pytest.raises(FileNotFoundError):
+        builder.stream_realtime_data(DIA)
+
+
+def test_stream_realtime_dia_no_publicado(servidor_realtime):
+    with pytest.raises(Exception, match="404"):
+        builder.stream_realtime_data(DIA)
+
+
+STATIC_TRIPS = "route_id,trip_id,service_id\nA,AFA25GEN-1037-Weekday-00_000600_A..S03R,Weekday\n"
+STATIC_STOP_TIMES = (
+    "trip_id,stop_id,arrival_time,departure_time,stop_sequence\n"
+    "AFA25GEN-1037-Weekday-00_000600_A..S03R,A02S,23:59:00,23:59:00,1\n"
+    "AFA25GEN-1037-Weekday-00_000600_A..S03R,A03S,24:01:30,24:01:30,2\n"
+)
+
+
+@pytest.fixture
+def estatico(tmp_path, monkeypatch):
+    """Versión v1 del estático; cuenta cuántas veces se descarga el ZIP"""
+    descargas = []
+
+    def descargar(version):
+        carpeta = tmp_path / f"static_{len(descargas)}"
+        carpeta.mkdir()
+        (carpeta / "trips.txt").write_text(STATIC_TRIPS)
+        (carpeta / "stop_times.txt").write_text(STATIC_STOP_TIMES)
+        descargas.append(version["id"])
+        return str(carpeta / "trips.txt"), str(carpeta / "stop_times.txt")
+
+    monkeypatch.setattr(builder, "resolve_static_version", lambda dia, client=None: {"id": "v1", "url": None})
+    monkeypatch.setattr(builder, "download_static_version", descargar)
+    monkeypatch.setattr(builder, "_STATIC_IN_MEMORY", {})
+    return descargas
+
+
+def test_estatico_se_prepara_una_vez_por_version(estatico, tmp_path):
+    cache = tmp_path / "cache"
+    primero = builder.load_static_merged("2025-12-01", cache_dir=str(cache))
+    assert builder.load_static_merged("2025-12-02", cache_dir=str(cache)) is primero
+
+    # Otro proceso: sin memoria, pero con la caché local
+    builder._STATIC_IN_MEMORY.clear()
+    desde_disco = builder.load_static_merged("2025-12-03", cache_dir=str(cache))
+
+    assert estatico == ["v1"]
+    assert not (tmp_path / "static_0").exists()
+    assert list(cache.iterdir()) == [cache / "static_merged_v1.parquet"]
+    assert desde_disco["scheduled_seconds"].tolist() == [86340.0, 86490.0]
+    assert desde_disco["match_key"].astype(str).tolist() == ["000600_A..S03R"] * 2
+
+
+def _epoch(local):
+    return int(pd.Timestamp(local, tz="America/New_York").timestamp())
+
+
+@pytest.fixture
+def dia_con_medianoche(tmp_path):
+    """Estático de un viaje que cruza la medianoche y realtime del día (CSV)"""
+    (tmp_path / "trips.txt").write_text(STATIC_TRIPS)
+    (tmp_path / "stop_times.txt").write_text(STATIC_STOP_TIMES)
+    (tmp_path / "rt_trips.csv").write_text("trip_uid,trip_id\nU1,000600_A..S03R\nU2,999999_A..S03R\n")
+    (tmp_path / "rt_stop_times.csv").write_text(
+        "trip_uid,stop_id,arrival_time\n"
+        f"U1,A02S,{_epoch('2025-12-01 23:59:30')}\n"
+        f"U1,A03S,{_epoch('2025-12-02 00:01:00')}\n"
+        f"U2,A02S,{_epoch('2025-12-01 12:00:00')}\n"
+    )
+    static_merged = builder.build_static_merged(str(tmp_path / "trips.txt"), str(tmp_path / "stop_times.txt"))
+    return static_merged, str(tmp_path / "rt_trips.csv"), str(tmp_path / "rt_stop_times.csv")
+
+
+def test_retrasos_corrigen_el_cruce_de_medianoche(dia_con_medianoche):
+    df = builder.join_realtime_delays(*dia_con_medianoche)
+    df = df.set_index(["trip_uid", "stop_id"]).sort_index()
+
+    assert df.loc[("U1", "A02S"), "delay_seconds"] == 30
+    assert df.loc[("U1", "A03S"), "delay_seconds"] == -30
+    assert df.loc[("U1", "A03S"), "actual_seconds"] == 60
+    assert df.loc[("U2", "A02S"), "is_unscheduled"]
+    assert not df.loc["U1", "is_unscheduled"].any()
+
+
+def test_retrasos_en_el_cambio_de_hora():
+    static_merged = pd.DataFrame({
+        "match_key": pd.Categorical(["000600_A..S03R"]), "stop_id": ["A02S"],
+        "scheduled_seconds": [3 * 3600.0], "route_id": ["A"],
+    })
+    rt_trips = pa.table({
+        "trip_uid": pa.array(["U1"]).dictionary_encode(),
+        "trip_id": pa.array(["000600_A..S03R"]).dictionary_encode(),
+    })
+    # 2025-03-09 03:02 EDT: una hora de reloj después de las 01:59 EST
+    rt_stop_times = pa.table({
+        "trip_uid": pa.array(["U1"]).dictionary_encode(),
+        "stop_id": pa.array(["A02S"]).dictionary_encode(),
+        "arrival_time": [float(_epoch("2025-03-09 03:02:00"))],
+    })
+
+    df = builder.join_realtime_delays(static_merged, rt_trips, rt_stop_times)
+    assert df["delay_seconds"].tolist() == [120.0]
+
+
+def test_cruce_por_particiones_da_las_mismas_filas(dia_con_medianoche, tmp_path):
+    completo = builder.join_realtime_delays(*dia_con_medianoche)
+
+    salida = tmp_path / "delays.parquet"
+    filas = builder.join_realtime_delays_partitioned(*dia_con_medianoche, str(salida), partitions=4)
+    particionado = pd.read_parquet(salida)
+
+    claves = ["trip_uid", "stop_id"]
+    completo = completo.astype({c: str for c in claves}).sort_values(claves).reset_index(drop=True)
+    particionado = particionado.astype({c: str for c in claves}).sort_values(claves).reset_index(drop=True)
+    assert filas == len(completo) == 3
+    pd.testing.assert_frame_equal(particionado[completo.columns], completo, check_categorical=False,
+                                  check_dtype=False)
@@ -0,0 +1,89 @@
+import io
+import zipfile
+
+import pandas as pd
+import requests
+
+import src.tiempo_real_metro.horario_previsto as horario_previsto
+from src.tiempo_real_metro.horario_previsto import IndiceHorario, cargar_horario_previsto, indice_horario
+
+STOP_TIMES = (
+    "trip_id,stop_id,arrival_time,departure_time,stop_sequence\n"
+    "AFA25GEN-1037-Weekday-00_000600_1..S03R,101S,00:06:00,00:06:00,1\n"
+    "AFA25GEN-1037-Weekday-00_000600_1..S03R,103S,24:07:30,24:07:30,2\n"
+)
+
+
+def _zip():
+    contenido = io.BytesIO()
+    with zipfile.ZipFile(contenido, "w") as z:
+        z.writestr("stop_times.txt", STOP_TIMES)
+    return contenido.getvalue()
+
+
+class _Sesion:
+    """Responde a cada get con el siguiente estado de la lista"""
+
+    def __init__(self, *estados):
+        self.estados = list(estados)
+        self.peticiones = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.peticiones.append(headers)
+        respuesta = requests.Response()
+        respuesta.status_code = self.estados.pop(0)
+        respuesta.url = url
+        respuesta.raw = io.BytesIO(_zip() if respuesta.status_code == 200 else b"")
+        respuesta.headers["ETag"] = '"v1"'
+        return respuesta
+
+
+def test_error_http_usa_la_cache(tmp_path):
+    primera = cargar_horario_previsto(dir_cache=tmp_path, sesion=_Sesion(200))
+    segunda = cargar_horario_previsto(dir_cache=tmp_path, sesion=_Sesion(503), comprobar_cada=0)
+
+    assert segunda.attrs["version"] == primera.attrs["version"] == '"v1"'
+    assert segunda["segundos_previstos"].tolist() == [360, 450]
+
+
+def test_cambio_de_codigo_reconstruye_sin_peticion_condicional(tmp_path, monkeypatch):
+    cargar_horario_previsto(dir_cache=tmp_path, sesion=_Sesion(200))
+
+    monkeypatch.setattr(horario_previsto, "VERSION_CODIGO", "otro")
+    sesion = _Sesion(200)
+    cargar_horario_previsto(dir_cache=tmp_path, sesion=sesion)
+
+    assert sesion.peticiones == [{}]
+
+
+def _horario(version="v1"):
+    horario = pd.DataFrame({
+        "trip_id": ["T1", "T1", "T1", "T2"],
+        "stop_id": ["101S", "103S", "101S", "101S"],
+        "day": ["Weekday"] * 4,
+        "stop_sequence": [1, 2, 3, 1],
+        "segundos_previstos": pd.array([100, 200, 300, 400], dtype="Int32"),
+    })
+    horario.attrs["version"] = version
+    return horario
+
+
+def test_indice_se_queda_con_la_primera_aparicion_de_una_clave_repetida():
+    indice = IndiceHorario(_horario())
+    posiciones = indice.buscar(["T1", "T1", "T2"], ["101S", "103S", "101S"], ["Weekday"] * 3)
+
+    assert len(indice) == 3
+    assert indice.segundos_previstos[posiciones].tolist() == [100, 200, 400]
+    assert indice.stop_sequence[posiciones].tolist() == [1, 2, 1]
+
+
+def test_indice_sin_horario_devuelve_menos_uno():
+    indice = IndiceHorario(_horario())
+    posiciones = indice.buscar(["T9", "T1", "T1"], ["101S", "999S", "101S"], ["Weekday", "Weekday", "Sunday"])
+
+    assert posiciones.tolist() == [-1, -1, -1]
+
+
+def test_indice_horario_se_construye_una_vez_por_version():
+    assert indice_horario(_horario("v1")) is indice_horario(_horario("v1"))
+    assert indice_horario(_horario("v2")) is not indice_horario(_horario("v1"))
@@ -0,0 +1,37 @@
+import src.common.idempotencia as idempotencia
+from src.common.idempotencia import huella, metadatos, salidas_actualizadas, version_codigo
+
+
+def _minio(monkeypatch, objetos):
+    """stat_object sobre un diccionario {objeto: huella}"""
+    def stat_object(access_key, secret_key, object_name):
+        if object_name not in objetos:
+            return None
+        return {"etag": "e", "size": 1, "metadata": metadatos(objetos[object_name])}
+    monkeypatch.setattr(idempotencia, "stat_object", stat_object)
+
+
+def test_salidas_actualizadas_solo_si_todas_llevan_la_huella(monkeypatch):
+    _minio(monkeypatch, {"a.parquet": "h1", "b.parquet": "h1", "c.parquet": "h0"})
+
+    assert salidas_actualizadas("ak", "sk", ["a.parquet", "b.parquet"], "h1")
+    assert not salidas_actualizadas("ak", "sk", ["a.parquet", "c.parquet"], "h1")
+    assert not salidas_actualizadas("ak", "sk", ["a.parquet", "falta.parquet"], "h1")
+
+
+def test_forzar_reproceso(monkeypatch):
+    _minio(monkeypatch, {"a.parquet": "h1"})
+    monkeypatch.setattr(idempotencia, "FORZAR", True)
+
+    assert not salidas_actualizadas("ak", "sk", ["a.parquet"], "h1")
+
+
+def test_huella_estable_y_sensible_a_entradas(tmp_path):
+    assert huella(a=1, b={"x": 2}) == huella(b={"x": 2}, a=1)
+    assert huella(a=1, codigo="v1") != huella(a=1, codigo="v2")
+
+    fuente = tmp_path / "etapa.py"
+    fuente.write_text("x = 1\n")
+    antes = version_codigo(str(fuente))
+    fuente.write_text("x = 2\n")
+    assert version_codigo(str(fuente)) != antes
@@ -0,0 +1,64 @@
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pytest
+
+
+@pytest.fixture
+def ingest(monkeypatch, tmp_path):
+    monkeypatch.setenv("MINIO_ACCESS_KEY", "ak")
+    monkeypatch.setenv("MINIO_SECRET_KEY", "sk")
+    ingest = importlib.import_module("src.gtfs_historico.ingest")
+
+    class PoolEnHilos(ThreadPoolExecutor):
+        """ProcessPoolExecutor en hilos del mismo proceso, para poder sustituir funciones"""
+
+        def __init__(self, max_workers, mp_context=None, initializer=None, initargs=()):
+            super().__init__(max_workers=max_workers)
+            ingest._WORKER.update(static_cache_dir=initargs[1], client=initargs[2])
+
+    monkeypatch.setattr(ingest, "ProcessPoolExecutor", PoolEnHilos)
+    monkeypatch.setattr(ingest, "DIR_STATIC_CACHE", str(tmp_path / "cache"))
+    monkeypatch.setattr(ingest, "day_fingerprint", lambda dia, client: None)
+    return ingest
+
+
+class _Client:
+    """Dos versiones del estático: v1 hasta el día 2 y v2 después; el día 3 no se resuelve"""
+
+    def datasets(self):
+        pass
+
+    def resolve(self, dia):
+        if dia == "2025-12-03":
+            raise ValueError("sin versión")
+        return {"id": "v1" if dia <= "2025-12-02" else "v2"}
+
+
+def test_fallos_de_version_cuentan_como_dias_fallidos(ingest, monkeypatch, tmp_path, capsys):
+    def preparar(dia, *args):
+        if dia >= "2025-12-04":
+            raise ConnectionError("descarga del estático")
+
+    procesados, subidos = [], []
+
+    def procesar(dia, client=None, cache_dir=None):
+        procesados.append(dia)
+        ruta = tmp_path / f"{dia}.parquet"
+        ruta.write_bytes(b"")
+        return str(ruta)
+
+    monkeypatch.setattr(ingest, "load_static_merged", preparar)
+    monkeypatch.setattr(ingest, "process_mta_date", procesar)
+    monkeypatch.setattr(ingest, "upload_file", lambda **kwargs: subidos.append(kwargs["object_name"]))
+
+    ingest.process_and_store_gtfs_range_parallel(date(2025, 12, 1), date(2025, 12, 5), 2, _Client())
+
+    salida = capsys.readouterr().out
+    assert sorted(procesados) == ["2025-12-01", "2025-12-02"]
+    assert len(subidos) == 2
+    assert "Backfill terminado: 2/5 días correctos." in salida
+    assert "Días con error: ['2025-12-03', '2025-12-04', '2025-12-05']" in salida
+    # Los Parquet temporales se borran tras subirlos
+    assert not list(tmp_path.glob("*.parquet"))
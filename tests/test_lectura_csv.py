@@ -0,0 +1,37 @@
+import io
+
+import pandas as pd
+
+from src.gtfs_historico.lectura_csv import DTYPES_PANDAS, ESQUEMAS, leer_csv, leer_csv_pandas
+
+STOP_TIMES = (
+    "trip_id,arrival_time,departure_time,stop_id,stop_sequence,pickup_type\n"
+    "T1,08:00:00,08:00:00,101N,1,0\n"
+    "T1,,,103N,2,0\n"
+    "T2,24:10:00,24:10:00,101N,1,0\n"
+)
+
+
+def test_solo_se_leen_las_columnas_declaradas_y_con_su_tipo():
+    tabla = leer_csv(io.BytesIO(STOP_TIMES.encode()), "static_stop_times")
+
+    assert tabla.column_names == list(ESQUEMAS["static_stop_times"])
+    assert tabla.schema.field("stop_id").type == ESQUEMAS["static_stop_times"]["stop_id"]
+
+
+def test_coincide_con_pd_read_csv():
+    arrow = leer_csv_pandas(io.BytesIO(STOP_TIMES.encode()), "static_stop_times")
+    pandas = pd.read_csv(io.StringIO(STOP_TIMES), usecols=list(ESQUEMAS["static_stop_times"]),
+                         dtype=DTYPES_PANDAS["static_stop_times"])
+
+    for columna in ESQUEMAS["static_stop_times"]:
+        pd.testing.assert_series_equal(arrow[columna].astype("string"), pandas[columna].astype("string"))
+    assert arrow["arrival_time"].isna().tolist() == [False, True, False]
+
+
+def test_epoch_realtime_admite_enteros_decimales_y_huecos():
+    texto = "trip_uid,stop_id,arrival_time\nU1,101N,1764565620\nU1,103N,1764565680.0\nU1,104N,\n"
+    df = leer_csv_pandas(io.BytesIO(texto.encode()), "rt_stop_times")
+
+    assert df["arrival_time"].tolist()[:2] == [1764565620.0, 1764565680.0]
+    assert pd.isna(df["arrival_time"].iloc[2])
@@ -0,0 +1,47 @@
+import json
+
+from src.tiempo_real_metro.metricas import FICHERO_PROMETHEUS, ExportadorMetricas, MetricasCiclo
+
+# 2025-12-02 04:00 UTC: todavía 2025-12-01 en Nueva York
+CICLO = 1_764_648_000
+
+
+def _metricas(fallar=False):
+    metricas = MetricasCiclo(CICLO)
+    with metricas.etapa("descarga"):
+        pass
+    metricas.registrar_feeds({
+        "ACES": {"contenido": b"feed", "captura": CICLO + 1.0, "segundos": 0.3,
+                 "timestamp_feed": CICLO - 20, "filas": 10, "segundos_parseo": 0.01},
+        "G": {"contenido": None, "captura": CICLO + 10.0, "segundos": 10.0},
+    })
+    if fallar:
+        metricas.fallar(RuntimeError("MinIO caído"))
+    metricas.cerrar(10)
+    return metricas
+
+
+def test_frescura_y_metricas_por_feed():
+    metricas = _metricas()
+
+    assert metricas.feeds["ACES"]["frescura"] == 21.0
+    assert metricas.feeds["G"]["error"] == 1
+    assert metricas.feeds["G"]["frescura"] is None
+    assert metricas.frescura >= 20
+    assert {"descarga", "total"} <= set(metricas.etapas)
+
+
+def test_exportar_ciclo_fallido_a_prometheus_y_jsonl(tmp_path):
+    exportador = ExportadorMetricas(tmp_path)
+    exportador.exportar(_metricas())
+    exportador.exportar(_metricas(fallar=True))
+
+    prometheus = (tmp_path / FICHERO_PROMETHEUS).read_text().splitlines()
+    assert "metro_realtime_ciclos_total 2.0" in prometheus
+    assert "metro_realtime_ciclos_fallidos_total 1.0" in prometheus
+    assert "metro_realtime_ciclo_error 1.0" in prometheus
+    assert 'metro_realtime_feed_errores_total{grupo="G"} 2.0' in prometheus
+    assert not any(linea.startswith('metro_realtime_feed_frescura{grupo="G"}') for linea in prometheus)
+
+    ciclos = (tmp_path / "ciclos_2025-12-01.jsonl").read_text().splitlines()
+    assert [json.loads(ciclo)["error"] for ciclo in ciclos] == [None, "RuntimeError('MinIO caído')"]
@@ -0,0 +1,67 @@
+import pytest
+import requests
+
+from src.gtfs_historico.mobility_database import MobilityDatabaseClient
+
+DATASETS = [
+    {"id": "mdb-511-202512150000", "downloaded_at": "2025-12-15T03:00:00Z", "hosted_url": "https://x/c.zip"},
+    {"id": "mdb-511-202511010000", "downloaded_at": "2025-11-01T03:00:00Z", "hosted_url": "https://x/a.zip"},
+    {"id": "mdb-511-202512010000", "downloaded_at": "2025-12-01T03:00:00Z", "hosted_url": "https://x/b.zip"},
+]
+
+
+class _Respuesta:
+    def __init__(self, estado, datos=None):
+        self.status_code = estado
+        self.datos = datos
+        self.text = ""
+
+    def json(self):
+        return self.datos
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+
+class _Sesion:
+    def __init__(self, rechazar=0):
+        self.tokens = 0
+        self.listados = 0
+        self.rechazar = rechazar
+
+    def post(self, url, json=None):
+        self.tokens += 1
+        return _Respuesta(200, {"access_token": f"token-{self.tokens}"})
+
+    def get(self, url, headers=None):
+        if self.rechazar:
+            self.rechazar -= 1
+            return _Respuesta(401)
+        self.listados += 1
+        return _Respuesta(200, DATASETS)
+
+
+def test_token_y_listado_se_piden_una_vez():
+    sesion = _Sesion()
+    client = MobilityDatabaseClient(refresh_token="r", session=sesion)
+
+    versiones = [client.resolve(dia)["id"] for dia in ("2025-11-01", "2025-11-30", "2025-12-01", "2026-01-01")]
+
+    assert versiones == ["mdb-511-202511010000", "mdb-511-202511010000",
+                         "mdb-511-202512010000", "mdb-511-202512150000"]
+    assert (sesion.tokens, sesion.listados) == (1, 1)
+
+
+def test_token_revocado_se_renueva_una_vez():
+    sesion = _Sesion(rechazar=1)
+    client = MobilityDatabaseClient(refresh_token="r", session=sesion)
+
+    assert client.resolve("2025-12-02")["url"] == "https://x/b.zip"
+    assert sesion.tokens == 2
+
+
+def test_fecha_anterior_a_todas_las_versiones():
+    client = MobilityDatabaseClient(refresh_token="r", session=_Sesion())
+    with pytest.raises(ValueError):
+        client.resolve("2025-10-31")
@@ -0,0 +1,69 @@
+import threading
+
+import pandas as pd
+
+import src.analytics.prediccion as prediccion
+from src.analytics.prediccion import ServicioPrediccion
+
+
+def _servicio(ttl=30):
+    baselines = pd.DataFrame({
+        "route_id": ["A"], "stop_id": ["101N"], "hora_semana": [8], "media": [60.0], "n": [10],
+    })
+    return ServicioPrediccion(baselines, ttl=ttl)
+
+
+def test_cache_purga_respuestas_caducadas(monkeypatch):
+    monkeypatch.setattr(prediccion, "MAX_CACHE", 4)
+    servicio = _servicio(ttl=30)
+    for minutos in range(4):
+        servicio.predecir("A", "101N", minutos, ahora=0)
+    servicio.predecir("A", "101N", 15, ahora=100)
+
+    assert list(servicio.cache) == [("A", "101N", 15)]
+
+
+def test_fallo_de_red_al_arrancar_no_mata_el_hilo(monkeypatch):
+    servicio = _servicio()
+    parar = threading.Event()
+    cargas = []
+
+    def cargar(sesion=None):
+        cargas.append(sesion)
+        if len(cargas) == 1:
+            raise ConnectionError("sin red")
+        parar.set()
+        raise ConnectionError("sigue sin red")
+
+    monkeypatch.setattr(prediccion, "cargar_horario_previsto", cargar)
+    hilo = servicio.iniciar_tiempo_real(intervalo=0.01, parar=parar)
+    hilo.join(timeout=5)
+
+    assert not hilo.is_alive()
+    assert len(cargas) == 2
+
+
+def test_fuentes_de_la_prediccion():
+    servicio = _servicio()
+    # Lunes 2025-12-01 08:00 en Nueva York (hora de la semana 8)
+    ahora = pd.Timestamp("2025-12-01 08:00", tz="America/New_York").timestamp()
+
+    assert servicio.predecir("A", "101N", 0, ahora=ahora)["fuente"] == "historico"
+    assert servicio.predecir("A", "999N", 0, ahora=ahora)["fuente"] == "sin_datos"
+
+    servicio.actualizar_ciclo(pd.DataFrame({
+        "linea_id": ["A"], "parada_id": ["101N"], "direccion": [1],
+        "llegada_epoch": [int(ahora) - 60], "delay": [600],
+    }), int(ahora))
+    reciente = servicio.predecir("A", "101N", 0, ahora=ahora)
+
+    assert reciente["fuente"] == "reciente"
+    assert 60 < reciente["retraso_esperado"] <= 600
+
+
+def test_cache_devuelve_la_misma_respuesta_hasta_el_ttl():
+    servicio = _servicio(ttl=30)
+    primera = servicio.predecir("A", "101N", 15, ahora=0)
+
+    assert servicio.predecir("A", "101N", 15, ahora=29) is primera
+    assert servicio.predecir("A", "101N", 15, ahora=31) is not primera
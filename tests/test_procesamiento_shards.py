@@ -0,0 +1,43 @@
+import io
+import json
+import os
+import signal
+import time
+
+from src.tiempo_real_metro.horario_previsto import VERSION_CODIGO, preparar_stop_times
+from src.tiempo_real_metro.procesamiento_shards import ProcesadorShards
+
+STOP_TIMES = (
+    "trip_id,stop_id,arrival_time,stop_sequence\n"
+    "AFA25GEN-1037-Weekday-00_000600_1..S03R,101S,00:06:00,1\n"
+)
+
+
+def _cache(ruta):
+    preparar_stop_times(io.StringIO(STOP_TIMES)).to_parquet(ruta / "stop_times.parquet", index=False)
+    version = {"etag": '"v1"', "codigo": VERSION_CODIGO, "comprobado": time.time()}
+    (ruta / "version.json").write_text(json.dumps(version), encoding="utf-8")
+
+
+def _resultados(fuentes):
+    return {grupo: {"contenido": None, "error": "sin datos"} for grupo in fuentes}
+
+
+def test_shard_cuyo_proceso_muere_se_reinicia(tmp_path):
+    _cache(tmp_path)
+    fuentes = {"ACES": {"lineas": ["A", "C", "E"]}, "G": {"lineas": ["G"]}}
+    shards = ProcesadorShards(2, fuentes=fuentes, dir_cache=tmp_path)
+    try:
+        shards.procesar(_resultados(fuentes), '"v1"')
+
+        # Muere el trabajador del shard de G en mitad del ciclo siguiente
+        roto = shards.shard_de_grupo["G"]
+        (pid,) = shards.executors[roto]._processes
+        os.kill(pid, signal.SIGKILL)
+        shards.procesar(_resultados(fuentes), '"v1"')
+
+        df = shards.procesar(_resultados(fuentes), '"v1"')
+        assert df.empty
+        assert pid not in shards.executors[roto]._processes
+    finally:
+        shards.cerrar()
@@ -0,0 +1,77 @@
+import io
+
+import pandas as pd
+
+from src.analytics.propagacion import GrafoParadas, PropagacionRetrasos
+from src.tiempo_real_metro.horario_previsto import preparar_stop_times
+
+STOP_TIMES = """trip_id,stop_id,arrival_time,stop_sequence
+AFA25GEN-1037-Weekday-00_000600_1..S03R,101S,08:00:00,1
+AFA25GEN-1037-Weekday-00_000600_1..S03R,103S,08:02:00,2
+AFA25GEN-1037-Weekday-00_000600_1..S03R,104S,08:04:00,3
+"""
+
+
+def _propagacion():
+    horario = preparar_stop_times(io.StringIO(STOP_TIMES))
+    horario.attrs["version"] = "v1"
+    return PropagacionRetrasos(GrafoParadas(horario))
+
+
+def _llegada(delay, llegada_epoch, parada_id="101S"):
+    return pd.DataFrame({
+        "viaje_id": ["000600_1..S03R"], "parada_id": [parada_id], "dow": [1],
+        "delay": [delay], "llegada_epoch": [llegada_epoch],
+    })
+
+
+def test_estado_se_fecha_con_la_llegada_y_no_con_el_ciclo():
+    propagacion = _propagacion()
+    propagacion.actualizar(_llegada(60, 1_000), ahora=1_030)
+
+    assert propagacion.visto.tolist() == [1_000]
+    proyeccion = propagacion.proyectar(ahora=1_030)
+    # 120 s previstos hasta 103S menos los 30 s transcurridos desde la llegada
+    assert proyeccion["segundos_hasta"].iloc[0] == 90
+
+
+def test_en_la_misma_parada_gana_la_observacion_mas_reciente():
+    propagacion = _propagacion()
+    propagacion.actualizar(_llegada(60, 1_000), ahora=1_030)
+    propagacion.actualizar(_llegada(120, 1_060), ahora=1_090)
+    assert propagacion.retraso.tolist() == [120.0]
+
+    # Una reemisión atrasada no pisa el estado
+    propagacion.actualizar(_llegada(60, 1_000), ahora=1_120)
+    assert propagacion.retraso.tolist() == [120.0]
+    assert propagacion.visto.tolist() == [1_060]
+
+
+def test_aprende_el_incremento_de_la_arista_y_lo_proyecta():
+    propagacion = _propagacion()
+    propagacion.actualizar(_llegada(60, 1_000), ahora=1_030)
+    propagacion.actualizar(_llegada(90, 1_150, "103S"), ahora=1_180)
+
+    # Una observación de la arista 101S → 103S: +30 s
+    assert propagacion.n_arista.sum() == 1
+    assert propagacion.incremento.max() == 30.0
+
+    nuevo = _propagacion()
+    nuevo.incremento[:] = propagacion.incremento
+    nuevo.actualizar(_llegada(0, 1_000), ahora=1_000)
+    proyeccion = nuevo.proyectar(ahora=1_000).set_index("parada_id")
+    assert proyeccion.loc["103S", "retraso_proyectado"] == 30.0
+
+
+def test_cambiar_grafo_conserva_aristas_y_descarta_viajes():
+    propagacion = _propagacion()
+    propagacion.actualizar(_llegada(60, 1_000), ahora=1_030)
+    propagacion.actualizar(_llegada(90, 1_150, "103S"), ahora=1_180)
+
+    horario = preparar_stop_times(io.StringIO(STOP_TIMES))
+    horario.attrs["version"] = "v2"
+    propagacion.cambiar_grafo(GrafoParadas(horario))
+
+    assert len(propagacion) == 0
+    assert propagacion.grafo.version == "v2"
+    assert propagacion.incremento.max() == 30.0
@@ -0,0 +1,112 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from google.transit import gtfs_realtime_pb2
+
+from src.tiempo_real_metro.realtime_data import crear_sesion, decodificar_feed, descargar_feeds, extraccion_datos
+
+
+class _Servidor(BaseHTTPRequestHandler):
+    """Sustituto local de los endpoints de la MTA"""
+
+    peticiones = []
+
+    def do_GET(self):
+        self.peticiones.append(self.path)
+        if self.path.startswith("/feed"):
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(_feed())
+            return
+        if self.path == "/error":
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.end_headers()
+        if self.path == "/rapido":
+            self.wfile.write(b"feed")
+            return
+        # /lento: va enviando bytes poco a poco, sin terminar nunca dentro del plazo
+        try:
+            for _ in range(50):
+                self.wfile.write(b"x" * 1024)
+                self.wfile.flush()
+                time.sleep(0.1)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor():
+    http = ThreadingHTTPServer(("127.0.0.1", 0), _Servidor)
+    http.daemon_threads = True
+    _Servidor.peticiones = []
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{http.server_address[1]}"
+    http.shutdown()
+    http.server_close()
+
+
+def test_feed_lento_no_retrasa_al_resto(servidor):
+    fuentes = {grupo: {"url": f"{servidor}/{grupo}", "lineas": []} for grupo in ("rapido", "lento", "error")}
+
+    inicio = time.monotonic()
+    resultados = descargar_feeds(fuentes, sesion=crear_sesion(tam_pool=len(fuentes)), plazo=1)
+    segundos = time.monotonic() - inicio
+
+    assert segundos < 2.5
+    assert resultados["rapido"]["contenido"] == b"feed"
+    assert resultados["lento"]["contenido"] is None
+    assert "Plazo" in resultados["lento"]["error"]
+    assert resultados["error"]["contenido"] is None
+    assert resultados["error"]["error"]
+
+
+def _feed():
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = 1_760_000_000
+    for trip_id, route_id in (("000600_A..S", "A"), ("000700_G..N", "G")):
+        entidad = feed.entity.add(id=trip_id)
+        entidad.trip_update.trip.trip_id = trip_id
+        entidad.trip_update.trip.route_id = route_id
+        llegada = entidad.trip_update.stop_time_update.add(stop_id="A02S")
+        llegada.arrival.time = 1_760_000_060
+        salida = entidad.trip_update.stop_time_update.add(stop_id="A03S")
+        salida.departure.time = 1_760_000_120
+    return feed.SerializeToString()
+
+
+def test_decodificar_feed_filtra_lineas_y_deja_nulos_los_tiempos_ausentes():
+    metricas = {}
+    batch = decodificar_feed(_feed(), ["A"], captura=1_760_000_030, metricas=metricas)
+    df = batch.to_pandas()
+
+    assert metricas == {"timestamp_feed": 1_760_000_000, "filas": 2}
+    assert df["viaje_id"].tolist() == ["000600_A..S", "000600_A..S"]
+    assert df["parada_id"].tolist() == ["A02S", "A03S"]
+    assert df["llegada_epoch"].isna().tolist() == [False, True]
+    assert df["partida_epoch"].isna().tolist() == [True, False]
+    assert (df["captura_epoch"] == 1_760_000_030).all()
+
+
+def test_cada_feed_se_descarga_una_vez_para_todas_sus_lineas(servidor):
+    fuentes = {
+        "ACEG": {"url": f"{servidor}/feed-aceg", "lineas": ["A", "C", "G"]},
+        "NQRW": {"url": f"{servidor}/feed-nqrw", "lineas": ["N", "Q", "R", "W"]},
+    }
+    for concurrente in (True, False):
+        _Servidor.peticiones = []
+        df = extraccion_datos(concurrente=concurrente, sesion=crear_sesion(), fuentes=fuentes)
+
+        assert sorted(_Servidor.peticiones) == ["/feed-aceg", "/feed-nqrw"]
+        assert sorted(df["linea_id"].astype(str).unique()) == ["A", "G"]
+        assert len(df) == 4
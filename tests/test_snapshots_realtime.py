@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+import src.tiempo_real_metro.snapshots_realtime as snapshots_realtime
+from src.analytics.anomalias import DetectorAnomalias
+from src.tiempo_real_metro.deteccion_cambios import FiltroObservaciones
+from src.tiempo_real_metro.snapshots_realtime import EscritorSnapshots, detectar_anomalias
+
+
+def _ciclo(delay):
+    return pd.DataFrame({
+        "viaje_id": ["T1"],
+        "linea_id": ["A"],
+        "parada_id": ["101N"],
+        "hora_llegada": ["08:00:00"],
+        "llegada_epoch": [1_760_000_000],
+        "delay": [delay],
+        "dow": [1],
+    })
+
+
+def test_ciclos_repetidos_actualizan_y_alertan_una_vez():
+    detector = DetectorAnomalias()
+    rng = np.random.default_rng(0)
+    n = 200
+    detector.actualizar(["A"] * n, ["101N"] * n, [32] * n, rng.normal(60, 20, n))
+    observaciones = int(detector.n.sum())
+
+    vistas = FiltroObservaciones()
+    primera = detectar_anomalias(detector, _ciclo(1800), vistas)
+    segunda = detectar_anomalias(detector, _ciclo(1800), vistas)
+
+    assert int(detector.n.sum()) == observaciones + 1
+    assert (primera["tipo"] == "parada").sum() == 1
+    assert segunda.empty
+
+
+def test_filtro_deja_pasar_llegadas_nuevas_del_mismo_viaje():
+    vistas = FiltroObservaciones()
+    assert len(vistas.filtrar(_ciclo(0))) == 1
+    assert len(vistas.filtrar(_ciclo(0))) == 0
+
+    movida = _ciclo(60).assign(llegada_epoch=1_760_000_060)
+    assert len(vistas.filtrar(movida)) == 1
+
+
+def _subidas(monkeypatch, fallar=0):
+    subidas = []
+
+    def subir(access_key, secret_key, objeto, df):
+        if len(subidas) < fallar:
+            subidas.append(None)
+            raise ConnectionError("MinIO caído")
+        subidas.append((objeto, len(df)))
+
+    monkeypatch.setattr(snapshots_realtime, "upload_df_parquet", subir)
+    return subidas
+
+
+def test_escritor_agrupa_ciclos_y_no_mezcla_dias(monkeypatch):
+    subidas = _subidas(monkeypatch)
+    escritor = EscritorSnapshots("ak", "sk", ciclos_por_objeto=2)
+
+    # 2025-12-01 23:59:00 y 23:59:30 en Nueva York, y 00:00:00 del día siguiente
+    medianoche = int(pd.Timestamp("2025-12-02", tz="America/New_York").timestamp())
+    for epoch in (medianoche - 60, medianoche - 30, medianoche):
+        escritor.añadir(_ciclo(0), epoch)
+    escritor.vaciar()
+
+    assert subidas == [
+        ("grupo5/analytics/snapshots_realtime/date=2025-12-01/snapshots_2025-12-01_235900_235930.parquet", 2),
+        ("grupo5/analytics/snapshots_realtime/date=2025-12-02/snapshots_2025-12-02_000000_000000.parquet", 1),
+    ]
+
+
+def test_escritor_reintenta_la_subida_fallida(monkeypatch):
+    subidas = _subidas(monkeypatch, fallar=1)
+    escritor = EscritorSnapshots("ak", "sk", ciclos_por_objeto=1)
+
+    escritor.añadir(_ciclo(0), 1_764_600_000)
+    assert len(escritor.pendientes) == 1
+    escritor.añadir(_ciclo(0), 1_764_600_030)
+
+    assert escritor.pendientes == []
+    assert [subida[1] for subida in subidas[1:]] == [1, 1]
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from src.common.tiempos import epoch_a_hora_local, hora_gtfs_a_segundos, segundos_a_hora
+
+
+def test_hora_gtfs_admite_horas_de_mas_de_24_y_sin_cero_inicial():
+    segundos = hora_gtfs_a_segundos(["00:00:00", "8:05:09", "25:30:00"])
+    assert segundos.tolist() == [0, 8 * 3600 + 5 * 60 + 9, 25 * 3600 + 30 * 60]
+
+
+def test_hora_gtfs_invalida_o_nula_es_nan():
+    segundos = hora_gtfs_a_segundos(["08:00", "08:00:00:00", "ab:cd:ef", "08-00-00", None, "", "12:00:00"])
+    assert np.isnan(segundos[:-1]).all()
+    assert segundos[-1] == 12 * 3600
+
+
+def test_hora_gtfs_categorica_coincide_con_texto():
+    horas = pd.Series(["07:00:00", None, "24:01:00", "07:00:00", "x"])
+    esperado = hora_gtfs_a_segundos(horas)
+
+    resultado = hora_gtfs_a_segundos(horas.astype("category"))
+    np.testing.assert_array_equal(resultado, esperado)
+
+
+def test_segundos_a_hora_va_modulo_24h():
+    horas = segundos_a_hora([0, 3661, 25 * 3600 + 5, np.nan])
+    assert horas.tolist() == ["00:00:00", "01:01:01", "01:00:05", None]
+
+
+def test_epoch_a_hora_local_respeta_el_cambio_de_horario():
+    # 2025-03-09 en Nueva York: 01:59:59 EST y, un segundo después, 03:00:00 EDT
+    antes = pd.Timestamp("2025-03-09 06:59:59", tz="UTC").timestamp()
+    segundos, dia = epoch_a_hora_local([antes, antes + 1, None])
+
+    assert segundos[:2].tolist() == [1 * 3600 + 59 * 60 + 59, 3 * 3600]
+    assert dia[:2].tolist() == [6, 6]
+    assert np.isnan(segundos[2]) and np.isnan(dia[2])
+
+
+def test_epoch_a_hora_local_en_el_regreso_al_horario_de_invierno():
+    # 2025-11-02: la 01:30 local se repite; las dos veces dan la misma hora de pared
+    primera = pd.Timestamp("2025-11-02 05:30:00", tz="UTC").timestamp()
+    segundos, _ = epoch_a_hora_local([primera, primera + 3600])
+
+    assert segundos.tolist() == [1.5 * 3600, 1.5 * 3600]